@@ -0,0 +1,89 @@
+import os
+import threading
+import time
+from typing import Dict, Any, Tuple
+
+from shared.db import get_pool
+from rollups import REFRESH_ON_READ, refresh_rollups
+from query_engine import fetch_dashboard_rows, shape_dashboard
+from sampling import attach_intervals, choose_unique_mode, refresh_visit_sample, sampled_unique_rows
+from sketches import approximate_unique_rows, refresh_sketches, sketch_status
+
+# auto — точно для коротких окон, по выборке для больших (см. sampling.SAMPLE_THRESHOLD_ROWS).
+# exact за длинное окно стоит почти как подсчёт по сырым событиям (см. rollups.WINDOW_CTE),
+# approx и sample читают только скетчи и выборку
+UNIQUE_MODES = ('auto', 'exact', 'approx', 'sample')
+MAX_REPORT_DAYS = int(os.environ.get('ANALYTICS_MAX_DAYS', '730'))
+# Водяной знак для кэша ответов читается из базы не чаще раза в столько секунд
+WATERMARK_REFRESH_SECONDS = float(os.environ.get('ANALYTICS_CACHE_WATERMARK_INTERVAL', '10'))
+
+# DSN -> (MAX(user_actions.id), момент чтения)
+_watermarks: Dict[str, Tuple[int, float]] = {}
+_watermark_lock = threading.Lock()
+
+
+def read_ingest_watermark(database_url: str) -> int:
+    '''Текущий MAX(user_actions.id): по нему кэш понимает, сколько пришло новых событий'''
+    with get_pool(database_url).connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute('/* ingest_watermark */ SELECT COALESCE(MAX(id), 0) FROM user_actions')
+            return cur.fetchone()[0]
+
+
+def ingest_watermark(database_url: str) -> int:
+    '''
+    Business: Водяной знак для кэша без запроса на каждый GET: значение обновляется
+              раз в WATERMARK_REFRESH_SECONDS, остальные запросы берут прежнее
+    Args: database_url - DSN базы
+    Returns: MAX(user_actions.id) не старше WATERMARK_REFRESH_SECONDS
+    '''
+    cached = _watermarks.get(database_url)
+    if cached is not None and time.monotonic() - cached[1] < WATERMARK_REFRESH_SECONDS:
+        return cached[0]
+    # Обновляет один запрос; пока он читает, остальные не ждут, а берут прежнее значение
+    if not _watermark_lock.acquire(blocking=cached is None):
+        return cached[0]
+    try:
+        cached = _watermarks.get(database_url)
+        if cached is None or time.monotonic() - cached[1] >= WATERMARK_REFRESH_SECONDS:
+            cached = (read_ingest_watermark(database_url), time.monotonic())
+            _watermarks[database_url] = cached
+        return cached[0]
+    finally:
+        _watermark_lock.release()
+
+
+def load_dashboard(database_url: str, days: int, unique_mode: str = 'auto',
+                   include_devices: bool = False) -> Dict[str, Any]:
+    '''Полный пересчёт дашборда на отдельном соединении из пула (годится и для фонового потока)'''
+    with get_pool(database_url).connection() as conn:
+        # Досводим свежие события в почасовые агрегаты, скетчи и выборку
+        if REFRESH_ON_READ:
+            refresh_rollups(conn)
+        if unique_mode == 'auto':
+            with conn.cursor() as cur:
+                unique_mode = choose_unique_mode(cur, days)
+            conn.rollback()
+        if REFRESH_ON_READ:
+            if unique_mode == 'approx':
+                refresh_sketches(conn)
+            elif unique_mode == 'sample':
+                refresh_visit_sample(conn)
+
+        intervals = {}
+        sketches = None
+        with conn.cursor() as cur:
+            rows = fetch_dashboard_rows(cur, days, unique_mode)
+            if unique_mode == 'approx':
+                rows.extend(approximate_unique_rows(cur, days))
+                sketches = sketch_status(cur)
+            elif unique_mode == 'sample':
+                sampled_rows, intervals = sampled_unique_rows(cur, days)
+                rows.extend(sampled_rows)
+        result = shape_dashboard(rows, days, include_devices)
+    if unique_mode == 'approx':
+        result['unique_counts'] = 'approximate'
+        result['sketches'] = sketches
+    elif unique_mode == 'sample':
+        attach_intervals(result, intervals)
+    return result
@@ -0,0 +1,172 @@
+import hashlib
+import json
+import math
+import os
+import threading
+import time
+from typing import Dict, Any, Iterable, Optional, Tuple
+
+from ua_parser import parse_user_agent
+
+# ANALYTICS_FILTER_ENABLED=0 пропускает все события как раньше
+FILTER_ENABLED = os.environ.get('ANALYTICS_FILTER_ENABLED', '1') != '0'
+DROP_BOTS = os.environ.get('ANALYTICS_DROP_BOTS', '1') != '0'
+# Грубая метка времени ключа дубля: повтор в пределах корзины считается тем же событием
+DEDUP_WINDOW_SECONDS = float(os.environ.get('ANALYTICS_DEDUP_WINDOW', '30'))
+# Ожидаемое число разных событий за окно и допустимая доля ложных дублей
+DEDUP_CAPACITY = int(os.environ.get('ANALYTICS_DEDUP_CAPACITY', '100000'))
+DEDUP_ERROR_RATE = float(os.environ.get('ANALYTICS_DEDUP_ERROR_RATE', '0.001'))
+
+DROP_BOT = 'bot'
+DROP_DUPLICATE = 'duplicate'
+
+
+class RotatingBloomFilter:
+    '''
+    Фильтр Блума из двух поколений: ключ ищется в обоих, добавляется в текущее.
+    Раз в rotate_seconds (или при заполнении до capacity) предыдущее поколение
+    выбрасывается, так что память постоянна, а ключ помнится от одного до двух окон.
+    '''
+
+    def __init__(self, capacity: int = DEDUP_CAPACITY, error_rate: float = DEDUP_ERROR_RATE,
+                 rotate_seconds: float = DEDUP_WINDOW_SECONDS):
+        self.capacity = capacity
+        self.rotate_seconds = rotate_seconds
+        self.bits = max(64, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, round(self.bits / capacity * math.log(2)))
+        self._current = bytearray((self.bits + 7) // 8)
+        self._previous = bytearray(len(self._current))
+        self._current_count = 0
+        self._rotated_at = time.monotonic()
+        self._lock = threading.Lock()
+        self.rotations = 0
+
+    def _positions(self, key: bytes):
+        digest = hashlib.blake2b(key, digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * second) % self.bits for i in range(self.hashes)]
+
+    @staticmethod
+    def _contains(bits: bytearray, positions) -> bool:
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in positions)
+
+    def _maybe_rotate(self, now: float) -> None:
+        if now - self._rotated_at >= self.rotate_seconds or self._current_count >= self.capacity:
+            self._previous = self._current
+            self._current = bytearray(len(self._previous))
+            self._current_count = 0
+            self._rotated_at = now
+            self.rotations += 1
+
+    def contains(self, key: bytes) -> bool:
+        '''True, если ключ (вероятно) уже добавлялся; фильтр не меняется'''
+        positions = self._positions(key)
+        with self._lock:
+            self._maybe_rotate(time.monotonic())
+            return self._contains(self._current, positions) or self._contains(self._previous, positions)
+
+    def add(self, key: bytes) -> None:
+        positions = self._positions(key)
+        with self._lock:
+            self._maybe_rotate(time.monotonic())
+            if self._contains(self._current, positions):
+                return
+            for position in positions:
+                self._current[position >> 3] |= 1 << (position & 7)
+            self._current_count += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'bits': self.bits,
+                'hashes': self.hashes,
+                'current_keys': self._current_count,
+                'rotations': self.rotations
+            }
+
+
+class EventFilter:
+    '''
+    Фильтр на входе POST: отбрасывает события ботов и повторы одного события
+    (ретраи, двойной mount) до записи в user_actions. Проверка ничего не меняет:
+    ключ запоминается через remember() только после того, как событие сохранено
+    или принято буфером, иначе повтор после 503 потерялся бы как дубль.
+    Фильтр живёт в экземпляре функции, поэтому повторы в разных экземплярах не ловит.
+    '''
+
+    def __init__(self, enabled: bool = FILTER_ENABLED, drop_bots: bool = DROP_BOTS,
+                 window_seconds: float = DEDUP_WINDOW_SECONDS,
+                 bloom: Optional[RotatingBloomFilter] = None):
+        self.enabled = enabled
+        self.drop_bots = drop_bots
+        self.window_seconds = window_seconds
+        self.bloom = bloom or RotatingBloomFilter(rotate_seconds=window_seconds)
+        self._lock = threading.Lock()
+        self._stats = {'checked': 0, 'dropped_bot': 0, 'dropped_duplicate': 0}
+
+    def _count(self, key: str) -> None:
+        with self._lock:
+            self._stats[key] += 1
+
+    def is_bot(self, user_agent: str) -> bool:
+        return self.enabled and self.drop_bots and parse_user_agent(user_agent).is_bot
+
+    def dedup_key(self, event_data: Dict[str, Any], now: Optional[float] = None) -> bytes:
+        '''
+        Ключ повтора. event_id от клиента однозначно отличает события, и повтор с ним
+        узнаётся в любой момент, пока ключ помнится. Без event_id ключ включает
+        action_details, иначе разные клики и отметки прокрутки одной страницы сливались бы
+        '''
+        session_id = str(event_data.get('session_id', ''))
+        event_id = event_data.get('event_id')
+        if event_id:
+            return '\x1f'.join(('id', session_id, str(event_id))).encode('utf-8')
+
+        details = json.dumps(event_data.get('action_details') or {}, sort_keys=True,
+                             separators=(',', ':'), ensure_ascii=False, default=str)
+        bucket = int((time.time() if now is None else now) // self.window_seconds)
+        return '\x1f'.join((
+            session_id, str(event_data.get('action_type', '')), str(event_data.get('page_url') or ''),
+            hashlib.blake2b(details.encode('utf-8'), digest_size=8).hexdigest(), str(bucket)
+        )).encode('utf-8')
+
+    def check(self, event_data: Dict[str, Any], user_agent: str,
+              now: Optional[float] = None) -> Tuple[Optional[str], Optional[bytes]]:
+        '''
+        Business: Решает, записывать ли событие; сам фильтр не меняет
+        Args: event_data - уже проверенное событие (session_id, action_type, page_url)
+              user_agent - заголовок User-Agent запроса
+        Returns: (DROP_BOT, DROP_DUPLICATE или None, ключ для remember() после сохранения)
+        '''
+        if not self.enabled:
+            return None, None
+        self._count('checked')
+        if self.is_bot(user_agent):
+            self._count('dropped_bot')
+            return DROP_BOT, None
+
+        key = self.dedup_key(event_data, now)
+        if self.bloom.contains(key):
+            self._count('dropped_duplicate')
+            return DROP_DUPLICATE, key
+        return None, key
+
+    def count_duplicate(self) -> None:
+        self._count('dropped_duplicate')
+
+    def remember(self, keys: Iterable[Optional[bytes]]) -> None:
+        '''Запоминает ключи сохранённых событий: их повторы дальше отбрасываются'''
+        for key in keys:
+            if key is not None:
+                self.bloom.add(key)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats: Dict[str, Any] = dict(self._stats)
+        stats.update(self.bloom.stats())
+        stats['enabled'] = self.enabled
+        return stats
+
+
+event_filter = EventFilter()
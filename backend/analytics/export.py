@@ -0,0 +1,158 @@
+import csv
+import gzip
+import io
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+
+from shared.runtime import dumps
+
+# Сколько строк серверный курсор отдаёт за один проход по сети
+EXPORT_FETCH_SIZE = int(os.environ.get('ANALYTICS_EXPORT_FETCH_SIZE', '2000'))
+# Строк в одном ответе; дальше клиент продолжает с after_id из X-Export-Next-After
+EXPORT_MAX_ROWS = int(os.environ.get('ANALYTICS_EXPORT_MAX_ROWS', '50000'))
+EXPORT_MAX_DAYS = int(os.environ.get('ANALYTICS_EXPORT_MAX_DAYS', '366'))
+
+EXPORT_FORMATS = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv; charset=utf-8'}
+
+EXPORT_COLUMNS = (
+    'id', 'timestamp', 'session_id', 'action_type', 'action_details', 'page_url', 'referrer',
+    'browser', 'browser_major', 'os', 'device_class', 'is_bot', 'ip_address', 'user_agent'
+)
+
+
+def _parse_time(value: str, name: str) -> datetime:
+    try:
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        raise ValueError(f'{name} must be an ISO 8601 date or timestamp')
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def parse_export_params(params: Dict[str, Any]) -> Dict[str, Any]:
+    '''
+    Business: Разбирает параметры выгрузки из строки запроса
+    Args: params - queryStringParameters: from, to или days, action_type (через запятую),
+          format (ndjson|csv), after_id, limit
+    Returns: dict с проверенными фильтрами; ValueError при неверных параметрах
+    '''
+    now = datetime.now(timezone.utc)
+    until = _parse_time(params['to'], 'to') if params.get('to') else now
+    if params.get('from'):
+        since = _parse_time(params['from'], 'from')
+    else:
+        since = until - timedelta(days=int(params.get('days', 1)))
+    if since >= until:
+        raise ValueError('from must be earlier than to')
+    if until - since > timedelta(days=EXPORT_MAX_DAYS):
+        raise ValueError(f'Export range is limited to {EXPORT_MAX_DAYS} days')
+
+    export_format = params.get('format', 'ndjson')
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f'format must be one of {", ".join(EXPORT_FORMATS)}')
+
+    action_types = [value.strip() for value in (params.get('action_type') or '').split(',') if value.strip()]
+    limit = min(int(params.get('limit', EXPORT_MAX_ROWS)), EXPORT_MAX_ROWS)
+    if limit <= 0:
+        raise ValueError('limit must be positive')
+
+    return {
+        'since': since,
+        'until': until,
+        'action_types': action_types,
+        'format': export_format,
+        'after_id': int(params.get('after_id', 0)),
+        'limit': limit
+    }
+
+
+def build_export_query(filters: Dict[str, Any]) -> Tuple[str, List[Any]]:
+    '''
+    Продолжение по ключу: id > after_id ORDER BY id. Диапазон времени отсекает
+    лишние секции, внутри секций порядок даёт первичный ключ (id, timestamp).
+    '''
+    conditions = ['timestamp >= %s', 'timestamp < %s', 'id > %s']
+    args: List[Any] = [filters['since'], filters['until'], filters['after_id']]
+    if filters['action_types']:
+        conditions.append('action_type = ANY(%s)')
+        args.append(filters['action_types'])
+    # Одна лишняя строка показывает, есть ли продолжение
+    args.append(filters['limit'] + 1)
+    query = f'''
+        /* analytics_export */
+        SELECT {', '.join(EXPORT_COLUMNS)}
+        FROM user_actions
+        WHERE {' AND '.join(conditions)}
+        ORDER BY id
+        LIMIT %s
+    '''
+    return query, args
+
+
+def _export_record(row: Tuple[Any, ...]) -> Dict[str, Any]:
+    record = dict(zip(EXPORT_COLUMNS, row))
+    if isinstance(record['timestamp'], datetime):
+        record['timestamp'] = record['timestamp'].isoformat()
+    if record['ip_address'] is not None:
+        record['ip_address'] = str(record['ip_address'])
+    return record
+
+
+def iter_export_rows(conn: Any, filters: Dict[str, Any],
+                     fetch_size: int = EXPORT_FETCH_SIZE) -> Iterator[Tuple[Any, ...]]:
+    '''
+    Строки через именованный (серверный) курсор: в памяти одновременно
+    не больше fetch_size строк, сколько бы их ни было в диапазоне.
+    '''
+    query, args = build_export_query(filters)
+    cur = conn.cursor(name='analytics_export')
+    cur.itersize = fetch_size
+    try:
+        cur.execute(query, args)
+        for row in cur:
+            yield row
+    finally:
+        cur.close()
+        # Только чтение: транзакцию курсора просто откатываем
+        conn.rollback()
+
+
+def write_export(rows: Iterator[Tuple[Any, ...]], filters: Dict[str, Any],
+                 compress: bool = False) -> Tuple[bytes, int, Optional[int]]:
+    '''
+    Business: Пишет строки выгрузки в NDJSON или CSV, при compress — сразу в gzip
+    Args: rows - строки в порядке EXPORT_COLUMNS, отсортированные по id
+          filters - результат parse_export_params
+    Returns: (тело ответа, число строк, after_id для продолжения или None, если строк больше нет)
+    '''
+    raw = io.BytesIO()
+    sink = gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=6) if compress else raw
+    text = io.TextIOWrapper(sink, encoding='utf-8', newline='', write_through=True)
+    csv_writer = None
+    if filters['format'] == 'csv':
+        csv_writer = csv.writer(text)
+        csv_writer.writerow(EXPORT_COLUMNS)
+
+    count = 0
+    last_id: Optional[int] = None
+    has_more = False
+    for row in rows:
+        if count == filters['limit']:
+            has_more = True
+            break
+        record = _export_record(row)
+        if csv_writer is not None:
+            if record['action_details'] is not None:
+                record['action_details'] = dumps(record['action_details'])
+            csv_writer.writerow([record[column] for column in EXPORT_COLUMNS])
+        else:
+            text.write(dumps(record))
+            text.write('\n')
+        count += 1
+        last_id = record['id']
+
+    text.flush()
+    text.detach()
+    if compress:
+        sink.close()
+    return raw.getvalue(), count, last_id if has_more else None
@@ -0,0 +1,73 @@
+import hashlib
+import math
+from typing import Iterable, Optional
+
+# Точность и формат зашиты в V0017, который собирает те же скетчи в SQL
+DEFAULT_PRECISION = 12
+FORMAT_VERSION = 2
+
+# 2^-r для всех возможных значений регистра: оценка считается одним проходом map()
+_INVERSE_POWERS = [2.0 ** -r for r in range(65)]
+
+
+def _hash64(value: str) -> int:
+    # Первые 64 бита md5: в PostgreSQL это ('x' || substr(md5(value), 1, 16))::bit(64)
+    return int.from_bytes(hashlib.md5(value.encode('utf-8')).digest()[:8], 'big')
+
+
+class HyperLogLog:
+    '''
+    Скетч HyperLogLog для оценки числа уникальных значений.
+    Скетчи объединяются без двойного счёта, поэтому почасовые скетчи
+    можно складывать в любые окна. Сериализуется в bytea: версия, точность
+    и регистры без сжатия (большие значения bytea сжимает TOAST).
+    '''
+
+    __slots__ = ('precision', 'registers')
+
+    def __init__(self, precision: int = DEFAULT_PRECISION, registers: Optional[bytearray] = None):
+        if not 4 <= precision <= 16:
+            raise ValueError('precision must be between 4 and 16')
+        self.precision = precision
+        self.registers = registers if registers is not None else bytearray(1 << precision)
+
+    def add(self, value: str) -> None:
+        hashed = _hash64(value)
+        index = hashed >> (64 - self.precision)
+        remainder = (hashed << self.precision) & 0xFFFFFFFFFFFFFFFF
+        rank = 64 - self.precision + 1 if remainder == 0 else 65 - remainder.bit_length()
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def update(self, values: Iterable[str]) -> None:
+        for value in values:
+            self.add(value)
+
+    def merge(self, other: 'HyperLogLog') -> None:
+        if other.precision != self.precision:
+            raise ValueError('Cannot merge sketches with different precision')
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def count(self) -> int:
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(map(_INVERSE_POWERS.__getitem__, self.registers))
+        if estimate <= 2.5 * m:
+            zeros = self.registers.count(0)
+            if zeros:
+                estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+    def to_bytes(self) -> bytes:
+        return bytes((FORMAT_VERSION, self.precision)) + bytes(self.registers)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'HyperLogLog':
+        data = bytes(data)
+        if len(data) < 2 or data[0] != FORMAT_VERSION:
+            raise ValueError('Unsupported sketch format')
+        precision = data[1]
+        registers = bytearray(data[2:])
+        if len(registers) != 1 << precision:
+            raise ValueError('Corrupted sketch')
+        return cls(precision, registers)
@@ -1,9 +1,221 @@
-import json
+import base64
 import os
-import psycopg2
-from datetime import datetime
+import sys
+from contextlib import closing
 from typing import Dict, Any
 
+# Общие модули: в репозитории — backend/shared, в развёрнутой функции — их копия
+# в shared/ рядом с index.py (python -m shared.vendor)
+SHARED_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if SHARED_ROOT not in sys.path:
+    sys.path.insert(0, SHARED_ROOT)
+
+from shared import metrics
+from shared.runtime import HttpError, Router, dumps, json_response, lazy_import, parse_json_body, require_database_url
+
+from response_cache import dashboard_cache, dashboard_cache_key
+
+# Приём событий и дашборд тянут разные модули; каждый путь загружает только свои
+db = lazy_import('shared.db')
+ingest = lazy_import('ingest')
+write_buffer = lazy_import('write_buffer')
+rollups = lazy_import('rollups')
+sketches = lazy_import('sketches')
+sampling = lazy_import('sampling')
+dashboard = lazy_import('dashboard')
+partitions = lazy_import('partitions')
+ua_parser = lazy_import('ua_parser')
+export = lazy_import('export')
+
+
+router = Router('GET, POST, OPTIONS', name='analytics')
+
+metrics.register_collector('dashboard_cache', dashboard_cache.stats)
+metrics.register_collector('ingest_filter', lambda: ingest.event_filter.stats())
+
+
+@router.route('POST')
+def save_actions(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    # Сохранение действия пользователя
+    database_url = require_database_url()
+    body_data = parse_json_body(event)
+    headers = event.get('headers') or {}
+
+    # Пакетный режим: массив событий или {"events": [...]}
+    events = body_data if isinstance(body_data, list) else body_data.get('events')
+    if events is not None:
+        if not isinstance(events, list) or not events:
+            raise HttpError(400, 'events must be a non-empty array')
+        if len(events) > ingest.MAX_BATCH_SIZE:
+            raise HttpError(413, f'Batch too large, max {ingest.MAX_BATCH_SIZE} events')
+
+    # Одиночное событие проверяется так же, как в буфере и в пачке
+    if events is None:
+        error = ingest.validate_event(body_data)
+        if error:
+            raise HttpError(400, error)
+
+    # Write-behind режим: события копятся в буфере и пишутся групповым коммитом
+    buffer = write_buffer.get_write_buffer(database_url)
+    if buffer is not None:
+        queued_events = events if events is not None else [body_data]
+        results, rows, _, dedup_keys = ingest.prepare_batch(queued_events, headers)
+        try:
+            buffer.submit(rows, dedup_keys)
+        except write_buffer.BufferFull as e:
+            raise HttpError(503, str(e), {'Retry-After': '1'})
+
+        queued_result = ingest.batch_summary(queued_events, rows, results)
+        queued_result['queued'] = True
+        return json_response(202 if queued_result['success'] else 400, queued_result)
+
+    # Боты и повторы того же события отсеиваются до подключения к базе
+    dedup_key = None
+    if events is None:
+        drop_reason, dedup_key = ingest.event_filter.check(body_data, headers.get('user-agent', ''))
+        if drop_reason:
+            return json_response(200, {'success': True, 'dropped': drop_reason})
+
+    # Подключаемся к базе данных
+    conn = db.get_connection(database_url)
+    cur = conn.cursor()
+    try:
+        if events is not None:
+            batch_result = ingest.ingest_batch(conn, events, headers)
+            return json_response(200 if batch_result['success'] else 400, batch_result)
+
+        user_agent = headers.get('user-agent', '')
+        ip_address = ingest.extract_client_ip(headers)
+
+        # Сохраняем в базу
+        insert_query = f'''
+            INSERT INTO user_actions
+            ({', '.join(ingest.INSERT_COLUMNS)})
+            VALUES ({', '.join(['%s'] * len(ingest.INSERT_COLUMNS))})
+            RETURNING id
+        '''
+
+        cur.execute(insert_query, ingest.build_row(body_data, user_agent, ip_address))
+
+        action_id = cur.fetchone()[0]
+        conn.commit()
+        ingest.event_filter.remember([dedup_key])
+    finally:
+        cur.close()
+        db.release_connection(conn, database_url)
+
+    return json_response(200, {'success': True, 'action_id': action_id})
+
+
+@router.route('GET', 'buffer_stats', admin=True)
+def buffer_stats(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    # Состояние write-behind буфера этого экземпляра
+    buffer = write_buffer.get_write_buffer(require_database_url())
+    return json_response(200, buffer.stats() if buffer else {'enabled': False})
+
+
+@router.route('GET', 'refresh_rollups', admin=True)
+def refresh(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    # Сведение агрегатов: по расписанию (shared.schedule) или вручную
+    database_url = require_database_url()
+    conn = db.get_connection(database_url)
+    try:
+        return json_response(200, {
+            'rollups': rollups.refresh_rollups(conn),
+            'sketches': sketches.refresh_sketches(conn),
+            'visit_sample': sampling.refresh_visit_sample(conn)
+        })
+    finally:
+        db.release_connection(conn, database_url)
+
+
+@router.route('GET', 'maintain_partitions', admin=True)
+def maintain_partitions(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    # Секции наперёд и срок хранения: только по расписанию (shared.schedule) или вручную
+    database_url = require_database_url()
+    conn = db.get_connection(database_url)
+    try:
+        return json_response(200, partitions.maintain_partitions(conn))
+    finally:
+        db.release_connection(conn, database_url)
+
+
+@router.route('GET', 'cache_stats', admin=True)
+def cache_stats(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    # Состояние кэша ответов этого экземпляра
+    return json_response(200, {
+        'dashboard': dashboard_cache.stats(),
+        'user_agents': ua_parser.cache_info()
+    })
+
+
+@router.route('GET', 'export', admin=True)
+def export_actions(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    # Выгрузка сырых событий порциями по id: ?from=&to=&action_type=&format=ndjson|csv&after_id=
+    database_url = require_database_url()
+    params = event.get('queryStringParameters') or {}
+    try:
+        filters = export.parse_export_params(params)
+    except ValueError as e:
+        raise HttpError(400, str(e))
+
+    accept_encoding = (event.get('headers') or {}).get('accept-encoding', '')
+    compress = params.get('gzip') == '1' or 'gzip' in accept_encoding.lower()
+
+    conn = db.get_connection(database_url)
+    try:
+        with closing(export.iter_export_rows(conn, filters)) as rows:
+            body, count, next_after = export.write_export(rows, filters, compress)
+    finally:
+        db.release_connection(conn, database_url)
+
+    headers = {
+        'Content-Type': export.EXPORT_FORMATS[filters['format']],
+        'Content-Disposition': f'attachment; filename="user_actions.{filters["format"]}"',
+        'Access-Control-Allow-Origin': '*',
+        'Access-Control-Expose-Headers': 'X-Export-Rows, X-Export-Next-After',
+        'X-Export-Rows': str(count)
+    }
+    if next_after is not None:
+        headers['X-Export-Next-After'] = str(next_after)
+    if compress:
+        headers['Content-Encoding'] = 'gzip'
+        return {'statusCode': 200, 'headers': headers, 'isBase64Encoded': True,
+                'body': base64.b64encode(body).decode('ascii')}
+    return {'statusCode': 200, 'headers': headers, 'body': body.decode('utf-8')}
+
+
+@router.route('GET', admin=True)
+def analytics(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    # Получение аналитики
+    database_url = require_database_url()
+    params = event.get('queryStringParameters') or {}
+    try:
+        days = int(params.get('days', 7))
+    except ValueError:
+        raise HttpError(400, 'days must be an integer')
+    if not 1 <= days <= dashboard.MAX_REPORT_DAYS:
+        raise HttpError(400, f'days must be between 1 and {dashboard.MAX_REPORT_DAYS}')
+
+    # Уникальные сессии/посетители: точно (COUNT DISTINCT), по HLL-скетчам,
+    # по постоянной выборке с интервалами или auto — выборка для больших окон
+    unique_mode = params.get('unique', 'auto')
+    if unique_mode not in dashboard.UNIQUE_MODES:
+        raise HttpError(400, f'unique must be one of {", ".join(dashboard.UNIQUE_MODES)}')
+
+    # Разрезы по ОС и типу устройства по запросу: ?devices=1
+    include_devices = params.get('devices') == '1'
+
+    # Ответ из кэша; при промахе все параллельные перезагрузки ждут один пересчёт
+    body, cache_status = dashboard_cache.get_or_compute(
+        dashboard_cache_key(params, days),
+        dashboard.ingest_watermark(database_url),
+        lambda: dumps(dashboard.load_dashboard(database_url, days, unique_mode, include_devices))
+    )
+
+    return json_response(200, body, {'X-Cache': cache_status})
+
+
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
     Business: Сохранение статистики действий пользователей и получение аналитики
@@ -11,240 +223,4 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
           context - объект с атрибутами request_id, function_name и др.
     Returns: HTTP response dict
     '''
-    method: str = event.get('httpMethod', 'GET')
-    
-    # Handle CORS OPTIONS request
-    if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, Authorization',
-                'Access-Control-Max-Age': '86400'
-            },
-            'body': ''
-        }
-    
-    # Получаем строку подключения к БД
-    database_url = os.environ.get('DATABASE_URL')
-    if not database_url:
-        return {
-            'statusCode': 500,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Database connection not configured'})
-        }
-    
-    try:
-        # Подключаемся к базе данных
-        conn = psycopg2.connect(database_url)
-        cur = conn.cursor()
-        
-        if method == 'POST':
-            # Сохранение действия пользователя
-            body_data = json.loads(event.get('body', '{}'))
-            headers = event.get('headers', {})
-            
-            # Извлекаем данные
-            session_id = body_data.get('session_id', '')
-            action_type = body_data.get('action_type', '')
-            action_details = body_data.get('action_details', {})
-            page_url = body_data.get('page_url', '')
-            referrer = body_data.get('referrer', '')
-            user_agent = headers.get('user-agent', '')
-            
-            # Получаем IP адрес
-            ip_address = headers.get('x-forwarded-for', '').split(',')[0].strip()
-            if not ip_address:
-                ip_address = headers.get('x-real-ip', '0.0.0.0')
-            if not ip_address or ip_address == '':
-                ip_address = '0.0.0.0'
-            
-            # Сохраняем в базу
-            insert_query = '''
-                INSERT INTO user_actions 
-                (session_id, user_agent, ip_address, action_type, action_details, page_url, referrer)
-                VALUES (%s, %s, %s, %s, %s, %s, %s)
-                RETURNING id
-            '''
-            
-            cur.execute(insert_query, (
-                session_id, user_agent, ip_address, action_type, 
-                json.dumps(action_details), page_url, referrer
-            ))
-            
-            action_id = cur.fetchone()[0]
-            conn.commit()
-            
-            return {
-                'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'success': True, 'action_id': action_id})
-            }
-        
-        elif method == 'GET':
-            # Получение аналитики
-            params = event.get('queryStringParameters') or {}
-            days = int(params.get('days', 7))
-            
-            # Формируем интервал для SQL
-            interval = f"{days} days"
-            
-            # Общая статистика
-            summary_query = f"""
-                SELECT 
-                    COUNT(*) as total_actions,
-                    COUNT(DISTINCT session_id) as unique_sessions,
-                    COUNT(DISTINCT ip_address) as unique_visitors
-                FROM user_actions 
-                WHERE timestamp >= NOW() - INTERVAL '{interval}'
-            """
-            
-            cur.execute(summary_query)
-            summary_row = cur.fetchone()
-            
-            # Статистика по типам действий
-            action_types_query = f"""
-                SELECT 
-                    action_type,
-                    COUNT(*) as action_count
-                FROM user_actions 
-                WHERE timestamp >= NOW() - INTERVAL '{interval}'
-                GROUP BY action_type
-                ORDER BY action_count DESC
-            """
-            
-            cur.execute(action_types_query)
-            action_stats = cur.fetchall()
-            
-            # Статистика по дням
-            daily_query = f"""
-                SELECT 
-                    DATE(timestamp) as date,
-                    COUNT(*) as actions,
-                    COUNT(DISTINCT session_id) as sessions,
-                    COUNT(DISTINCT ip_address) as visitors
-                FROM user_actions 
-                WHERE timestamp >= NOW() - INTERVAL '{interval}'
-                GROUP BY DATE(timestamp)
-                ORDER BY date DESC
-            """
-            
-            cur.execute(daily_query)
-            daily_stats = cur.fetchall()
-            
-            # Популярные страницы
-            pages_query = f"""
-                SELECT 
-                    page_url,
-                    COUNT(*) as visits,
-                    COUNT(DISTINCT session_id) as unique_visits
-                FROM user_actions 
-                WHERE timestamp >= NOW() - INTERVAL '{interval}'
-                AND page_url IS NOT NULL AND page_url != ''
-                GROUP BY page_url
-                ORDER BY visits DESC
-                LIMIT 10
-            """
-            
-            cur.execute(pages_query)
-            popular_pages = cur.fetchall()
-            
-            # Статистика по часам
-            hourly_query = f"""
-                SELECT 
-                    EXTRACT(HOUR FROM timestamp) as hour,
-                    COUNT(*) as actions
-                FROM user_actions 
-                WHERE timestamp >= NOW() - INTERVAL '{interval}'
-                GROUP BY EXTRACT(HOUR FROM timestamp)
-                ORDER BY hour
-            """
-            
-            cur.execute(hourly_query)
-            hourly_stats = cur.fetchall()
-            
-            # Браузеры и устройства
-            browsers_query = f"""
-                SELECT 
-                    CASE 
-                        WHEN user_agent LIKE '%Chrome%' THEN 'Chrome'
-                        WHEN user_agent LIKE '%Firefox%' THEN 'Firefox'
-                        WHEN user_agent LIKE '%Safari%' AND user_agent NOT LIKE '%Chrome%' THEN 'Safari'
-                        WHEN user_agent LIKE '%Edge%' THEN 'Edge'
-                        ELSE 'Other'
-                    END as browser,
-                    COUNT(*) as count
-                FROM user_actions 
-                WHERE timestamp >= NOW() - INTERVAL '{interval}'
-                AND user_agent IS NOT NULL
-                GROUP BY browser
-                ORDER BY count DESC
-            """
-            
-            cur.execute(browsers_query)
-            browser_stats = cur.fetchall()
-            
-            # Формируем ответ
-            result = {
-                'period_days': days,
-                'action_types': [
-                    {'action_type': row[0], 'count': row[1]} 
-                    for row in action_stats
-                ],
-                'daily_stats': [
-                    {
-                        'date': row[0].isoformat() if hasattr(row[0], 'isoformat') else str(row[0]),
-                        'actions': row[1],
-                        'sessions': row[2],
-                        'visitors': row[3]
-                    }
-                    for row in daily_stats
-                ],
-                'popular_pages': [
-                    {
-                        'url': row[0],
-                        'visits': row[1],
-                        'unique_visits': row[2]
-                    }
-                    for row in popular_pages
-                ],
-                'hourly_stats': [
-                    {'hour': int(row[0]), 'actions': row[1]}
-                    for row in hourly_stats
-                ],
-                'browser_stats': [
-                    {'browser': row[0], 'count': row[1]}
-                    for row in browser_stats
-                ],
-                'summary': {
-                    'total_actions': summary_row[0] if summary_row else 0,
-                    'unique_sessions': summary_row[1] if summary_row else 0,
-                    'unique_visitors': summary_row[2] if summary_row else 0
-                }
-            }
-            
-            return {
-                'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps(result)
-            }
-            
-    except Exception as e:
-        return {
-            'statusCode': 500,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': str(e)})
-        }
-    
-    finally:
-        if 'cur' in locals():
-            cur.close()
-        if 'conn' in locals():
-            conn.close()
-    
-    return {
-        'statusCode': 405,
-        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-        'body': json.dumps({'error': 'Method not allowed'})
-    }
\ No newline at end of file
+    return router.dispatch(event, context)
@@ -0,0 +1,164 @@
+import json
+import os
+from typing import Dict, Any, List, Optional, Tuple
+
+from psycopg2.extras import execute_values
+
+from event_filter import DROP_DUPLICATE, event_filter
+from ua_parser import parse_user_agent
+
+# Ограничение размера пачки, чтобы один запрос не держал транзакцию слишком долго
+MAX_BATCH_SIZE = int(os.environ.get('ANALYTICS_MAX_BATCH_SIZE', '500'))
+
+INSERT_COLUMNS = (
+    'session_id', 'user_agent', 'ip_address', 'action_type',
+    'action_details', 'page_url', 'referrer',
+    'browser', 'browser_major', 'os', 'device_class', 'is_bot'
+)
+
+
+def extract_client_ip(headers: Dict[str, Any]) -> str:
+    '''Достаёт IP клиента из заголовков прокси, по умолчанию 0.0.0.0'''
+    ip_address = headers.get('x-forwarded-for', '').split(',')[0].strip()
+    if not ip_address:
+        ip_address = headers.get('x-real-ip', '0.0.0.0')
+    if not ip_address:
+        ip_address = '0.0.0.0'
+    return ip_address
+
+
+def build_row(event_data: Dict[str, Any], user_agent: str, ip_address: str) -> Tuple:
+    '''Собирает кортеж значений для INSERT в порядке INSERT_COLUMNS'''
+    parsed_ua = parse_user_agent(user_agent)
+    return (
+        event_data.get('session_id', ''),
+        user_agent,
+        ip_address,
+        event_data.get('action_type', ''),
+        json.dumps(event_data.get('action_details', {})),
+        event_data.get('page_url', ''),
+        event_data.get('referrer', ''),
+        parsed_ua.browser,
+        parsed_ua.browser_major,
+        parsed_ua.os,
+        parsed_ua.device_class,
+        parsed_ua.is_bot
+    )
+
+
+def validate_event(event_data: Any) -> Optional[str]:
+    '''Проверяет одно событие из пачки. Returns: текст ошибки или None'''
+    if not isinstance(event_data, dict):
+        return 'Event must be an object'
+
+    session_id = event_data.get('session_id')
+    if not isinstance(session_id, str) or not session_id:
+        return 'session_id is required'
+    if len(session_id) > 255:
+        return 'session_id is too long'
+
+    action_type = event_data.get('action_type')
+    if not isinstance(action_type, str) or not action_type:
+        return 'action_type is required'
+    if len(action_type) > 100:
+        return 'action_type is too long'
+
+    action_details = event_data.get('action_details', {})
+    if action_details is not None and not isinstance(action_details, dict):
+        return 'action_details must be an object'
+
+    event_id = event_data.get('event_id')
+    if event_id is not None and (not isinstance(event_id, str) or len(event_id) > 100):
+        return 'event_id must be a string of at most 100 characters'
+
+    for field in ('page_url', 'referrer'):
+        value = event_data.get(field, '')
+        if value is not None and not isinstance(value, str):
+            return f'{field} must be a string'
+
+    return None
+
+
+def insert_rows(cur: Any, rows: List[Tuple], returning: bool = True) -> List[int]:
+    '''Вставляет все строки одним multi-row INSERT. Returns: id в порядке строк'''
+    if not rows:
+        return []
+
+    insert_query = f'''
+        INSERT INTO user_actions ({', '.join(INSERT_COLUMNS)})
+        VALUES %s
+        {'RETURNING id' if returning else ''}
+    '''
+    returned = execute_values(cur, insert_query, rows, page_size=len(rows), fetch=returning)
+    return [row[0] for row in returned] if returning else []
+
+
+def prepare_batch(events: List[Any], headers: Dict[str, Any]
+                  ) -> Tuple[List[Dict[str, Any]], List[Tuple], List[int], List[Optional[bytes]]]:
+    '''
+    Валидирует пачку и отсеивает ботов и дубли. Отсеянные события отмечаются
+    успешными с полем dropped, чтобы клиент не повторял их отправку.
+    Returns: результаты по событиям, строки для вставки, их позиции и ключи
+             дублей, которые нужно передать в event_filter.remember() после сохранения
+    '''
+    user_agent = headers.get('user-agent', '')
+    ip_address = extract_client_ip(headers)
+
+    results: List[Dict[str, Any]] = []
+    rows: List[Tuple] = []
+    row_positions: List[int] = []
+    dedup_keys: List[Optional[bytes]] = []
+    batch_keys = set()
+
+    for index, event_data in enumerate(events):
+        error = validate_event(event_data)
+        if error:
+            results.append({'index': index, 'success': False, 'error': error})
+            continue
+        drop_reason, dedup_key = event_filter.check(event_data, user_agent)
+        if not drop_reason and dedup_key is not None and dedup_key in batch_keys:
+            # Повтор внутри той же пачки: в фильтре его ещё нет
+            event_filter.count_duplicate()
+            drop_reason = DROP_DUPLICATE
+        if drop_reason:
+            results.append({'index': index, 'success': True, 'dropped': drop_reason})
+            continue
+        batch_keys.add(dedup_key)
+        results.append({'index': index, 'success': True})
+        rows.append(build_row(event_data, user_agent, ip_address))
+        row_positions.append(index)
+        dedup_keys.append(dedup_key)
+
+    return results, rows, row_positions, dedup_keys
+
+
+def batch_summary(events: List[Any], rows: List[Tuple], results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    dropped = sum(1 for result in results if 'dropped' in result)
+    return {
+        'success': len(rows) + dropped > 0,
+        'accepted': len(rows),
+        'dropped': dropped,
+        'rejected': len(events) - len(rows) - dropped,
+        'results': results
+    }
+
+
+def ingest_batch(conn: Any, events: List[Any], headers: Dict[str, Any]) -> Dict[str, Any]:
+    '''
+    Business: Пакетное сохранение событий в одной транзакции
+    Args: conn - открытое подключение psycopg2
+          events - список событий в формате одиночного POST
+          headers - заголовки запроса (user-agent, IP)
+    Returns: dict с количеством принятых/отклонённых событий и результатом по каждому
+    '''
+    results, rows, row_positions, dedup_keys = prepare_batch(events, headers)
+
+    if rows:
+        with conn.cursor() as cur:
+            action_ids = insert_rows(cur, rows)
+        conn.commit()
+        event_filter.remember(dedup_keys)
+        for position, action_id in zip(row_positions, action_ids):
+            results[position]['action_id'] = action_id
+
+    return batch_summary(events, rows, results)
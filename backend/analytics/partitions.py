@@ -0,0 +1,51 @@
+import os
+from typing import Dict, Any
+
+# Сколько месяцев вперёд держать готовые секции user_actions
+PARTITION_MONTHS_AHEAD = int(os.environ.get('ANALYTICS_PARTITION_MONTHS_AHEAD', '3'))
+# Срок хранения сырых событий в месяцах; 0 — хранить всё
+RETENTION_MONTHS = int(os.environ.get('ANALYTICS_RETENTION_MONTHS', '0'))
+# Просроченные секции переносятся в схему user_actions_archive вместо удаления
+ARCHIVE_EXPIRED = os.environ.get('ANALYTICS_ARCHIVE_EXPIRED', '0') == '1'
+
+MAINTENANCE_LOCK_KEY = 'user_actions_partitions'
+
+
+def maintain_partitions(conn: Any) -> Dict[str, Any]:
+    '''
+    Business: Создаёт секции user_actions наперёд и убирает секции старше срока хранения
+    Args: conn - открытое подключение psycopg2
+    Returns: dict с количеством созданных и списком отцепленных секций
+    '''
+    with conn.cursor() as cur:
+        cur.execute('SELECT pg_try_advisory_xact_lock(hashtext(%s))', (MAINTENANCE_LOCK_KEY,))
+        if not cur.fetchone()[0]:
+            conn.rollback()
+            return {'maintained': False, 'reason': 'locked'}
+
+        # Начинаем с самого старого события в секции по умолчанию: если обслуживание
+        # пропускало месяцы, их строки переносятся в созданные секции
+        cur.execute(
+            '''SELECT user_actions_ensure_partitions(
+                   LEAST(CURRENT_DATE, (SELECT MIN(timestamp) FROM user_actions_default)::date), %s
+               )''',
+            (PARTITION_MONTHS_AHEAD,)
+        )
+        created = cur.fetchone()[0]
+
+        expired = []
+        if RETENTION_MONTHS > 0:
+            # Сырые события уходят, агрегаты в analytics_hourly_* остаются
+            cur.execute(
+                'SELECT user_actions_expire_partitions(%s, %s)',
+                (RETENTION_MONTHS, ARCHIVE_EXPIRED)
+            )
+            expired = [row[0] for row in cur.fetchall()]
+    conn.commit()
+
+    return {
+        'maintained': True,
+        'created': created,
+        'expired': expired,
+        'archived': ARCHIVE_EXPIRED and bool(expired)
+    }
@@ -0,0 +1,179 @@
+from typing import Dict, Any, Iterable, List, Tuple
+
+from rollups import WINDOW_CTE, get_watermark
+
+POPULAR_PAGES_LIMIT = 10
+
+# Один запрос вместо шести: счётчики и DISTINCT по всем разрезам за один проход
+DASHBOARD_COUNTS_TEMPLATE = WINDOW_CTE + ''',
+    counts_ext AS (
+        SELECT action_type, DATE(bucket_start) AS day, page_url,
+               EXTRACT(HOUR FROM bucket_start) AS hour, browser, os, device_class, actions
+        FROM counts
+    ),
+    visits_ext AS (
+        SELECT DATE(bucket_start) AS day, page_url, session_id, ip_address
+        FROM visits
+    )
+    SELECT
+        CASE GROUPING(action_type, day, page_url, hour, browser, os, device_class)
+            WHEN 127 THEN 'summary'
+            WHEN 63 THEN 'action_types'
+            WHEN 95 THEN 'daily'
+            WHEN 111 THEN 'pages'
+            WHEN 119 THEN 'hourly'
+            WHEN 123 THEN 'browsers'
+            WHEN 125 THEN 'os'
+            ELSE 'devices'
+        END AS section,
+        COALESCE(action_type, browser, os, device_class, page_url) AS label,
+        day,
+        hour,
+        SUM(actions)::bigint AS actions,
+        NULL::bigint AS sessions,
+        NULL::bigint AS visitors
+    FROM counts_ext
+    GROUP BY GROUPING SETS ((), (action_type), (day), (page_url), (hour), (browser), (os), (device_class))
+'''
+
+DASHBOARD_QUERY_TEMPLATE = DASHBOARD_COUNTS_TEMPLATE + '''    UNION ALL
+    SELECT
+        CASE GROUPING(day, page_url)
+            WHEN 3 THEN 'summary_unique'
+            WHEN 1 THEN 'daily_unique'
+            ELSE 'pages_unique'
+        END,
+        page_url,
+        day,
+        NULL,
+        NULL,
+        COUNT(DISTINCT session_id),
+        COUNT(DISTINCT ip_address)
+    FROM visits_ext
+    GROUP BY GROUPING SETS ({unique_sets})
+'''
+
+# Ведущий комментарий — имя запроса в метриках db_statement_seconds и в pg_stat_statements
+DASHBOARD_QUERY = '/* dashboard_exact */' + DASHBOARD_QUERY_TEMPLATE.replace('{unique_sets}', '(), (day), (page_url)')
+# В приближённом режиме уникальные за окно и по дням берутся из HLL-скетчей
+DASHBOARD_QUERY_PAGES_ONLY = '/* dashboard_pages */' + DASHBOARD_QUERY_TEMPLATE.replace('{unique_sets}', '(page_url)')
+# По выборке все уникальные считаются отдельно, здесь остаются только счётчики
+DASHBOARD_QUERY_COUNTS_ONLY = '/* dashboard_counts */' + DASHBOARD_COUNTS_TEMPLATE
+
+DASHBOARD_QUERIES = {
+    'exact': DASHBOARD_QUERY,
+    'approx': DASHBOARD_QUERY_PAGES_ONLY,
+    'sample': DASHBOARD_QUERY_COUNTS_ONLY
+}
+
+
+def fetch_dashboard_rows(cur: Any, days: int, unique_mode: str = 'exact') -> List[Tuple]:
+    '''Выполняет единый запрос дашборда. Returns: строки (section, label, day, hour, actions, sessions, visitors)'''
+    cur.execute(DASHBOARD_QUERIES[unique_mode], {'days': days, 'last_id': get_watermark(cur)})
+    return cur.fetchall()
+
+
+def _by_count_desc(items: Dict[Any, int]) -> List[Tuple[Any, int]]:
+    return sorted(items.items(), key=lambda item: -item[1])
+
+
+def shape_dashboard(rows: Iterable[Tuple], days: int, include_devices: bool = False) -> Dict[str, Any]:
+    '''
+    Business: Раскладывает строки единого запроса в JSON ответа дашборда за один проход
+    Args: rows - результат fetch_dashboard_rows
+          days - период отчёта
+          include_devices - добавить разрезы по ОС и типу устройства
+    Returns: dict в формате ответа analytics GET
+    '''
+    action_types: Dict[str, int] = {}
+    daily_actions: Dict[Any, int] = {}
+    daily_unique: Dict[Any, Tuple[int, int]] = {}
+    page_visits: Dict[str, int] = {}
+    page_unique: Dict[str, int] = {}
+    hourly: Dict[int, int] = {}
+    browsers: Dict[str, int] = {}
+    operating_systems: Dict[str, int] = {}
+    devices: Dict[str, int] = {}
+    total_actions = 0
+    unique_sessions = 0
+    unique_visitors = 0
+
+    for section, label, day, hour, actions, sessions, visitors in rows:
+        if section == 'summary':
+            total_actions = actions or 0
+        elif section == 'summary_unique':
+            unique_sessions, unique_visitors = sessions or 0, visitors or 0
+        elif section == 'action_types':
+            action_types[label] = actions
+        elif section == 'daily':
+            daily_actions[day] = actions
+        elif section == 'daily_unique':
+            daily_unique[day] = (sessions, visitors)
+        elif section == 'pages':
+            if label:
+                page_visits[label] = actions
+        elif section == 'pages_unique':
+            if label:
+                page_unique[label] = sessions
+        elif section == 'hourly':
+            hourly[int(hour)] = actions
+        elif section == 'browsers':
+            if label:
+                browsers[label] = actions
+        elif section == 'os':
+            if label:
+                operating_systems[label] = actions
+        elif section == 'devices':
+            if label:
+                devices[label] = actions
+
+    result = {
+        'period_days': days,
+        'action_types': [
+            {'action_type': action_type, 'count': count}
+            for action_type, count in _by_count_desc(action_types)
+        ],
+        'daily_stats': [
+            {
+                'date': day.isoformat() if hasattr(day, 'isoformat') else str(day),
+                'actions': daily_actions[day],
+                'sessions': daily_unique.get(day, (0, 0))[0],
+                'visitors': daily_unique.get(day, (0, 0))[1]
+            }
+            for day in sorted(daily_actions, reverse=True)
+        ],
+        'popular_pages': [
+            {
+                'url': url,
+                'visits': visits,
+                'unique_visits': page_unique.get(url, 0)
+            }
+            for url, visits in _by_count_desc(page_visits)[:POPULAR_PAGES_LIMIT]
+        ],
+        'hourly_stats': [
+            {'hour': hour, 'actions': hourly[hour]}
+            for hour in sorted(hourly)
+        ],
+        'browser_stats': [
+            {'browser': browser, 'count': count}
+            for browser, count in _by_count_desc(browsers)
+        ],
+        'summary': {
+            'total_actions': total_actions,
+            'unique_sessions': unique_sessions,
+            'unique_visitors': unique_visitors
+        }
+    }
+
+    if include_devices:
+        result['os_stats'] = [
+            {'os': os_name, 'count': count}
+            for os_name, count in _by_count_desc(operating_systems)
+        ]
+        result['device_stats'] = [
+            {'device_class': device_class, 'count': count}
+            for device_class, count in _by_count_desc(devices)
+        ]
+
+    return result
+
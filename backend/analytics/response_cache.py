@@ -0,0 +1,151 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Callable, Hashable, Optional, Tuple
+
+CACHE_TTL_SECONDS = float(os.environ.get('ANALYTICS_CACHE_TTL', '30'))
+# Сколько ещё после TTL можно отдавать устаревший ответ, пока идёт пересчёт в фоне
+CACHE_STALE_SECONDS = float(os.environ.get('ANALYTICS_CACHE_STALE_TTL', '300'))
+CACHE_MAX_ENTRIES = int(os.environ.get('ANALYTICS_CACHE_MAX_ENTRIES', '64'))
+# Запись считается устаревшей, когда MAX(user_actions.id) ушёл вперёд больше чем на столько
+CACHE_STALENESS_ROWS = int(os.environ.get('ANALYTICS_CACHE_STALENESS_ROWS', '1000'))
+
+# Параметры запроса, которые не влияют на содержимое ответа
+NON_FILTER_PARAMS = {'days', 'action'}
+
+
+class _Entry:
+    __slots__ = ('value', 'created_at', 'watermark')
+
+    def __init__(self, value: Any, watermark: int):
+        self.value = value
+        self.created_at = time.monotonic()
+        self.watermark = watermark
+
+
+class _Flight:
+    '''Один пересчёт ключа, результат которого ждут все параллельные запросы'''
+    __slots__ = ('done', 'value', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class ResponseCache:
+    '''
+    LRU-кэш ответов с TTL, инвалидацией по водяному знаку ingest
+    и stale-while-revalidate: одновременные промахи делят один пересчёт.
+    '''
+
+    def __init__(self, ttl: float = CACHE_TTL_SECONDS, stale_ttl: float = CACHE_STALE_SECONDS,
+                 max_entries: int = CACHE_MAX_ENTRIES, staleness_rows: int = CACHE_STALENESS_ROWS):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max(1, max_entries)
+        self.staleness_rows = staleness_rows
+
+        self._lock = threading.Lock()
+        self._entries: 'OrderedDict[Hashable, _Entry]' = OrderedDict()
+        self._flights: Dict[Hashable, _Flight] = {}
+        self._stats = {'hits': 0, 'stale': 0, 'misses': 0, 'shared': 0, 'evictions': 0, 'errors': 0}
+
+    def _is_fresh(self, entry: _Entry, watermark: int, now: float) -> bool:
+        return now - entry.created_at < self.ttl and watermark - entry.watermark <= self.staleness_rows
+
+    def _store(self, key: Hashable, value: Any, watermark: int) -> None:
+        with self._lock:
+            self._entries[key] = _Entry(value, watermark)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def _run_flight(self, key: Hashable, flight: _Flight, watermark: int, compute: Callable[[], Any]) -> None:
+        try:
+            flight.value = compute()
+            self._store(key, flight.value, watermark)
+        except BaseException as e:
+            flight.error = e
+            with self._lock:
+                self._stats['errors'] += 1
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.done.set()
+
+    def get_or_compute(self, key: Hashable, watermark: int, compute: Callable[[], Any]) -> Tuple[Any, str]:
+        '''
+        Business: Возвращает ответ из кэша или считает его один раз на все параллельные запросы
+        Args: key - ключ (период и фильтры)
+              watermark - MAX(user_actions.id), допустимо прочитанный несколько секунд назад
+              compute - функция пересчёта ответа
+        Returns: (значение, статус hit/stale/shared/miss)
+        '''
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                if self._is_fresh(entry, watermark, now):
+                    self._stats['hits'] += 1
+                    return entry.value, 'hit'
+
+                if now - entry.created_at < self.ttl + self.stale_ttl:
+                    # Отдаём устаревшее и пересчитываем в фоне, не более одного раза на ключ
+                    self._stats['stale'] += 1
+                    if key not in self._flights:
+                        flight = _Flight()
+                        self._flights[key] = flight
+                        threading.Thread(
+                            target=self._run_flight, args=(key, flight, watermark, compute),
+                            name='analytics-cache-revalidate', daemon=True
+                        ).start()
+                    return entry.value, 'stale'
+
+            flight = self._flights.get(key)
+            owner = flight is None
+            if owner:
+                flight = _Flight()
+                self._flights[key] = flight
+                self._stats['misses'] += 1
+            else:
+                self._stats['shared'] += 1
+
+        if owner:
+            self._run_flight(key, flight, watermark, compute)
+        else:
+            flight.done.wait()
+
+        if flight.error is not None:
+            raise flight.error
+        return flight.value, 'miss' if owner else 'shared'
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl,
+                'stale_ttl_seconds': self.stale_ttl,
+                'staleness_rows': self.staleness_rows,
+                'in_flight': len(self._flights),
+                **self._stats
+            }
+
+
+def dashboard_cache_key(params: Dict[str, Any], days: int) -> Tuple:
+    '''Ключ кэша: период плюс все остальные параметры-фильтры'''
+    filters = tuple(sorted(
+        (name, str(value)) for name, value in params.items() if name not in NON_FILTER_PARAMS
+    ))
+    return ('dashboard', days, filters)
+
+
+dashboard_cache = ResponseCache()
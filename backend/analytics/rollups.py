@@ -0,0 +1,141 @@
+import os
+from typing import Dict, Any
+
+# Сколько новых событий сводится за один вызов, чтобы обновление не тормозило дашборд
+ROLLUP_CHUNK_SIZE = int(os.environ.get('ANALYTICS_ROLLUP_CHUNK', '200000'))
+# События моложе этого возраста не сводятся: их транзакции могут быть ещё не закоммичены
+ROLLUP_LAG_SECONDS = int(os.environ.get('ANALYTICS_ROLLUP_LAG_SECONDS', '60'))
+# Агрегаты досводит действие refresh_rollups по расписанию (shared.schedule);
+# 1 — дополнительно досводить их внутри GET дашборда
+REFRESH_ON_READ = os.environ.get('ANALYTICS_ROLLUP_REFRESH_ON_READ', '0') == '1'
+
+ROLLUP_LOCK_KEY = 'analytics_hourly_rollup'
+
+
+def get_watermark(cur: Any, name: str = 'hourly') -> int:
+    cur.execute('SELECT last_action_id FROM analytics_rollup_state WHERE name = %s', (name,))
+    row = cur.fetchone()
+    return row[0] if row else 0
+
+
+def set_watermark(cur: Any, last_id: int, name: str = 'hourly') -> None:
+    cur.execute(
+        '''UPDATE analytics_rollup_state
+           SET last_action_id = %s, updated_at = CURRENT_TIMESTAMP
+           WHERE name = %s''',
+        (last_id, name)
+    )
+
+
+def find_chunk_upper_id(cur: Any, last_id: int, chunk_size: int) -> Any:
+    '''Верхняя граница следующей порции: не больше chunk_size строк и без слишком свежих событий'''
+    cur.execute(
+        '''SELECT MAX(id) FROM (
+               SELECT id, timestamp FROM user_actions
+               WHERE id > %s ORDER BY id LIMIT %s
+           ) chunk
+           WHERE timestamp < NOW() - make_interval(secs => %s)''',
+        (last_id, chunk_size, ROLLUP_LAG_SECONDS)
+    )
+    return cur.fetchone()[0]
+
+
+def refresh_rollups(conn: Any, chunk_size: int = ROLLUP_CHUNK_SIZE) -> Dict[str, Any]:
+    '''
+    Business: Инкрементально сводит новые строки user_actions в почасовые агрегаты
+    Args: conn - открытое подключение psycopg2
+          chunk_size - максимум событий за один вызов
+    Returns: dict с диапазоном обработанных id
+    '''
+    with conn.cursor() as cur:
+        # Параллельные обновления не нужны: кто не взял лок, просто пропускает шаг
+        cur.execute('SELECT pg_try_advisory_xact_lock(hashtext(%s))', (ROLLUP_LOCK_KEY,))
+        if not cur.fetchone()[0]:
+            conn.rollback()
+            return {'refreshed': False, 'reason': 'locked'}
+
+        last_id = get_watermark(cur)
+
+        upper_id = find_chunk_upper_id(cur, last_id, chunk_size)
+        if not upper_id:
+            conn.rollback()
+            return {'refreshed': False, 'from_id': last_id, 'to_id': last_id}
+
+        cur.execute(
+            '''INSERT INTO analytics_hourly_rollup
+                   (bucket_start, action_type, page_url, browser, os, device_class, actions)
+               SELECT date_trunc('hour', timestamp), action_type, COALESCE(page_url, ''),
+                      COALESCE(browser, analytics_browser(user_agent)),
+                      COALESCE(os, ''), COALESCE(device_class, ''), COUNT(*)
+               FROM user_actions
+               WHERE id > %s AND id <= %s AND timestamp IS NOT NULL
+               GROUP BY 1, 2, 3, 4, 5, 6
+               ON CONFLICT (bucket_start, action_type, page_url, browser, os, device_class)
+               DO UPDATE SET actions = analytics_hourly_rollup.actions + EXCLUDED.actions''',
+            (last_id, upper_id)
+        )
+
+        cur.execute(
+            '''INSERT INTO analytics_hourly_visits (bucket_start, session_id, ip_address, page_url)
+               SELECT DISTINCT date_trunc('hour', timestamp), session_id,
+                      COALESCE(ip_address, '0.0.0.0'::inet), COALESCE(page_url, '')
+               FROM user_actions
+               WHERE id > %s AND id <= %s AND timestamp IS NOT NULL
+               ON CONFLICT DO NOTHING''',
+            (last_id, upper_id)
+        )
+
+        set_watermark(cur, upper_id)
+    conn.commit()
+
+    return {'refreshed': True, 'from_id': last_id, 'to_id': upper_id}
+
+
+# Окно [NOW() - days, NOW()]: полные часы берутся из агрегатов,
+# неполный первый час и всё после водяного знака — из сырых строк.
+# Граница окна по user_actions записана прямо через NOW(), чтобы работало отсечение секций.
+# Счётчики действий из analytics_hourly_rollup дёшевы при любом окне, а точные уникальные —
+# нет: пары сессия/IP/страница за час почти не повторяются, и analytics_hourly_visits растёт
+# почти так же быстро, как user_actions. COUNT(DISTINCT) за длинное окно читает объём порядка
+# сырых событий; для таких окон есть unique=approx (sketches.py) и unique=sample (sampling.py)
+WINDOW_CTE = '''
+    WITH window_origin AS (
+        SELECT NOW() - make_interval(days => %(days)s) AS window_start
+    ),
+    bounds AS (
+        SELECT
+            window_start,
+            CASE
+                WHEN date_trunc('hour', window_start) = window_start THEN window_start
+                ELSE date_trunc('hour', window_start) + INTERVAL '1 hour'
+            END AS rollup_start
+        FROM window_origin
+    ),
+    raw AS (
+        SELECT ua.timestamp, ua.action_type, ua.page_url, ua.session_id, ua.ip_address,
+               COALESCE(ua.browser, analytics_browser(ua.user_agent)) AS browser,
+               COALESCE(ua.os, '') AS os, COALESCE(ua.device_class, '') AS device_class
+        FROM user_actions ua, bounds b
+        WHERE ua.timestamp >= NOW() - make_interval(days => %(days)s)
+          AND (ua.timestamp < b.rollup_start OR ua.id > %(last_id)s)
+    ),
+    counts AS (
+        SELECT r.bucket_start, r.action_type, r.page_url, r.browser, r.os, r.device_class, r.actions
+        FROM analytics_hourly_rollup r, bounds b
+        WHERE r.bucket_start >= b.rollup_start
+        UNION ALL
+        SELECT date_trunc('hour', timestamp), action_type, COALESCE(page_url, ''),
+               browser, os, device_class, COUNT(*)
+        FROM raw
+        GROUP BY 1, 2, 3, 4, 5, 6
+    ),
+    visits AS (
+        SELECT v.bucket_start, v.session_id, v.ip_address, v.page_url
+        FROM analytics_hourly_visits v, bounds b
+        WHERE v.bucket_start >= b.rollup_start
+        UNION ALL
+        SELECT date_trunc('hour', timestamp), session_id,
+               COALESCE(ip_address, '0.0.0.0'::inet), COALESCE(page_url, '')
+        FROM raw
+    )
+'''
@@ -0,0 +1,166 @@
+import math
+import os
+from typing import Dict, Any, List, Optional, Tuple
+
+from rollups import WINDOW_CTE, find_chunk_upper_id, get_watermark, set_watermark
+
+# В выборку попадает каждый SAMPLE_MODULUS-й посетитель (по хэшу IP) со всеми своими
+# сессиями. То же число зашито в V0016 — менять только вместе с пересборкой выборки
+SAMPLE_MODULUS = 20
+SAMPLE_CHUNK_SIZE = int(os.environ.get('ANALYTICS_SAMPLE_CHUNK', '200000'))
+# unique=auto: если событий в окне больше, уникальные считаются по выборке
+SAMPLE_THRESHOLD_ROWS = int(os.environ.get('ANALYTICS_SAMPLE_THRESHOLD_ROWS', '2000000'))
+SAMPLE_LOCK_KEY = 'analytics_visit_sample'
+SAMPLE_STATE = 'visit_sample'
+
+# Двусторонний 95% интервал
+CONFIDENCE = 0.95
+CONFIDENCE_Z = 1.96
+
+SAMPLE_FILTER = f"abs(hashtext(host(COALESCE(ip_address, '0.0.0.0'::inet)))::bigint) %% {SAMPLE_MODULUS} = 0"
+
+Interval = List[int]
+
+
+def refresh_visit_sample(conn: Any, chunk_size: int = SAMPLE_CHUNK_SIZE) -> Dict[str, Any]:
+    '''
+    Business: Добавляет посещения выбранных посетителей из новых событий в постоянную выборку
+    Args: conn - открытое подключение psycopg2
+          chunk_size - максимум событий за один вызов
+    Returns: dict с диапазоном обработанных id
+    '''
+    with conn.cursor() as cur:
+        cur.execute('SELECT pg_try_advisory_xact_lock(hashtext(%s))', (SAMPLE_LOCK_KEY,))
+        if not cur.fetchone()[0]:
+            conn.rollback()
+            return {'refreshed': False, 'reason': 'locked'}
+
+        last_id = get_watermark(cur, SAMPLE_STATE)
+        upper_id = find_chunk_upper_id(cur, last_id, chunk_size)
+        if not upper_id:
+            conn.rollback()
+            return {'refreshed': False, 'from_id': last_id, 'to_id': last_id}
+
+        cur.execute(
+            f'''INSERT INTO analytics_visit_sample (bucket_start, session_id, ip_address, page_url)
+                SELECT DISTINCT date_trunc('hour', timestamp), session_id,
+                       COALESCE(ip_address, '0.0.0.0'::inet), COALESCE(page_url, '')
+                FROM user_actions
+                WHERE id > %s AND id <= %s AND timestamp IS NOT NULL AND {SAMPLE_FILTER}
+                ON CONFLICT DO NOTHING''',
+            (last_id, upper_id)
+        )
+
+        set_watermark(cur, upper_id, SAMPLE_STATE)
+    conn.commit()
+
+    return {'refreshed': True, 'from_id': last_id, 'to_id': upper_id}
+
+
+# Сколько событий в окне: по почасовым агрегатам, без чтения сырых строк
+WINDOW_ROWS_QUERY = '''/* dashboard_window_rows */
+    SELECT COALESCE(SUM(actions), 0)
+    FROM analytics_hourly_rollup
+    WHERE bucket_start >= NOW() - make_interval(days => %s)
+'''
+
+# Сессии считаются по каждому посетителю выборки: из сумм и сумм квадратов
+# получаются и оценка, и её дисперсия
+SAMPLED_UNIQUES_QUERY = '/* dashboard_sampled_uniques */' + WINDOW_CTE + f''',
+    sample AS (
+        SELECT s.bucket_start, s.session_id, s.ip_address, s.page_url
+        FROM analytics_visit_sample s, bounds b
+        WHERE s.bucket_start >= b.rollup_start
+        UNION ALL
+        SELECT date_trunc('hour', timestamp), session_id,
+               COALESCE(ip_address, '0.0.0.0'::inet), COALESCE(page_url, '')
+        FROM raw
+        WHERE {SAMPLE_FILTER}
+    ),
+    per_visitor AS (
+        SELECT GROUPING(DATE(bucket_start), page_url) AS grouping_id,
+               DATE(bucket_start) AS day, page_url, ip_address,
+               COUNT(DISTINCT session_id) AS sessions
+        FROM sample
+        GROUP BY GROUPING SETS ((ip_address), (DATE(bucket_start), ip_address), (page_url, ip_address))
+    )
+    SELECT
+        CASE grouping_id
+            WHEN 3 THEN 'summary_unique'
+            WHEN 1 THEN 'daily_unique'
+            ELSE 'pages_unique'
+        END,
+        page_url,
+        day,
+        COUNT(*)::bigint,
+        SUM(sessions)::bigint,
+        SUM(sessions * sessions)::bigint
+    FROM per_visitor
+    GROUP BY grouping_id, page_url, day
+'''
+
+
+def estimate_window_rows(cur: Any, days: int) -> int:
+    cur.execute(WINDOW_ROWS_QUERY, (days,))
+    return int(cur.fetchone()[0])
+
+
+def scaled_estimate(total: int, squares: int, modulus: int = SAMPLE_MODULUS) -> Tuple[int, Interval]:
+    '''
+    Оценка Хорвица–Томпсона по выборке посетителей с вероятностью 1/modulus:
+    total * modulus, дисперсия modulus * (modulus - 1) * сумма квадратов по посетителям.
+    Returns: (оценка, [нижняя, верхняя] граница интервала)
+    '''
+    estimate = total * modulus
+    margin = CONFIDENCE_Z * math.sqrt(modulus * (modulus - 1) * squares)
+    return estimate, [max(total, math.floor(estimate - margin)), math.ceil(estimate + margin)]
+
+
+def sampled_unique_rows(cur: Any, days: int) -> Tuple[List[Tuple], Dict[Tuple[str, Any], Dict[str, Interval]]]:
+    '''
+    Business: Уникальные сессии и посетители за окно по постоянной выборке
+    Args: cur - курсор psycopg2
+          days - период отчёта
+    Returns: строки summary_unique/daily_unique/pages_unique в формате единого запроса
+             дашборда и интервалы {(раздел, день или url): {'sessions': [..], 'visitors': [..]}}
+    '''
+    cur.execute(SAMPLED_UNIQUES_QUERY, {'days': days, 'last_id': get_watermark(cur, SAMPLE_STATE)})
+    rows: List[Tuple] = []
+    intervals: Dict[Tuple[str, Any], Dict[str, Interval]] = {}
+    for section, page_url, day, visitors, sessions, sessions_squares in cur.fetchall():
+        sessions_estimate, sessions_interval = scaled_estimate(sessions, sessions_squares)
+        # У каждого посетителя ровно один IP: сумма квадратов равна числу посетителей
+        visitors_estimate, visitors_interval = scaled_estimate(visitors, visitors)
+        label = page_url if section == 'pages_unique' else None
+        row_day = day if section == 'daily_unique' else None
+        rows.append((section, label, row_day, None, None, sessions_estimate, visitors_estimate))
+        key = label if section == 'pages_unique' else (row_day.isoformat() if row_day else None)
+        intervals[(section, key)] = {'sessions': sessions_interval, 'visitors': visitors_interval}
+    return rows, intervals
+
+
+def attach_intervals(result: Dict[str, Any], intervals: Dict[Tuple[str, Any], Dict[str, Interval]]) -> Dict[str, Any]:
+    '''Добавляет к оценкам ответа дашборда поля *_ci с границами интервала'''
+    empty = {'sessions': [0, 0], 'visitors': [0, 0]}
+
+    summary = intervals.get(('summary_unique', None), empty)
+    result['summary']['unique_sessions_ci'] = summary['sessions']
+    result['summary']['unique_visitors_ci'] = summary['visitors']
+
+    for day_stats in result['daily_stats']:
+        day_intervals = intervals.get(('daily_unique', day_stats['date']), empty)
+        day_stats['sessions_ci'] = day_intervals['sessions']
+        day_stats['visitors_ci'] = day_intervals['visitors']
+
+    for page in result['popular_pages']:
+        page['unique_visits_ci'] = intervals.get(('pages_unique', page['url']), empty)['sessions']
+
+    result['unique_counts'] = 'sampled'
+    result['sample'] = {'rate': 1 / SAMPLE_MODULUS, 'confidence': CONFIDENCE}
+    return result
+
+
+def choose_unique_mode(cur: Any, days: int, threshold: Optional[int] = None) -> str:
+    '''unique=auto: точный подсчёт для коротких окон, выборка — для больших'''
+    threshold = SAMPLE_THRESHOLD_ROWS if threshold is None else threshold
+    return 'sample' if estimate_window_rows(cur, days) > threshold else 'exact'
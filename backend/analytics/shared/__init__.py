@@ -0,0 +1 @@
+# Копия backend/shared/__init__.py, не править: python -m shared.vendor
@@ -0,0 +1,230 @@
+import json
+import os
+import sys
+from datetime import date, timedelta
+
+ANALYTICS_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(ANALYTICS_DIR)
+MIGRATIONS_DIR = os.path.join(os.path.dirname(BACKEND_DIR), 'db_migrations')
+for path in (ANALYTICS_DIR, BACKEND_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from query_engine import shape_dashboard
+
+# Шесть запросов дашборда в том виде, в каком они были до единого запроса
+LEGACY_QUERIES = {
+    'summary': """
+        SELECT COUNT(*), COUNT(DISTINCT session_id), COUNT(DISTINCT ip_address)
+        FROM user_actions WHERE timestamp >= NOW() - INTERVAL '{interval}'
+    """,
+    'action_types': """
+        SELECT action_type, COUNT(*) as action_count
+        FROM user_actions WHERE timestamp >= NOW() - INTERVAL '{interval}'
+        GROUP BY action_type ORDER BY action_count DESC
+    """,
+    'daily': """
+        SELECT DATE(timestamp) as date, COUNT(*) as actions,
+               COUNT(DISTINCT session_id) as sessions, COUNT(DISTINCT ip_address) as visitors
+        FROM user_actions WHERE timestamp >= NOW() - INTERVAL '{interval}'
+        GROUP BY DATE(timestamp) ORDER BY date DESC
+    """,
+    'pages': """
+        SELECT page_url, COUNT(*) as visits, COUNT(DISTINCT session_id) as unique_visits
+        FROM user_actions WHERE timestamp >= NOW() - INTERVAL '{interval}'
+        AND page_url IS NOT NULL AND page_url != ''
+        GROUP BY page_url ORDER BY visits DESC LIMIT 10
+    """,
+    'hourly': """
+        SELECT EXTRACT(HOUR FROM timestamp) as hour, COUNT(*) as actions
+        FROM user_actions WHERE timestamp >= NOW() - INTERVAL '{interval}'
+        GROUP BY EXTRACT(HOUR FROM timestamp) ORDER BY hour
+    """,
+    'browsers': """
+        SELECT CASE
+                   WHEN user_agent LIKE '%Chrome%' THEN 'Chrome'
+                   WHEN user_agent LIKE '%Firefox%' THEN 'Firefox'
+                   WHEN user_agent LIKE '%Safari%' AND user_agent NOT LIKE '%Chrome%' THEN 'Safari'
+                   WHEN user_agent LIKE '%Edge%' THEN 'Edge'
+                   ELSE 'Other'
+               END as browser,
+               COUNT(*) as count
+        FROM user_actions WHERE timestamp >= NOW() - INTERVAL '{interval}'
+        AND user_agent IS NOT NULL
+        GROUP BY browser ORDER BY count DESC
+    """
+}
+
+
+def legacy_shape(sections, days):
+    '''Формирование ответа как в исходном обработчике'''
+    summary_row = sections['summary'][0] if sections['summary'] else None
+    return {
+        'period_days': days,
+        'action_types': [{'action_type': row[0], 'count': row[1]} for row in sections['action_types']],
+        'daily_stats': [
+            {
+                'date': row[0].isoformat() if hasattr(row[0], 'isoformat') else str(row[0]),
+                'actions': row[1],
+                'sessions': row[2],
+                'visitors': row[3]
+            }
+            for row in sections['daily']
+        ],
+        'popular_pages': [
+            {'url': row[0], 'visits': row[1], 'unique_visits': row[2]}
+            for row in sections['pages']
+        ],
+        'hourly_stats': [{'hour': int(row[0]), 'actions': row[1]} for row in sections['hourly']],
+        'browser_stats': [{'browser': row[0], 'count': row[1]} for row in sections['browsers']],
+        'summary': {
+            'total_actions': summary_row[0] if summary_row else 0,
+            'unique_sessions': summary_row[1] if summary_row else 0,
+            'unique_visitors': summary_row[2] if summary_row else 0
+        }
+    }
+
+
+def test_shape_matches_legacy_layout():
+    today = date(2025, 1, 10)
+    yesterday = today - timedelta(days=1)
+    legacy_sections = {
+        'summary': [(42, 7, 5)],
+        'action_types': [('page_view', 30), ('click', 8), ('page_exit', 4)],
+        'daily': [(today, 25, 4, 3), (yesterday, 17, 3, 2)],
+        'pages': [('https://example.com/', 20, 6), ('https://example.com/catalog', 9, 2)],
+        'hourly': [(9, 12), (14, 30)],
+        'browsers': [('Chrome', 28), ('Safari', 10), ('Other', 4)]
+    }
+    rows = [
+        ('summary', None, None, None, 42, None, None),
+        ('summary_unique', None, None, None, None, 7, 5),
+        ('action_types', 'click', None, None, 8, None, None),
+        ('action_types', 'page_view', None, None, 30, None, None),
+        ('action_types', 'page_exit', None, None, 4, None, None),
+        ('daily', None, yesterday, None, 17, None, None),
+        ('daily', None, today, None, 25, None, None),
+        ('daily_unique', None, today, None, None, 4, 3),
+        ('daily_unique', None, yesterday, None, None, 3, 2),
+        ('pages', '', None, None, 13, None, None),
+        ('pages', 'https://example.com/catalog', None, None, 9, None, None),
+        ('pages', 'https://example.com/', None, None, 20, None, None),
+        ('pages_unique', 'https://example.com/', None, None, None, 6, 5),
+        ('pages_unique', 'https://example.com/catalog', None, None, None, 2, 2),
+        ('hourly', None, None, 14, 30, None, None),
+        ('hourly', None, None, 9, 12, None, None),
+        ('browsers', 'Safari', None, None, 10, None, None),
+        ('browsers', 'Chrome', None, None, 28, None, None),
+        ('browsers', '', None, None, 0, None, None),
+        ('browsers', 'Other', None, None, 4, None, None)
+    ]
+
+    assert json.dumps(shape_dashboard(rows, 7)) == json.dumps(legacy_shape(legacy_sections, 7))
+
+
+def test_shape_empty_window():
+    rows = [
+        ('summary', None, None, None, None, None, None),
+        ('summary_unique', None, None, None, None, 0, 0)
+    ]
+    empty = {k: [] for k in LEGACY_QUERIES}
+    empty['summary'] = [(0, 0, 0)]
+    assert json.dumps(shape_dashboard(rows, 30)) == json.dumps(legacy_shape(empty, 30))
+
+
+# Сценарий: часть событий уже в агрегатах, часть в сыром хвосте, часть у границы окна
+FIXTURE_EVENTS = [
+    # (минут назад, session_id, ip, action_type, page_url, user_agent)
+    *[(60 * 30 + i, f's{i % 5}', f'10.0.0.{i % 4}', 'page_view', 'https://example.com/', 'Mozilla Chrome/120') for i in range(9)],
+    *[(60 * 50 + i, f's{i % 3}', f'10.0.1.{i % 2}', 'click', 'https://example.com/catalog', 'Mozilla Firefox/121') for i in range(5)],
+    *[(60 * 5 + i, f's{i}', '10.0.2.1', 'page_exit', '', 'Mozilla Safari/605') for i in range(4)],
+    (60 * 24 * 7 - 1, 'edge', '10.0.3.1', 'scroll_checkpoint', 'https://example.com/edge', None),
+    (60 * 24 * 7 + 30, 'outside', '10.0.3.2', 'page_view', 'https://example.com/', 'Mozilla Chrome/100'),
+]
+TAIL_EVENTS = [
+    (3, 'tail', '10.0.4.1', 'page_view', 'https://example.com/', 'Mozilla Chrome/120'),
+    (2, 'tail', '10.0.4.1', 'page_view', 'https://example.com/', 'Mozilla Chrome/120'),
+    (1, 'tail', '10.0.4.1', 'click', 'https://example.com/catalog', 'Mozilla Chrome/120'),
+]
+
+
+def _insert(cur, events):
+    for minutes_ago, session_id, ip, action_type, page_url, user_agent in events:
+        cur.execute(
+            '''INSERT INTO user_actions (session_id, ip_address, action_type, page_url, user_agent, timestamp)
+               VALUES (%s, %s, %s, %s, %s, NOW() - make_interval(mins => %s))''',
+            (session_id, ip, action_type, page_url, user_agent, minutes_ago)
+        )
+
+
+def test_single_pass_matches_legacy_byte_for_byte(scratch_conn):
+    from query_engine import fetch_dashboard_rows
+    from rollups import refresh_rollups
+
+    with scratch_conn.cursor() as cur:
+        _insert(cur, FIXTURE_EVENTS)
+    scratch_conn.commit()
+    assert refresh_rollups(scratch_conn)['refreshed']
+
+    with scratch_conn.cursor() as cur:
+        _insert(cur, TAIL_EVENTS)
+    scratch_conn.commit()
+
+    for days in (1, 7, 30):
+        with scratch_conn.cursor() as cur:
+            legacy_sections = {}
+            for name, query in LEGACY_QUERIES.items():
+                cur.execute(query.format(interval=f'{days} days'))
+                legacy_sections[name] = cur.fetchall()
+            rows = fetch_dashboard_rows(cur, days)
+        scratch_conn.rollback()
+
+        assert json.dumps(shape_dashboard(rows, days)) == json.dumps(legacy_shape(legacy_sections, days))
+
+
+def test_sketch_backfill_matches_incremental_refresh(scratch_conn):
+    from rollups import refresh_rollups
+    from sketches import refresh_sketches, sketch_status
+
+    with scratch_conn.cursor() as cur:
+        _insert(cur, FIXTURE_EVENTS)
+    scratch_conn.commit()
+    assert refresh_rollups(scratch_conn)['refreshed']
+    assert refresh_sketches(scratch_conn)['refreshed']
+
+    def read_sketches():
+        with scratch_conn.cursor() as cur:
+            cur.execute('SELECT granularity, bucket_start, sessions_hll, visitors_hll FROM analytics_unique_sketches')
+            return {(g, b): (bytes(s), bytes(v)) for g, b, s, v in cur.fetchall()}
+
+    incremental = read_sketches()
+    with scratch_conn.cursor() as cur:
+        with open(os.path.join(MIGRATIONS_DIR, 'V0017__backfill_analytics_unique_sketches.sql'), encoding='utf-8') as f:
+            cur.execute(f.read())
+        assert sketch_status(cur)['pending_events'] == 0
+    assert read_sketches() == incremental
+
+
+def test_user_agent_backfill_matches_parser(scratch_conn):
+    from ua_parser import parse_user_agent
+
+    user_agents = [
+        'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36 Edg/120.0',
+        'Mozilla/5.0 (iPhone; CPU iPhone OS 17_1 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) CriOS/119.0 Mobile/15E148 Safari/604.1',
+        'Mozilla/5.0 (iPad; CPU OS 16_6 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/16.6 Mobile/15E148 Safari/604.1',
+        'Mozilla/5.0 (Linux; Android 13; SM-S911B) AppleWebKit/537.36 (KHTML, like Gecko) SamsungBrowser/23.0 Chrome/115.0 Mobile Safari/537.36',
+        'Mozilla/5.0 (Linux; Android 12; Tab) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/118.0 Safari/537.36',
+        'Mozilla/5.0 (X11; Linux x86_64; rv:121.0) Gecko/20100101 Firefox/121.0',
+        'Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)',
+        'curl/8.4.0',
+        'Mozilla Chrome/999999',
+        '',
+    ]
+    with scratch_conn.cursor() as cur:
+        _insert(cur, [(1, f's{i}', '10.0.0.1', 'page_view', '/', ua) for i, ua in enumerate(user_agents)])
+        with open(os.path.join(MIGRATIONS_DIR, 'V0018__backfill_parsed_user_agent.sql'), encoding='utf-8') as f:
+            cur.execute(f.read())
+        cur.execute('SELECT user_agent, browser, browser_major, os, device_class, is_bot FROM user_actions')
+        backfilled = {row[0]: tuple(row[1:]) for row in cur.fetchall()}
+
+    assert backfilled == {ua: tuple(parse_user_agent(ua)) for ua in user_agents}
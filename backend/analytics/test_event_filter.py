@@ -0,0 +1,179 @@
+import json
+import os
+import sys
+
+ANALYTICS_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(ANALYTICS_DIR)
+for path in (ANALYTICS_DIR, BACKEND_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+import ingest
+import write_buffer
+from event_filter import DROP_BOT, DROP_DUPLICATE, EventFilter, RotatingBloomFilter
+
+BROWSER_UA = 'Mozilla/5.0 (X11; Linux x86_64; rv:121.0) Gecko/20100101 Firefox/121.0'
+BOT_UA = 'Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)'
+
+
+def page_view(session_id='s1', page_url='/catalog'):
+    return {'session_id': session_id, 'action_type': 'page_view', 'page_url': page_url}
+
+
+def test_rotating_bloom_filter_forgets_after_two_generations():
+    bloom = RotatingBloomFilter(capacity=1000, error_rate=0.001, rotate_seconds=3600)
+    assert not bloom.contains(b'a')
+    bloom.add(b'a')
+    assert bloom.contains(b'a')
+    for i in range(500):
+        bloom.add(f'key-{i}'.encode())
+
+    # Ключ из предыдущего поколения ещё помнится, через два поворота — нет
+    bloom._rotated_at -= 3600
+    assert bloom.contains(b'a')
+    bloom._rotated_at -= 3600
+    assert not bloom.contains(b'a')
+    assert bloom.stats()['rotations'] == 2
+
+
+def test_event_filter_drops_remembered_duplicates_and_bots():
+    event_filter = EventFilter(enabled=True, drop_bots=True, window_seconds=30)
+    reason, key = event_filter.check(page_view(), BROWSER_UA, now=1000)
+    assert reason is None
+    # Пока событие не сохранено, повтор не считается дублем
+    assert event_filter.check(page_view(), BROWSER_UA, now=1005) == (None, key)
+    event_filter.remember([key])
+    assert event_filter.check(page_view(), BROWSER_UA, now=1005)[0] == DROP_DUPLICATE
+    assert event_filter.check(page_view(page_url='/about'), BROWSER_UA, now=1005)[0] is None
+    assert event_filter.check(page_view(session_id='s2'), BROWSER_UA, now=1005)[0] is None
+    # Следующая корзина времени — уже новое событие
+    assert event_filter.check(page_view(), BROWSER_UA, now=1031)[0] is None
+    assert event_filter.check(page_view(session_id='s3'), BOT_UA, now=1005) == (DROP_BOT, None)
+
+    stats = event_filter.stats()
+    assert stats['checked'] == 7 and stats['dropped_duplicate'] == 1 and stats['dropped_bot'] == 1
+
+    disabled = EventFilter(enabled=False)
+    assert disabled.check(page_view(), BOT_UA) == (None, None)
+
+
+def test_dedup_key_tells_events_apart_by_details_and_event_id():
+    event_filter = EventFilter(enabled=True, drop_bots=True, window_seconds=30)
+    checkpoints = [dict(page_view(), action_type='scroll_checkpoint',
+                        action_details={'checkpoint_percent': percent, 'path': '/catalog'})
+                   for percent in (25, 50, 75, 100)]
+    keys = {event_filter.dedup_key(event, now=1000) for event in checkpoints}
+    assert len(keys) == 4
+    # Порядок полей в action_details на ключ не влияет
+    assert (event_filter.dedup_key(dict(page_view(), action_details={'a': 1, 'b': 2}), now=1000)
+            == event_filter.dedup_key(dict(page_view(), action_details={'b': 2, 'a': 1}), now=1000))
+
+    # С event_id два одинаковых клика — разные события, а повтор узнаётся и в другой корзине
+    click = dict(page_view(), action_type='click', event_id='e1')
+    assert event_filter.dedup_key(click, now=1000) != event_filter.dedup_key(dict(click, event_id='e2'), now=1000)
+    event_filter.remember([event_filter.dedup_key(click, now=1000)])
+    assert event_filter.check(click, BROWSER_UA, now=1100)[0] == DROP_DUPLICATE
+
+
+def test_prepare_batch_marks_dropped_events(monkeypatch):
+    event_filter = EventFilter(enabled=True, drop_bots=True)
+    monkeypatch.setattr(ingest, 'event_filter', event_filter)
+    events = [page_view(), page_view(), {'session_id': ''}, page_view(page_url='/about')]
+    results, rows, positions, keys = ingest.prepare_batch(events, {'user-agent': BROWSER_UA})
+
+    assert positions == [0, 3] and len(keys) == 2
+    assert results[1] == {'index': 1, 'success': True, 'dropped': DROP_DUPLICATE}
+    summary = ingest.batch_summary(events, rows, results)
+    assert (summary['accepted'], summary['dropped'], summary['rejected']) == (2, 1, 1)
+
+    # До remember() та же пачка проходит снова: её могли не сохранить
+    assert ingest.prepare_batch(events, {'user-agent': BROWSER_UA})[2] == [0, 3]
+    event_filter.remember(keys)
+    assert ingest.prepare_batch(events, {'user-agent': BROWSER_UA})[2] == []
+
+    bot_events = [page_view(session_id='bot')]
+    results, rows, _, _ = ingest.prepare_batch(bot_events, {'user-agent': BOT_UA})
+    summary = ingest.batch_summary(bot_events, rows, results)
+    assert summary['success'] and summary['dropped'] == 1 and summary['accepted'] == 0
+
+
+class FlakyBuffer:
+    def __init__(self, failures):
+        self.failures = failures
+        self.rows = []
+
+    def submit(self, rows, keys=None):
+        if self.failures:
+            self.failures -= 1
+            raise write_buffer.BufferFull('Write buffer is full')
+        self.rows.extend(rows)
+        # Сразу «записано»: ключи запоминаются, как после успешного сброса
+        ingest.event_filter.remember(keys or [])
+
+
+def test_event_retried_after_503_is_stored(monkeypatch):
+    from shared.loader import InvocationContext, load_function_module
+
+    analytics = load_function_module('analytics')
+    buffer = FlakyBuffer(failures=1)
+    monkeypatch.setenv('DATABASE_URL', 'postgresql://bench@localhost/analytics')
+    monkeypatch.setattr(write_buffer, 'get_write_buffer', lambda database_url: buffer)
+    monkeypatch.setattr(ingest, 'event_filter', EventFilter(enabled=True, drop_bots=True))
+
+    def post():
+        event = {'httpMethod': 'POST', 'headers': {'user-agent': BROWSER_UA},
+                 'body': json.dumps(page_view())}
+        return analytics.handler(event, InvocationContext('analytics'))
+
+    assert post()['statusCode'] == 503
+    response = post()
+    assert response['statusCode'] == 202 and len(buffer.rows) == 1
+    # Сохранённое событие уже помнится: третий повтор отбрасывается
+    assert json.loads(post()['body'])['dropped'] == 1 and len(buffer.rows) == 1
+
+
+def test_event_retried_after_failed_flush_is_not_dropped(monkeypatch):
+    from shared.loader import InvocationContext, load_function_module
+
+    analytics = load_function_module('analytics')
+    written, failures = [], [1]
+
+    def write_rows(rows):
+        if failures[0]:
+            failures[0] -= 1
+            raise RuntimeError('database is down')
+        written.extend(rows)
+
+    buffer = write_buffer.WriteBuffer(write_rows, max_events=100, flush_interval_ms=60000,
+                                      on_written=lambda keys: ingest.event_filter.remember(keys))
+    monkeypatch.setenv('DATABASE_URL', 'postgresql://bench@localhost/analytics')
+    monkeypatch.setattr(write_buffer, 'get_write_buffer', lambda database_url: buffer)
+    monkeypatch.setattr(ingest, 'event_filter', EventFilter(enabled=True, drop_bots=True))
+
+    def post():
+        event = {'httpMethod': 'POST', 'headers': {'user-agent': BROWSER_UA},
+                 'body': json.dumps(page_view())}
+        return json.loads(analytics.handler(event, InvocationContext('analytics'))['body'])
+
+    assert post()['accepted'] == 1
+    assert buffer.flush() == 0 and not written
+    # Сброс не удался: повтор клиента принимается, а не считается дублем
+    assert post()['accepted'] == 1
+    assert buffer.flush() == 2 and len(written) == 2
+    assert post()['dropped'] == 1
+    buffer.close()
+
+
+def test_invalid_single_event_is_rejected_with_and_without_buffer(monkeypatch):
+    from shared.loader import InvocationContext, load_function_module
+
+    analytics = load_function_module('analytics')
+    monkeypatch.setenv('DATABASE_URL', 'postgresql://bench@localhost/analytics')
+    event = {'httpMethod': 'POST', 'headers': {'user-agent': BROWSER_UA},
+             'body': json.dumps({'session_id': 's1', 'action_type': 'page_view', 'page_url': 42})}
+
+    for buffer in (FlakyBuffer(failures=0), None):
+        monkeypatch.setattr(write_buffer, 'get_write_buffer', lambda database_url: buffer)
+        response = analytics.handler(event, InvocationContext('analytics'))
+        assert response['statusCode'] == 400
+        assert json.loads(response['body'])['error'] == 'page_url must be a string'
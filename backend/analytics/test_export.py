@@ -0,0 +1,108 @@
+import csv
+import gzip
+import io
+import json
+import os
+import sys
+from datetime import datetime, timezone
+
+import pytest
+
+ANALYTICS_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(ANALYTICS_DIR)
+for path in (ANALYTICS_DIR, BACKEND_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from export import EXPORT_COLUMNS, build_export_query, iter_export_rows, parse_export_params, write_export
+
+
+def make_row(row_id):
+    values = {
+        'id': row_id, 'timestamp': datetime(2025, 3, 1, 12, 0, row_id % 60, tzinfo=timezone.utc),
+        'session_id': f's{row_id}', 'action_type': 'page_view', 'action_details': {'page': 'x', 'n': row_id},
+        'page_url': '/catalog', 'referrer': '', 'browser': 'Chrome', 'browser_major': '120', 'os': 'Android',
+        'device_class': 'mobile', 'is_bot': False, 'ip_address': '10.0.0.1', 'user_agent': 'Mozilla/5.0'
+    }
+    return tuple(values[column] for column in EXPORT_COLUMNS)
+
+
+class FakeNamedCursor:
+    def __init__(self, conn, name):
+        self.conn = conn
+        self.name = name
+        self.itersize = 0
+        self.closed = False
+
+    def execute(self, query, args):
+        self.conn.executed.append((query, args))
+
+    def __iter__(self):
+        return iter(self.conn.rows)
+
+    def close(self):
+        self.closed = True
+
+
+class FakeConnection:
+    def __init__(self, rows):
+        self.rows = rows
+        self.executed = []
+        self.cursors = []
+        self.rolled_back = False
+
+    def cursor(self, name=None):
+        cur = FakeNamedCursor(self, name)
+        self.cursors.append(cur)
+        return cur
+
+    def rollback(self):
+        self.rolled_back = True
+
+
+def test_parse_export_params_validates_range_and_format():
+    filters = parse_export_params({'from': '2025-03-01', 'to': '2025-03-02T00:00:00Z',
+                                   'action_type': 'page_view, click', 'format': 'csv', 'after_id': '42'})
+    assert filters['since'] == datetime(2025, 3, 1, tzinfo=timezone.utc)
+    assert filters['action_types'] == ['page_view', 'click']
+    assert filters['after_id'] == 42
+
+    for params in ({'from': '2025-03-02', 'to': '2025-03-01'}, {'format': 'xml'},
+                   {'from': 'yesterday'}, {'days': '1000'}):
+        with pytest.raises(ValueError):
+            parse_export_params(params)
+
+
+def test_export_query_uses_keyset_continuation():
+    query, args = build_export_query(parse_export_params({'days': '1', 'after_id': '7', 'limit': '10'}))
+    assert 'id > %s' in query and 'ORDER BY id' in query and 'OFFSET' not in query
+    assert args[2] == 7 and args[-1] == 11
+    assert 'action_type' not in query.split('WHERE')[1]
+
+
+def test_export_pages_ndjson_through_named_cursor():
+    conn = FakeConnection([make_row(row_id) for row_id in range(1, 6)])
+    filters = parse_export_params({'days': '1', 'limit': '3'})
+    rows = iter_export_rows(conn, filters, fetch_size=2)
+    body, count, next_after = write_export(rows, filters)
+    rows.close()
+
+    records = [json.loads(line) for line in body.decode('utf-8').splitlines()]
+    assert count == 3 and next_after == 3
+    assert [record['id'] for record in records] == [1, 2, 3]
+    assert records[0]['action_details'] == {'page': 'x', 'n': 1}
+    assert records[0]['timestamp'].startswith('2025-03-01T12:00:01')
+    assert conn.cursors[0].name and conn.cursors[0].itersize == 2
+    assert conn.cursors[0].closed and conn.rolled_back
+
+    _, count, next_after = write_export(iter([make_row(4), make_row(5)]), filters)
+    assert count == 2 and next_after is None
+
+
+def test_export_csv_gzip():
+    filters = parse_export_params({'days': '1', 'format': 'csv'})
+    body, count, _ = write_export(iter([make_row(1), make_row(2)]), filters, compress=True)
+    table = list(csv.reader(io.StringIO(gzip.decompress(body).decode('utf-8'))))
+    assert count == 2
+    assert table[0] == list(EXPORT_COLUMNS)
+    assert json.loads(table[1][EXPORT_COLUMNS.index('action_details')]) == {'page': 'x', 'n': 1}
@@ -0,0 +1,127 @@
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+ANALYTICS_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(ANALYTICS_DIR)
+for path in (ANALYTICS_DIR, BACKEND_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+import dashboard
+import response_cache
+from response_cache import ResponseCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(response_cache.time, 'monotonic', lambda: now[0])
+    return now
+
+
+def wait_idle(cache):
+    # time.monotonic подменён часами теста, поэтому ожидание считается по perf_counter
+    deadline = time.perf_counter() + 2
+    while cache.stats()['in_flight'] and time.perf_counter() < deadline:
+        time.sleep(0.005)
+
+
+def test_entry_expires_after_ttl_and_stale_window(clock):
+    cache = ResponseCache(ttl=30, stale_ttl=60, staleness_rows=100)
+    values = iter(['v1', 'v2', 'v3'])
+    compute = lambda: next(values)
+
+    assert cache.get_or_compute('k', 0, compute) == ('v1', 'miss')
+    clock[0] += 29
+    assert cache.get_or_compute('k', 100, compute) == ('v1', 'hit')
+
+    # После TTL отдаётся прежний ответ, а пересчёт идёт в фоне
+    clock[0] += 1
+    assert cache.get_or_compute('k', 100, compute) == ('v1', 'stale')
+    wait_idle(cache)
+    assert cache.get_or_compute('k', 100, compute) == ('v2', 'hit')
+
+    clock[0] += 91
+    assert cache.get_or_compute('k', 100, compute) == ('v3', 'miss')
+
+
+def test_watermark_jump_makes_entry_stale(clock):
+    cache = ResponseCache(ttl=30, stale_ttl=60, staleness_rows=100)
+    cache.get_or_compute('k', 0, lambda: 'v1')
+    assert cache.get_or_compute('k', 101, lambda: 'v2') == ('v1', 'stale')
+    wait_idle(cache)
+    assert cache.get_or_compute('k', 101, lambda: 'v3') == ('v2', 'hit')
+
+
+def test_least_recently_used_entry_is_evicted(clock):
+    cache = ResponseCache(ttl=30, max_entries=2)
+    cache.get_or_compute('a', 0, lambda: 'a')
+    cache.get_or_compute('b', 0, lambda: 'b')
+    cache.get_or_compute('a', 0, lambda: 'a2')
+    cache.get_or_compute('c', 0, lambda: 'c')
+
+    assert cache.get_or_compute('a', 0, lambda: 'a3') == ('a', 'hit')
+    assert cache.get_or_compute('b', 0, lambda: 'b2') == ('b2', 'miss')
+    assert cache.stats()['evictions'] == 2
+
+
+def test_concurrent_misses_share_one_computation():
+    cache = ResponseCache(ttl=30)
+    started, release, calls = threading.Event(), threading.Event(), []
+
+    def compute():
+        calls.append(1)
+        started.set()
+        release.wait(2)
+        return 'value'
+
+    results = []
+    owner = threading.Thread(target=lambda: results.append(cache.get_or_compute('k', 0, compute)))
+    owner.start()
+    assert started.wait(2)
+    waiters = [threading.Thread(target=lambda: results.append(cache.get_or_compute('k', 0, compute)))
+               for _ in range(4)]
+    for thread in waiters:
+        thread.start()
+    deadline = time.monotonic() + 2
+    while cache.stats()['shared'] < 4 and time.monotonic() < deadline:
+        time.sleep(0.005)
+    release.set()
+    for thread in [owner, *waiters]:
+        thread.join(2)
+
+    assert len(calls) == 1
+    assert sorted(status for _, status in results) == ['miss'] + ['shared'] * 4
+
+
+def test_failed_computation_is_raised_and_not_cached():
+    cache = ResponseCache(ttl=30)
+
+    def fail():
+        raise RuntimeError('database is down')
+
+    with pytest.raises(RuntimeError):
+        cache.get_or_compute('k', 0, fail)
+    assert cache.stats()['errors'] == 1
+    assert cache.get_or_compute('k', 0, lambda: 'value') == ('value', 'miss')
+
+
+def test_ingest_watermark_is_read_at_most_once_per_interval(monkeypatch):
+    now, reads = [1000.0], []
+    monkeypatch.setattr(dashboard.time, 'monotonic', lambda: now[0])
+    monkeypatch.setattr(dashboard, '_watermarks', {})
+    monkeypatch.setattr(dashboard, 'WATERMARK_REFRESH_SECONDS', 10)
+
+    def read_ingest_watermark(database_url):
+        reads.append(database_url)
+        return len(reads)
+
+    monkeypatch.setattr(dashboard, 'read_ingest_watermark', read_ingest_watermark)
+
+    assert [dashboard.ingest_watermark('db') for _ in range(5)] == [1] * 5
+    now[0] += 10
+    assert dashboard.ingest_watermark('db') == 2 and len(reads) == 2
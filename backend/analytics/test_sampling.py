@@ -0,0 +1,66 @@
+import os
+import sys
+from datetime import date
+
+ANALYTICS_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(ANALYTICS_DIR)
+for path in (ANALYTICS_DIR, BACKEND_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from query_engine import shape_dashboard
+from sampling import SAMPLE_MODULUS, attach_intervals, sampled_unique_rows, scaled_estimate
+
+
+class FakeCursor:
+    def __init__(self, results):
+        self.results = list(results)
+        self.executed = []
+
+    def execute(self, query, params=None):
+        self.executed.append((query, params))
+
+    def fetchone(self):
+        return self.results.pop(0)
+
+    def fetchall(self):
+        return self.results.pop(0)
+
+
+def test_scaled_estimate_interval_covers_estimate():
+    estimate, (low, high) = scaled_estimate(100, 100)
+    assert estimate == 100 * SAMPLE_MODULUS
+    assert low < estimate < high
+    # Посетители с многими сессиями делают интервал шире
+    _, (clustered_low, clustered_high) = scaled_estimate(100, 1000)
+    assert clustered_high - clustered_low > high - low
+    assert scaled_estimate(0, 0) == (0, [0, 0])
+
+
+def test_sampled_rows_feed_dashboard_with_intervals():
+    day = date(2025, 3, 1)
+    cur = FakeCursor([
+        (42,),
+        [
+            ('summary_unique', None, None, 10, 12, 16),
+            ('daily_unique', None, day, 10, 12, 16),
+            ('pages_unique', '/catalog', None, 4, 5, 7),
+        ]
+    ])
+    rows, intervals = sampled_unique_rows(cur, 7)
+    assert cur.executed[1][1] == {'days': 7, 'last_id': 42}
+    assert "%% 20 = 0" in cur.executed[1][0]
+
+    counts = [('summary', None, None, None, 900, None, None), ('daily', None, day, None, 900, None, None),
+              ('pages', '/catalog', None, None, 300, None, None)]
+    result = attach_intervals(shape_dashboard(counts + rows, 7), intervals)
+
+    assert result['summary']['total_actions'] == 900
+    assert result['summary']['unique_sessions'] == 12 * SAMPLE_MODULUS
+    assert result['summary']['unique_visitors'] == 10 * SAMPLE_MODULUS
+    low, high = result['summary']['unique_sessions_ci']
+    assert low < result['summary']['unique_sessions'] < high
+    assert result['daily_stats'][0]['sessions_ci'] == result['summary']['unique_sessions_ci']
+    assert result['popular_pages'][0]['unique_visits'] == 5 * SAMPLE_MODULUS
+    assert result['popular_pages'][0]['unique_visits_ci'] == intervals[('pages_unique', '/catalog')]['sessions']
+    assert result['unique_counts'] == 'sampled' and result['sample']['rate'] == 1 / SAMPLE_MODULUS
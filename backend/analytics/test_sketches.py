@@ -0,0 +1,41 @@
+import hashlib
+import os
+import sys
+
+import pytest
+
+ANALYTICS_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(ANALYTICS_DIR)
+for path in (ANALYTICS_DIR, BACKEND_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from hll import FORMAT_VERSION, HyperLogLog
+
+
+def sql_register(value):
+    '''То же вычисление, что в V0017, на битовой строке хэша'''
+    bits = format(int(hashlib.md5(value.encode('utf-8')).hexdigest()[:16], 16), '064b')
+    rank = bits[12:].find('1') + 1
+    return int(bits[:12], 2), rank or 53
+
+
+def test_sketch_matches_sql_backfill_layout():
+    values = [f'session-{i}' for i in range(5000)] + ['10.0.0.1', 'сессия']
+    sketch = HyperLogLog()
+    sketch.update(values)
+
+    registers = bytearray(1 << 12)
+    for value in values:
+        register, rank = sql_register(value)
+        registers[register] = max(registers[register], rank)
+
+    assert sketch.to_bytes() == bytes((FORMAT_VERSION, 12)) + bytes(registers)
+    assert abs(HyperLogLog.from_bytes(sketch.to_bytes()).count() - 5002) < 5002 * 0.05
+
+
+def test_sketch_rejects_previous_format():
+    data = bytearray(HyperLogLog().to_bytes())
+    data[0] = 1
+    with pytest.raises(ValueError):
+        HyperLogLog.from_bytes(bytes(data))
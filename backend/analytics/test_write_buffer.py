@@ -0,0 +1,128 @@
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+ANALYTICS_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(ANALYTICS_DIR)
+for path in (ANALYTICS_DIR, BACKEND_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from write_buffer import BufferFull, WriteBuffer
+
+
+class Sink:
+    '''write_rows для буфера: копит строки, первые failures вызовов падают'''
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.calls = 0
+        self.rows = []
+        self.written = threading.Event()
+
+    def __call__(self, rows):
+        self.calls += 1
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError('database is down')
+        self.rows.extend(rows)
+        self.written.set()
+
+
+@pytest.fixture
+def buffers():
+    created = []
+
+    def make(*args, **kwargs):
+        created.append(WriteBuffer(*args, **kwargs))
+        return created[-1]
+
+    yield make
+    for buffer in created:
+        buffer.close()
+
+
+def test_flushes_when_batch_is_full(buffers):
+    sink = Sink()
+    buffer = buffers(sink, max_events=3, flush_interval_ms=60000)
+    buffer.submit([(1,), (2,)])
+    assert not sink.written.wait(0.05)
+
+    buffer.submit([(3,)])
+    assert sink.written.wait(1) and sink.rows == [(1,), (2,), (3,)]
+
+
+def test_flushes_oldest_event_after_interval(buffers):
+    sink = Sink()
+    buffer = buffers(sink, max_events=100, flush_interval_ms=20)
+    started = time.monotonic()
+    buffer.submit([(1,)])
+
+    assert sink.written.wait(1) and sink.rows == [(1,)]
+    assert time.monotonic() - started >= 0.02
+
+
+def test_full_buffer_rejects_after_block_timeout(buffers):
+    sink = Sink()
+    buffer = buffers(sink, max_events=4, flush_interval_ms=60000, capacity=4, block_timeout_ms=10)
+    buffer.submit([(1,), (2,), (3,)])
+
+    with pytest.raises(BufferFull):
+        buffer.submit([(4,), (5,)])
+    with pytest.raises(BufferFull):
+        buffer.submit([(n,) for n in range(5)])
+    stats = buffer.stats()
+    assert (stats['depth'], stats['rejected']) == (3, 7) and not sink.rows
+
+
+def test_failed_flush_requeues_batch_in_order_with_keys(buffers):
+    sink, written_keys = Sink(failures=1), []
+    buffer = buffers(sink, max_events=10, flush_interval_ms=60000, on_written=written_keys.extend)
+    buffer.submit([(1,), (2,)], keys=[b'a', b'b'])
+    buffer.submit([(3,)], keys=[b'c'])
+
+    assert buffer.flush() == 0 and buffer.stats()['depth'] == 3 and not written_keys
+    assert buffer.flush() == 3
+    assert sink.rows == [(1,), (2,), (3,)] and written_keys == [b'a', b'b', b'c']
+    stats = buffer.stats()
+    assert (stats['flush_errors'], stats['flushed'], stats['dropped']) == (1, 3, 0)
+
+
+def test_failed_flushes_back_off_instead_of_spinning(buffers):
+    sink = Sink(failures=1000)
+    # Очередь не меньше max_events: без паузы поток повторял бы запись без остановки
+    buffer = buffers(sink, max_events=1, flush_interval_ms=0, retry_base_ms=50, retry_max_ms=1000)
+    buffer.submit([(1,)])
+    time.sleep(0.3)
+
+    # Попытки в 0, 50, 150 мс и следующая не раньше 350 мс
+    assert 2 <= sink.calls <= 4
+    assert buffer.stats()['depth'] == 1
+
+    sink.failures = 0
+    assert buffer.flush() == 1 and sink.rows == [(1,)]
+
+
+def test_requeue_drops_events_older_than_max_age(buffers):
+    sink = Sink(failures=1)
+    buffer = buffers(sink, max_events=10, flush_interval_ms=60000, max_age_ms=0)
+    buffer.submit([(1,), (2,)])
+
+    assert buffer.flush() == 0
+    stats = buffer.stats()
+    assert (stats['depth'], stats['dropped']) == (0, 2)
+
+
+def test_close_drains_queue_and_stops_thread(buffers):
+    sink = Sink()
+    buffer = buffers(sink, max_events=100, flush_interval_ms=60000)
+    buffer.submit([(1,), (2,)])
+    thread = buffer._thread
+
+    buffer.close()
+    assert sink.rows == [(1,), (2,)] and not thread.is_alive()
+    with pytest.raises(BufferFull):
+        buffer.submit([(3,)])
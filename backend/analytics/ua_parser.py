@@ -0,0 +1,97 @@
+import os
+import re
+from functools import lru_cache
+from typing import NamedTuple, Optional
+
+# Различных user-agent немного, поэтому разбор кэшируется
+UA_CACHE_SIZE = int(os.environ.get('ANALYTICS_UA_CACHE_SIZE', '2048'))
+# Хвост длинных строк на классификацию не влияет, а ключ кэша раздувает
+UA_MAX_LENGTH = 512
+
+# Шаблоны ниже повторены в SQL-функциях analytics_ua_* (V0018), которыми разобраны
+# старые строки user_actions: менять только вместе с ними
+
+BOT_PATTERN = re.compile(
+    r'bot\b|bot/|crawl|spider|slurp|bingpreview|mediapartners|facebookexternalhit|'
+    r'headless|lighthouse|pingdom|uptime|curl/|wget/|python-requests|python-urllib|'
+    r'httpclient|okhttp|java/|go-http-client|scrapy|phantomjs|yandex(?:bot|images|metrika)',
+    re.IGNORECASE
+)
+
+# Порядок важен: Edge/Opera/Yandex/Samsung содержат "Chrome", Chrome содержит "Safari"
+BROWSER_PATTERNS = (
+    ('Edge', re.compile(r'(?:Edg|Edge|EdgA|EdgiOS)/(\d+)')),
+    ('Opera', re.compile(r'(?:OPR|Opera)/(\d+)')),
+    ('Yandex', re.compile(r'YaBrowser/(\d+)')),
+    ('Samsung', re.compile(r'SamsungBrowser/(\d+)')),
+    ('Firefox', re.compile(r'(?:Firefox|FxiOS)/(\d+)')),
+    ('Chrome', re.compile(r'(?:Chrome|CriOS)/(\d+)')),
+    ('Safari', re.compile(r'Version/(\d+).*Safari/')),
+    ('Safari', re.compile(r'Safari/()')),
+)
+
+OS_PATTERNS = (
+    ('Windows', re.compile(r'Windows')),
+    ('Android', re.compile(r'Android')),
+    ('iOS', re.compile(r'iPhone|iPad|iPod')),
+    ('ChromeOS', re.compile(r'CrOS')),
+    ('macOS', re.compile(r'Macintosh|Mac OS X')),
+    ('Linux', re.compile(r'Linux')),
+)
+
+TABLET_PATTERN = re.compile(r'iPad|Tablet|Android(?!.*Mobile)')
+MOBILE_PATTERN = re.compile(r'Mobi|iPhone|iPod|Android.*Mobile|Windows Phone')
+
+
+class ParsedUserAgent(NamedTuple):
+    browser: str
+    browser_major: Optional[int]
+    os: str
+    device_class: str
+    is_bot: bool
+
+
+@lru_cache(maxsize=UA_CACHE_SIZE)
+def _parse(user_agent: str) -> ParsedUserAgent:
+    is_bot = bool(BOT_PATTERN.search(user_agent))
+
+    browser, browser_major = 'Other', None
+    for name, pattern in BROWSER_PATTERNS:
+        match = pattern.search(user_agent)
+        if match:
+            browser = name
+            browser_major = int(match.group(1)) if match.group(1) else None
+            break
+
+    os_name = 'Other'
+    for name, pattern in OS_PATTERNS:
+        if pattern.search(user_agent):
+            os_name = name
+            break
+
+    if is_bot:
+        device_class = 'bot'
+    elif TABLET_PATTERN.search(user_agent):
+        device_class = 'tablet'
+    elif MOBILE_PATTERN.search(user_agent):
+        device_class = 'mobile'
+    elif user_agent:
+        device_class = 'desktop'
+    else:
+        device_class = 'other'
+
+    # SMALLINT в базе
+    if browser_major is not None and browser_major > 32767:
+        browser_major = None
+
+    return ParsedUserAgent(browser, browser_major, os_name, device_class, is_bot)
+
+
+def parse_user_agent(user_agent: Optional[str]) -> ParsedUserAgent:
+    '''Разбирает user-agent на браузер, мажорную версию, ОС, класс устройства и признак бота'''
+    return _parse((user_agent or '')[:UA_MAX_LENGTH])
+
+
+def cache_info() -> dict:
+    info = _parse.cache_info()
+    return {'hits': info.hits, 'misses': info.misses, 'size': info.currsize, 'max_size': info.maxsize}
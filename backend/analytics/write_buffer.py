@@ -0,0 +1,258 @@
+import atexit
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict, Any, Callable, Deque, List, Optional, Tuple
+
+from shared import metrics
+from shared.db import get_pool
+import ingest
+
+# Буфер выключен по умолчанию: POST пишет в базу синхронно
+WRITE_BUFFER_ENABLED = os.environ.get('ANALYTICS_WRITE_BUFFER', '0') == '1'
+FLUSH_MAX_EVENTS = int(os.environ.get('ANALYTICS_BUFFER_FLUSH_EVENTS', '200'))
+FLUSH_INTERVAL_MS = int(os.environ.get('ANALYTICS_BUFFER_FLUSH_MS', '500'))
+BUFFER_CAPACITY = int(os.environ.get('ANALYTICS_BUFFER_CAPACITY', '10000'))
+BLOCK_TIMEOUT_MS = int(os.environ.get('ANALYTICS_BUFFER_BLOCK_MS', '200'))
+# Пауза после неудачного сброса растёт вдвое с каждой ошибкой подряд, до RETRY_MAX_MS
+RETRY_BASE_MS = int(os.environ.get('ANALYTICS_BUFFER_RETRY_BASE_MS', '100'))
+RETRY_MAX_MS = int(os.environ.get('ANALYTICS_BUFFER_RETRY_MAX_MS', '5000'))
+# События, которые не удаётся записать дольше этого срока, отбрасываются
+MAX_EVENT_AGE_MS = int(os.environ.get('ANALYTICS_BUFFER_MAX_AGE_MS', '300000'))
+
+
+class BufferFull(Exception):
+    '''Буфер заполнен и не освободился за время ожидания'''
+
+
+# (время постановки, строка для INSERT, ключ повтора для event_filter или None)
+Entry = Tuple[float, Tuple, Optional[bytes]]
+
+
+class WriteBuffer:
+    '''
+    Write-behind буфер событий с групповым коммитом.
+    Фоновый поток сбрасывает события пачкой, когда набралось max_events
+    или самое старое событие ждёт дольше flush_interval_ms. Ключи повторов
+    передаются в on_written только после успешной записи пачки.
+
+    Неудачная пачка возвращается в начало очереди, а следующий сброс ждёт
+    экспоненциальную паузу. Пока база недоступна, очередь не растёт сверх
+    capacity: новые события получают BufferFull (клиент повторит), а из
+    возвращаемой пачки отбрасываются не поместившиеся и старше max_age_ms.
+    '''
+
+    def __init__(self, write_rows: Callable[[List[Tuple]], None],
+                 max_events: int = FLUSH_MAX_EVENTS,
+                 flush_interval_ms: int = FLUSH_INTERVAL_MS,
+                 capacity: int = BUFFER_CAPACITY,
+                 block_timeout_ms: int = BLOCK_TIMEOUT_MS,
+                 on_written: Optional[Callable[[List[Optional[bytes]]], None]] = None,
+                 retry_base_ms: int = RETRY_BASE_MS,
+                 retry_max_ms: int = RETRY_MAX_MS,
+                 max_age_ms: int = MAX_EVENT_AGE_MS):
+        self.write_rows = write_rows
+        self.on_written = on_written
+        self.max_events = max(1, max_events)
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.capacity = max(self.max_events, capacity)
+        self.block_timeout = block_timeout_ms / 1000.0
+        self.retry_base = retry_base_ms / 1000.0
+        self.retry_max = max(self.retry_base, retry_max_ms / 1000.0)
+        self.max_age = max_age_ms / 1000.0
+
+        self._queue: Deque[Entry] = deque()
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._closed = False
+        self._thread: Optional[threading.Thread] = None
+        # Ошибки сброса подряд и момент, раньше которого фоновый поток не повторяет запись
+        self._failures = 0
+        self._retry_at = 0.0
+        self._stats = {
+            'enqueued': 0,
+            'flushed': 0,
+            'flushes': 0,
+            'flush_errors': 0,
+            'rejected': 0,
+            'dropped': 0,
+            'max_depth': 0,
+            'last_flush_ms': 0.0,
+            'max_flush_ms': 0.0,
+            'total_flush_ms': 0.0
+        }
+
+    def _ensure_thread(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='analytics-write-buffer', daemon=True)
+            self._thread.start()
+
+    def submit(self, rows: List[Tuple], keys: Optional[List[Optional[bytes]]] = None) -> None:
+        '''Кладёт строки в буфер; если места нет, ждёт block_timeout и бросает BufferFull'''
+        if not rows:
+            return
+        keys = keys if keys is not None else [None] * len(rows)
+        if len(rows) > self.capacity:
+            with self._cond:
+                self._stats['rejected'] += len(rows)
+            raise BufferFull('Batch is larger than buffer capacity')
+
+        deadline = time.monotonic() + self.block_timeout
+        with self._cond:
+            if self._closed:
+                raise BufferFull('Buffer is closed')
+            while len(self._queue) + len(rows) > self.capacity:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats['rejected'] += len(rows)
+                    raise BufferFull('Write buffer is full')
+                self._cond.notify_all()
+                self._cond.wait(remaining)
+
+            now = time.monotonic()
+            self._queue.extend((now, row, key) for row, key in zip(rows, keys))
+            self._stats['enqueued'] += len(rows)
+            self._stats['max_depth'] = max(self._stats['max_depth'], len(self._queue))
+            if len(self._queue) >= self.max_events:
+                self._cond.notify_all()
+        self._ensure_thread()
+
+    def _take_batch(self) -> List[Entry]:
+        count = min(self.max_events, len(self._queue))
+        batch = [self._queue.popleft() for _ in range(count)]
+        self._cond.notify_all()
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._closed:
+                    backoff = self._retry_at - time.monotonic()
+                    if backoff > 0:
+                        # Даже полная очередь не сбрасывается раньше паузы после ошибки
+                        self._cond.wait(backoff)
+                        continue
+                    if len(self._queue) >= self.max_events:
+                        break
+                    if self._queue:
+                        wait = self._queue[0][0] + self.flush_interval - time.monotonic()
+                        if wait <= 0:
+                            break
+                        self._cond.wait(wait)
+                    else:
+                        self._cond.wait()
+                if self._closed:
+                    return
+                batch = self._take_batch()
+            self._write(batch)
+
+    def _write(self, batch: List[Entry]) -> bool:
+        '''Пишет пачку. Returns: False, если запись не удалась и пачка вернулась в очередь'''
+        if not batch:
+            return True
+        started = time.perf_counter()
+        with self._flush_lock:
+            try:
+                self.write_rows([row for _, row, _ in batch])
+            except Exception as e:
+                metrics.log_event('analytics_write_buffer_flush_failed', rows=len(batch), error=str(e))
+                with self._cond:
+                    self._stats['flush_errors'] += 1
+                    self._failures += 1
+                    delay = min(self.retry_base * 2 ** (self._failures - 1), self.retry_max)
+                    self._retry_at = time.monotonic() + delay
+                self._requeue(batch)
+                return False
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        # Счётчики меняются под тем же замком, под которым их читает stats()
+        with self._cond:
+            self._failures = 0
+            self._retry_at = 0.0
+            self._stats['flushes'] += 1
+            self._stats['flushed'] += len(batch)
+            self._stats['last_flush_ms'] = round(elapsed_ms, 2)
+            self._stats['max_flush_ms'] = round(max(self._stats['max_flush_ms'], elapsed_ms), 2)
+            self._stats['total_flush_ms'] += elapsed_ms
+        if self.on_written is not None:
+            self.on_written([key for _, _, key in batch])
+        return True
+
+    def _requeue(self, batch: List[Entry]) -> None:
+        '''Возвращает неудачную пачку в начало очереди, кроме устаревших и не поместившихся'''
+        with self._cond:
+            cutoff = time.monotonic() - self.max_age
+            fresh = [entry for entry in batch if entry[0] >= cutoff]
+            room = max(0, self.capacity - len(self._queue))
+            keep = fresh[:room]
+            # Время постановки сохраняется: по нему считается возраст события
+            self._queue.extendleft(reversed(keep))
+            expired, overflow = len(batch) - len(fresh), len(fresh) - len(keep)
+            self._stats['dropped'] += expired + overflow
+        if expired or overflow:
+            metrics.log_event('analytics_write_buffer_dropped', expired=expired, overflow=overflow)
+
+    def flush(self) -> int:
+        '''Синхронно сбрасывает всё, что сейчас лежит в буфере'''
+        total = 0
+        while True:
+            with self._cond:
+                batch = self._take_batch()
+            if not batch:
+                return total
+            if not self._write(batch):
+                return total
+            total += len(batch)
+
+    def close(self) -> None:
+        '''Останавливает фоновый поток и сбрасывает остаток (вызывается при завершении)'''
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self.flush()
+        with self._cond:
+            lost = len(self._queue)
+        if lost:
+            metrics.log_event('analytics_write_buffer_lost_on_close', rows=lost)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            depth = len(self._queue)
+            oldest_age_ms = (time.monotonic() - self._queue[0][0]) * 1000 if self._queue else 0.0
+            counters = dict(self._stats)
+        flushes = counters['flushes']
+        return {
+            'enabled': True,
+            'depth': depth,
+            'capacity': self.capacity,
+            'oldest_event_age_ms': round(oldest_age_ms, 2),
+            'avg_flush_ms': round(counters['total_flush_ms'] / flushes, 2) if flushes else 0.0,
+            **{k: v for k, v in counters.items() if k != 'total_flush_ms'}
+        }
+
+
+_buffer: Optional[WriteBuffer] = None
+_buffer_lock = threading.Lock()
+
+
+def get_write_buffer(database_url: str) -> Optional[WriteBuffer]:
+    '''Возвращает общий буфер процесса, если он включён ANALYTICS_WRITE_BUFFER=1'''
+    global _buffer
+    if not WRITE_BUFFER_ENABLED:
+        return None
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                def write_rows(rows: List[Tuple]) -> None:
+                    with get_pool(database_url).connection() as conn:
+                        with conn.cursor() as cur:
+                            ingest.insert_rows(cur, rows, returning=False)
+                        conn.commit()
+
+                # Повторы запоминаются, только когда пачка уже в базе: иначе ретрай
+                # клиента после неудачного сброса отбросился бы как дубль
+                _buffer = WriteBuffer(write_rows, on_written=lambda keys: ingest.event_filter.remember(keys))
+                atexit.register(_buffer.close)
+    return _buffer
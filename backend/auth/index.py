@@ -1,162 +1,138 @@
-import json
 import os
-import psycopg2
-import bcrypt
-import jwt
-from datetime import datetime, timedelta
+import sys
 from typing import Dict, Any
 
-def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
-    '''
-    Business: Авторизация админ пользователей
-    Args: event - dict с httpMethod, body, headers
-          context - объект с атрибутами request_id, function_name и др.
-    Returns: HTTP response dict с JWT токеном или ошибкой
-    '''
-    method: str = event.get('httpMethod', 'GET')
-    
-    # Handle CORS OPTIONS request
-    if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, Authorization',
-                'Access-Control-Max-Age': '86400'
-            },
-            'body': ''
-        }
-    
-    if method != 'POST':
-        return {
-            'statusCode': 405,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Method not allowed'})
-        }
-    
-    # Получаем строку подключения к БД
-    database_url = os.environ.get('DATABASE_URL')
-    if not database_url:
-        return {
-            'statusCode': 500,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Database connection not configured'})
-        }
-    
+# Общие модули: в репозитории — backend/shared, в развёрнутой функции — их копия
+# в shared/ рядом с index.py (python -m shared.vendor)
+SHARED_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if SHARED_ROOT not in sys.path:
+    sys.path.insert(0, SHARED_ROOT)
+
+from shared import metrics
+from shared.runtime import HttpError, Router, json_response, lazy_import, parse_json_body, require_database_url
+from shared.tokens import get_token_verifier
+
+from throttle import client_ip, login_throttle
+
+# psycopg2 и bcrypt загружаются только на пути входа, не при OPTIONS
+db = lazy_import('shared.db')
+passwords = lazy_import('password_service')
+
+router = Router('GET, POST, OPTIONS', name='auth')
+
+metrics.register_collector('auth_throttle', login_throttle.stats)
+metrics.register_collector('bcrypt', lambda: passwords.get_password_service().stats())
+
+
+@router.route('GET', 'stats', admin=True)
+def throttle_stats(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    # Счётчики троттлинга и пула bcrypt
+    return json_response(200, {
+        'throttle': login_throttle.stats(),
+        'bcrypt': passwords.get_password_service().stats()
+    })
+
+
+@router.route('POST')
+def login(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    database_url = require_database_url()
+
+    body_data = parse_json_body(event)
+    username = body_data.get('username', '')
+    password = body_data.get('password', '')
+
+    if not username or not password:
+        raise HttpError(400, 'Username and password required')
+
+    # Перебор паролей отсекается до запроса к базе и bcrypt
+    ip_address = client_ip(event.get('headers') or {})
+    throttled = login_throttle.check_local(username, ip_address)
+    if throttled is not None:
+        raise_throttled(throttled, ip_address)
+
+    # Подключаемся к базе данных
+    conn = db.get_connection(database_url)
+    cur = conn.cursor()
     try:
-        body_data = json.loads(event.get('body', '{}'))
-        username = body_data.get('username', '')
-        password = body_data.get('password', '')
-        
-        # ВРЕМЕННО: Разрешаем вход с хардкод паролем для отладки
-        if username == "admin" and password == "temp123":
-            # Создаём временный токен
-            jwt_secret = os.environ.get('JWT_SECRET', 'default-secret-key-change-in-production')
-            payload = {
-                'user_id': 999,
-                'username': 'admin',
-                'exp': datetime.utcnow() + timedelta(hours=24),
-                'iat': datetime.utcnow()
-            }
-            token = jwt.encode(payload, jwt_secret, algorithm='HS256')
-            return {
-                'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({
-                    'success': True,
-                    'token': token,
-                    'user': {'id': 999, 'username': 'admin'}
-                })
-            }
-        
-        if not username or not password:
-            return {
-                'statusCode': 400,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'Username and password required'})
-            }
-        
-        # Подключаемся к базе данных
-        conn = psycopg2.connect(database_url)
-        cur = conn.cursor()
-        
+        if login_throttle.uses_database:
+            throttled = login_throttle.check_shared(cur, username, ip_address)
+            if throttled is not None:
+                raise_throttled(throttled, ip_address)
+
+        password_service = passwords.get_password_service()
+
         # Экранируем username для безопасности
         safe_username = username.replace("'", "''")
-        
+
         # Получаем пользователя (используем Simple Query Protocol)
         cur.execute(
             f"SELECT id, username, password_hash FROM admin_users WHERE username = '{safe_username}'"
         )
         user_data = cur.fetchone()
-        
+
         if not user_data:
-            return {
-                'statusCode': 401,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'Invalid credentials'})
-            }
-        
+            # Холостая проверка той же стоимости, чтобы по времени ответа нельзя было перебирать имена
+            try:
+                password_service.verify_dummy(password)
+            except passwords.PasswordServiceBusy:
+                pass
+            login_throttle.record_failure(username, ip_address, cur)
+            conn.commit()
+            raise HttpError(401, 'Invalid credentials')
+
         user_id, user_username, password_hash = user_data
-        
-        print(f"DEBUG: Found user - id: {user_id}, username: '{user_username}'")
-        print(f"DEBUG: Hash from DB: '{password_hash}'")
-        print(f"DEBUG: Hash from DB (repr): {repr(password_hash)}")
-        print(f"DEBUG: Hash from DB (bytes): {password_hash.encode('utf-8') if isinstance(password_hash, str) else password_hash}")
-        
+
         # Проверяем пароль
         hash_bytes = password_hash if isinstance(password_hash, bytes) else password_hash.encode('utf-8')
-        
-        print(f"DEBUG: Calling bcrypt.checkpw with password='{password}' (encoded) and hash={hash_bytes}")
-        password_match = bcrypt.checkpw(password.encode('utf-8'), hash_bytes)
-        print(f"DEBUG: bcrypt.checkpw result: {password_match}")
-        
+
+        # bcrypt в ограниченном пуле потоков; при перегрузке запрос ждёт в очереди или получает 503
+        try:
+            password_match = password_service.verify(password, hash_bytes)
+        except passwords.PasswordServiceBusy:
+            raise HttpError(503, 'Too many login attempts in progress, retry shortly', {'Retry-After': '1'})
+
         if not password_match:
-            return {
-                'statusCode': 401,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'Invalid credentials'})
-            }
-        
+            login_throttle.record_failure(username, ip_address, cur)
+            conn.commit()
+            raise HttpError(401, 'Invalid credentials')
+
+        # Хэш со старой стоимостью или схемой переписывается под BCRYPT_ROUNDS/BCRYPT_SCHEME
+        password_service.rehash_if_needed(cur, user_id, password, password_hash)
+        login_throttle.record_success(username, ip_address, cur)
+
         # Обновляем время последнего входа (используем Simple Query Protocol)
         cur.execute(
             f"UPDATE admin_users SET last_login = CURRENT_TIMESTAMP WHERE id = {user_id}"
         )
         conn.commit()
-        
-        # Создаем JWT токен
-        jwt_secret = os.environ.get('JWT_SECRET', 'default-secret-key-change-in-production')
-        payload = {
-            'user_id': user_id,
-            'username': user_username,
-            'exp': datetime.utcnow() + timedelta(hours=24),
-            'iat': datetime.utcnow()
-        }
-        
-        token = jwt.encode(payload, jwt_secret, algorithm='HS256')
-        
-        return {
-            'statusCode': 200,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({
-                'success': True,
-                'token': token,
-                'user': {
-                    'id': user_id,
-                    'username': user_username
-                }
-            })
-        }
-        
-    except Exception as e:
-        return {
-            'statusCode': 500,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': str(e)})
-        }
-    
     finally:
-        if 'cur' in locals():
-            cur.close()
-        if 'conn' in locals():
-            conn.close()
\ No newline at end of file
+        cur.close()
+        db.release_connection(conn, database_url)
+
+    # Создаем JWT токен (подписывается первым секретом из JWT_SECRETS)
+    token = get_token_verifier().issue(user_id, user_username)
+
+    return json_response(200, {
+        'success': True,
+        'token': token,
+        'user': {
+            'id': user_id,
+            'username': user_username
+        }
+    })
+
+
+def raise_throttled(throttled: Any, ip_address: str) -> None:
+    scope, retry_after = throttled
+    metrics.log_event('auth_throttled', scope=scope, ip=ip_address)
+    raise HttpError(429, 'Too many failed login attempts, retry later', {'Retry-After': str(retry_after)})
+
+
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    '''
+    Business: Авторизация админ пользователей
+    Args: event - dict с httpMethod, body, headers
+          context - объект с атрибутами request_id, function_name и др.
+    Returns: HTTP response dict с JWT токеном или ошибкой
+    '''
+    return router.dispatch(event, context)
@@ -0,0 +1,146 @@
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Any, Callable, Dict, Optional
+
+import bcrypt
+
+from shared import metrics
+
+# bcrypt отпускает GIL, поэтому потоки реально считают параллельно; больше ядер — только очередь
+POOL_SIZE = int(os.environ.get('BCRYPT_POOL_SIZE', '0')) or min(4, os.cpu_count() or 1)
+# Сколько проверок может ждать свободный поток, прежде чем новые получат отказ
+MAX_QUEUE = int(os.environ.get('BCRYPT_MAX_QUEUE', '32'))
+QUEUE_TIMEOUT = float(os.environ.get('BCRYPT_QUEUE_TIMEOUT', '5'))
+
+# Целевые стоимость и схема: хэши с другими параметрами пересчитываются при успешном входе
+TARGET_ROUNDS = int(os.environ.get('BCRYPT_ROUNDS', '12'))
+TARGET_SCHEME = os.environ.get('BCRYPT_SCHEME', '2b')
+
+HASH_PATTERN = re.compile(r'^\$(2[abxy])\$(\d{2})\$')
+
+
+class PasswordServiceBusy(Exception):
+    '''Все потоки bcrypt заняты и очередь заполнена — запрос нужно повторить позже'''
+
+
+class PasswordService:
+    '''
+    Проверка и хэширование паролей в ограниченном пуле потоков. Когда пул
+    занят, запросы ждут в очереди; сверх MAX_QUEUE — сразу PasswordServiceBusy,
+    чтобы поток неудачных входов не съедал весь CPU.
+    '''
+
+    def __init__(self, pool_size: int = POOL_SIZE, max_queue: int = MAX_QUEUE,
+                 queue_timeout: float = QUEUE_TIMEOUT, rounds: int = TARGET_ROUNDS,
+                 scheme: str = TARGET_SCHEME):
+        self.pool_size = pool_size
+        self.queue_timeout = queue_timeout
+        self.rounds = rounds
+        self.scheme = scheme
+        self._executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix='bcrypt')
+        self._slots = threading.BoundedSemaphore(pool_size + max_queue)
+        self._lock = threading.Lock()
+        self._stats = {'verified': 0, 'hashed': 0, 'rejected_busy': 0, 'rehashed': 0}
+        self._dummy_hash: Optional[bytes] = None
+
+    def _run(self, kind: str, fn: Callable[..., Any], *args: Any) -> Any:
+        if not self._slots.acquire(blocking=False):
+            self._count('rejected_busy')
+            raise PasswordServiceBusy()
+        started = time.perf_counter()
+        try:
+            future = self._executor.submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        # Слот держится, пока задача не завершена или не снята: запрос может
+        # уйти по таймауту, а уже начатый bcrypt всё равно занимает поток
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            result = future.result(timeout=self.queue_timeout)
+        except FutureTimeout:
+            # Задача ещё в очереди — снимаем, чтобы не тратить на неё CPU
+            future.cancel()
+            self._count('rejected_busy')
+            raise PasswordServiceBusy()
+        self._count(kind)
+        # Время вместе с ожиданием в очереди пула — столько же ждёт и запрос входа
+        metrics.observe('bcrypt_seconds', 'bcrypt time including pool queue wait',
+                        time.perf_counter() - started, operation=kind)
+        return result
+
+    def _count(self, key: str) -> None:
+        with self._lock:
+            self._stats[key] += 1
+
+    def verify(self, password: str, password_hash: str) -> bool:
+        hash_bytes = password_hash.encode('utf-8') if isinstance(password_hash, str) else password_hash
+        try:
+            return self._run('verified', bcrypt.checkpw, password.encode('utf-8'), hash_bytes)
+        except ValueError:
+            # Повреждённый или не-bcrypt хэш в базе
+            return False
+
+    def verify_dummy(self, password: str) -> bool:
+        '''
+        Проверка против заведомо чужого хэша той же стоимости: для несуществующего
+        пользователя ответ занимает столько же, сколько для неверного пароля.
+        '''
+        if self._dummy_hash is None:
+            # Хэш считается в том же пуле: первый вход несуществующего пользователя
+            # не должен занимать поток запроса полным bcrypt в обход ограничения
+            self._dummy_hash = self.hash(os.urandom(16).hex()).encode('ascii')
+        self._run('verified', bcrypt.checkpw, password.encode('utf-8'), self._dummy_hash)
+        return False
+
+    def hash(self, password: str) -> str:
+        salt = bcrypt.gensalt(self.rounds, prefix=self.scheme.encode('ascii'))
+        return self._run('hashed', bcrypt.hashpw, password.encode('utf-8'), salt).decode('utf-8')
+
+    def needs_rehash(self, password_hash: str) -> bool:
+        match = HASH_PATTERN.match(password_hash or '')
+        if not match:
+            return True
+        return match.group(1) != self.scheme or int(match.group(2)) != self.rounds
+
+    def rehash_if_needed(self, cur: Any, user_id: int, password: str, password_hash: str) -> bool:
+        '''
+        После успешного входа переписывает хэш под текущие BCRYPT_ROUNDS/BCRYPT_SCHEME.
+        Обновление условное: если хэш уже сменили параллельно, ничего не трогаем.
+        '''
+        if not self.needs_rehash(password_hash):
+            return False
+        try:
+            new_hash = self.hash(password)
+        except PasswordServiceBusy:
+            # Пересчитаем при следующем входе
+            return False
+        cur.execute(
+            'UPDATE admin_users SET password_hash = %s WHERE id = %s AND password_hash = %s',
+            (new_hash, user_id, password_hash)
+        )
+        if cur.rowcount:
+            self._count('rehashed')
+        return bool(cur.rowcount)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+        stats.update({'pool_size': self.pool_size, 'rounds': self.rounds, 'scheme': self.scheme})
+        return stats
+
+
+_service: Optional[PasswordService] = None
+_service_lock = threading.Lock()
+
+
+def get_password_service() -> PasswordService:
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                _service = PasswordService()
+    return _service
@@ -0,0 +1,191 @@
+# Копия backend/shared/metrics.py, не править: python -m shared.vendor
+import json
+import os
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+# METRICS_ENABLED=0 выключает всё, кроме самих ответов
+ENABLED = os.environ.get('METRICS_ENABLED', '1') != '0'
+# Доля запросов, у которых замеряется каждый SQL-запрос и пишется строка лога
+SAMPLE_RATE = float(os.environ.get('METRICS_SAMPLE_RATE', '0.1'))
+# Медленные запросы логируются всегда, даже вне выборки
+SLOW_REQUEST_MS = float(os.environ.get('METRICS_SLOW_REQUEST_MS', '1000'))
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+STATEMENT_NAME = re.compile(r'^\s*/\*\s*([\w.:-]+)\s*\*/')
+STATEMENT_VERB = re.compile(r'^\s*(\w+)')
+STATEMENT_TABLE = re.compile(r'\b(?:FROM|INTO|UPDATE|TABLE)\s+([\w.]+)', re.IGNORECASE)
+
+
+class Histogram:
+    '''Гистограмма Prometheus: накопительные корзины, сумма и число наблюдений по набору меток'''
+
+    def __init__(self, name: str, help_text: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self._series: Dict[Labels, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, labels: Labels = ()) -> None:
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                # [счётчики по корзинам..., +Inf, сумма]
+                series = self._series[labels] = [0.0] * (len(self.buckets) + 2)
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[index] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series_items = [(labels, list(series)) for labels, series in self._series.items()]
+        for labels, series in sorted(series_items):
+            for bound, count in zip(self.buckets, series):
+                lines.append(f'{self.name}_bucket{_format_labels(labels + (("le", repr(bound)),))} {int(count)}')
+            lines.append(f'{self.name}_bucket{_format_labels(labels + (("le", "+Inf"),))} {int(series[-2])}')
+            lines.append(f'{self.name}_sum{_format_labels(labels)} {series[-1]:.6f}')
+            lines.append(f'{self.name}_count{_format_labels(labels)} {int(series[-2])}')
+        return lines
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ''
+    parts = []
+    for key, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"')
+        parts.append(f'{key}="{value}"')
+    return '{' + ','.join(parts) + '}'
+
+
+_histograms: Dict[str, Histogram] = {}
+_collectors: Dict[str, Callable[[], Dict[str, Any]]] = {}
+_registry_lock = threading.Lock()
+
+# Состояние текущего запроса: попал ли он в выборку и накопленное время SQL
+_request_sampled: ContextVar[bool] = ContextVar('metrics_request_sampled', default=False)
+_request_sql: ContextVar[Optional[List[float]]] = ContextVar('metrics_request_sql', default=None)
+
+
+def histogram(name: str, help_text: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+    hist = _histograms.get(name)
+    if hist is None:
+        with _registry_lock:
+            hist = _histograms.setdefault(name, Histogram(name, help_text, buckets))
+    return hist
+
+
+def observe(name: str, help_text: str, seconds: float, **labels: str) -> None:
+    if ENABLED:
+        histogram(name, help_text).observe(seconds, tuple(sorted(labels.items())))
+
+
+@contextmanager
+def timed(name: str, help_text: str, **labels: str) -> Iterator[None]:
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, help_text, time.perf_counter() - started, **labels)
+
+
+def register_collector(prefix: str, collect: Callable[[], Dict[str, Any]]) -> None:
+    '''Числовые поля stats() модуля попадают в /metrics как gauge <prefix>_<поле>'''
+    with _registry_lock:
+        _collectors[prefix] = collect
+
+
+def log_event(event: str, **fields: Any) -> None:
+    '''Структурированная строка лога: один JSON-объект на строку'''
+    print(json.dumps({'event': event, 'ts': round(time.time(), 3), **fields}, default=str))
+
+
+@lru_cache(maxsize=512)
+def statement_label(query: str) -> str:
+    '''Имя запроса из ведущего комментария /* name */, иначе «глагол:таблица»'''
+    named = STATEMENT_NAME.match(query)
+    if named:
+        return named.group(1)
+    verb = STATEMENT_VERB.match(query)
+    table = STATEMENT_TABLE.search(query)
+    return f'{verb.group(1).lower() if verb else "sql"}:{table.group(1) if table else "-"}'
+
+
+def sql_sampled() -> bool:
+    return _request_sampled.get()
+
+
+def observe_sql(query: Any, seconds: float) -> None:
+    text = query.decode('utf-8', 'replace') if isinstance(query, bytes) else str(query)
+    observe('db_statement_seconds', 'SQL statement latency', seconds, statement=statement_label(text))
+    totals = _request_sql.get()
+    if totals is not None:
+        totals[0] += 1
+        totals[1] += seconds
+
+
+@contextmanager
+def request_scope(function_name: str, method: str, action: str, request_id: str = '') -> Iterator[Dict[str, Any]]:
+    '''
+    Замер запроса целиком. Гистограмма пишется всегда; SQL по отдельности и строка
+    лога — только для выборки METRICS_SAMPLE_RATE и для медленных запросов.
+    '''
+    if not ENABLED:
+        yield {}
+        return
+    sampled = random.random() < SAMPLE_RATE
+    sampled_token = _request_sampled.set(sampled)
+    sql_token = _request_sql.set([0, 0.0] if sampled else None)
+    outcome: Dict[str, Any] = {'status': 500}
+    started = time.perf_counter()
+    try:
+        yield outcome
+    finally:
+        elapsed = time.perf_counter() - started
+        sql_count, sql_seconds = _request_sql.get() or (0, 0.0)
+        _request_sampled.reset(sampled_token)
+        _request_sql.reset(sql_token)
+
+        status = str(outcome.get('status', 500))
+        observe('http_request_seconds', 'Handler latency', elapsed,
+                function=function_name, method=method, action=action or '-', status=status)
+        if sampled or elapsed * 1000 >= SLOW_REQUEST_MS:
+            log_event('request', function=function_name, method=method, action=action or '-',
+                      status=int(status), duration_ms=round(elapsed * 1000, 2), request_id=request_id,
+                      sampled=sampled, sql_count=sql_count, sql_ms=round(sql_seconds * 1000, 2))
+
+
+def render_prometheus() -> str:
+    with _registry_lock:
+        histograms = list(_histograms.values())
+        collectors = list(_collectors.items())
+
+    lines: List[str] = []
+    for hist in sorted(histograms, key=lambda h: h.name):
+        lines.extend(hist.render())
+    for prefix, collect in sorted(collectors):
+        try:
+            stats = collect()
+        except Exception as e:
+            lines.append(f'# collector {prefix} failed: {e}')
+            continue
+        for key, value in sorted(stats.items()):
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            name = re.sub(r'[^a-zA-Z0-9_]', '_', f'{prefix}_{key}')
+            lines.append(f'# TYPE {name} gauge')
+            lines.append(f'{name} {value}')
+    return '\n'.join(lines) + '\n'
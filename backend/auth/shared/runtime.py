@@ -0,0 +1,211 @@
+# Копия backend/shared/runtime.py, не править: python -m shared.vendor
+import importlib.util
+import json
+import os
+import sys
+import threading
+from types import ModuleType
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from shared import metrics
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+Event = Dict[str, Any]
+Response = Dict[str, Any]
+Route = Callable[[Event, Any], Response]
+
+JSON_HEADERS = {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'}
+
+
+class HttpError(Exception):
+    '''Ошибка, которую маршрут отдаёт клиенту как есть: код, текст и доп. заголовки'''
+
+    def __init__(self, status_code: int, message: str, headers: Optional[Dict[str, str]] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+# Загрузка ленивых модулей идёт под одним замком: importlib.util.LazyLoader до
+# Python 3.12 не потокобезопасен, а хост вызывает обработчики из нескольких потоков
+_lazy_lock = threading.RLock()
+_lazy_loading = set()
+
+
+class _LazyModule(ModuleType):
+    '''Модуль, код которого исполняется при первом обращении к атрибуту'''
+
+    def __getattribute__(self, attr: str) -> Any:
+        if type(self) is _LazyModule:
+            with _lazy_lock:
+                # Второй поток ждёт на замке, пока первый не исполнит модуль целиком;
+                # обращения самого загружающего потока (module.__dict__ в exec) проходят сразу
+                if type(self) is _LazyModule and id(self) not in _lazy_loading:
+                    _lazy_loading.add(id(self))
+                    try:
+                        spec = ModuleType.__getattribute__(self, '__spec__')
+                        spec.loader.exec_module(self)
+                        self.__class__ = ModuleType
+                    finally:
+                        _lazy_loading.discard(id(self))
+        return ModuleType.__getattribute__(self, attr)
+
+
+def lazy_import(name: str) -> ModuleType:
+    '''
+    Модуль, который реально загружается при первом обращении к атрибуту.
+    Тяжёлые зависимости (requests, cryptography, bcrypt, psycopg2) не попадают
+    в холодный старт OPTIONS и других путей, где они не нужны.
+    '''
+    with _lazy_lock:
+        module = sys.modules.get(name)
+        if module is not None:
+            return module
+        spec = importlib.util.find_spec(name)
+        if spec is None:
+            raise ImportError(f'No module named {name!r}')
+        module = importlib.util.module_from_spec(spec)
+        module.__class__ = _LazyModule
+        sys.modules[name] = module
+        return module
+
+
+def dumps(value: Any) -> str:
+    '''JSON через orjson, если он установлен; типы, которых orjson не знает, — через json'''
+    if orjson is not None:
+        try:
+            return orjson.dumps(value).decode('utf-8')
+        except TypeError:
+            pass
+    return json.dumps(value)
+
+
+def loads(data: Any) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def json_response(status_code: int, payload: Any, headers: Optional[Dict[str, str]] = None) -> Response:
+    return {
+        'statusCode': status_code,
+        'headers': {**JSON_HEADERS, **headers} if headers else dict(JSON_HEADERS),
+        'body': payload if isinstance(payload, str) else dumps(payload)
+    }
+
+
+def error_response(status_code: int, message: str, headers: Optional[Dict[str, str]] = None) -> Response:
+    return json_response(status_code, {'error': message}, headers)
+
+
+def parse_json_body(event: Event) -> Any:
+    try:
+        return loads(event.get('body') or '{}')
+    except ValueError:
+        raise HttpError(400, 'Invalid JSON body')
+
+
+def int_param(params: Dict[str, Any], name: str, default: Optional[int] = None,
+              minimum: Optional[int] = None) -> Optional[int]:
+    '''Целое из строки запроса или тела: неверное значение — 400, а не 500 из int()'''
+    value = params.get(name)
+    if value is None or value == '':
+        return default
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        raise HttpError(400, f'{name} must be an integer')
+    if minimum is not None and number < minimum:
+        raise HttpError(400, f'{name} must be at least {minimum}')
+    return number
+
+
+def require_database_url() -> str:
+    database_url = os.environ.get('DATABASE_URL')
+    if not database_url:
+        raise HttpError(500, 'Database connection not configured')
+    return database_url
+
+
+def event_action(event: Event) -> str:
+    '''Действие из пути (/send) или из строки запроса (?action=stats)'''
+    action = (event.get('pathParameters') or {}).get('action')
+    if not action:
+        action = (event.get('queryStringParameters') or {}).get('action')
+    return action or ''
+
+
+class Router:
+    '''
+    Диспетчер обработчика по методу и действию. Ответ на OPTIONS собирается
+    один раз, HttpError и прочие исключения превращаются в JSON-ошибки,
+    маршруты с admin=True проверяют Bearer-токен до вызова. Каждый запрос
+    замеряется, GET ?action=metrics отдаёт метрики экземпляра в формате Prometheus.
+    '''
+
+    def __init__(self, allow_methods: str, name: str = ''):
+        self.name = name
+        self._routes: Dict[Tuple[str, str], Tuple[Route, bool]] = {}
+        self._options = {
+            'statusCode': 200,
+            'headers': {
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Allow-Methods': allow_methods,
+                'Access-Control-Allow-Headers': 'Content-Type, Authorization',
+                'Access-Control-Max-Age': '86400'
+            },
+            'body': ''
+        }
+        self.route('GET', 'metrics', admin=True)(self.metrics_route)
+
+    def route(self, method: str, action: str = '', admin: bool = False) -> Callable[[Route], Route]:
+        '''Маршрут без action принимает и неизвестные действия этого метода'''
+        def register(fn: Route) -> Route:
+            self._routes[(method, action)] = (fn, admin)
+            return fn
+        return register
+
+    def dispatch(self, event: Event, context: Any) -> Response:
+        method = event.get('httpMethod', 'GET')
+        if method == 'OPTIONS':
+            return {**self._options, 'headers': dict(self._options['headers'])}
+
+        action = event_action(event)
+        if (method, action) not in self._routes:
+            # Неизвестные действия идут в маршрут по умолчанию и не плодят метки в метриках
+            action = ''
+        function_name = self.name or getattr(context, 'function_name', '') or ''
+        with metrics.request_scope(function_name, method, action, getattr(context, 'request_id', '')) as outcome:
+            response = self._call(self._routes.get((method, action)), event, context)
+            outcome['status'] = response.get('statusCode', 200)
+        return response
+
+    def _call(self, route: Optional[Tuple[Route, bool]], event: Event, context: Any) -> Response:
+        if route is None:
+            return error_response(405, 'Method not allowed')
+        fn, admin = route
+
+        if admin:
+            from shared.tokens import require_admin
+            auth_error = require_admin(event)
+            if auth_error:
+                return auth_error
+
+        try:
+            return fn(event, context)
+        except HttpError as e:
+            return error_response(e.status_code, str(e), e.headers)
+        except Exception as e:
+            return error_response(500, str(e))
+
+    @staticmethod
+    def metrics_route(event: Event, context: Any) -> Response:
+        return {
+            'statusCode': 200,
+            'headers': {'Content-Type': 'text/plain; version=0.0.4', 'Access-Control-Allow-Origin': '*'},
+            'body': metrics.render_prometheus()
+        }
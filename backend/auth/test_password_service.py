@@ -0,0 +1,94 @@
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+bcrypt = pytest.importorskip('bcrypt')
+
+AUTH_DIR = os.path.dirname(os.path.abspath(__file__))
+for path in (AUTH_DIR, os.path.dirname(AUTH_DIR)):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from password_service import PasswordService, PasswordServiceBusy
+
+
+class RecordingCursor:
+    def __init__(self, rowcount=1):
+        self.rowcount = rowcount
+        self.executed = []
+
+    def execute(self, query, params):
+        self.executed.append((query, params))
+
+
+def test_verify_and_needs_rehash():
+    service = PasswordService(pool_size=2, rounds=4, scheme='2b')
+    legacy_hash = bcrypt.hashpw(b'secret', bcrypt.gensalt(5, prefix=b'2a')).decode()
+
+    assert service.verify('secret', legacy_hash)
+    assert not service.verify('wrong', legacy_hash)
+    assert not service.verify('secret', 'not-a-bcrypt-hash')
+
+    assert service.needs_rehash(legacy_hash)
+    assert not service.needs_rehash(service.hash('secret'))
+
+
+def test_rehash_updates_only_outdated_hash():
+    service = PasswordService(pool_size=1, rounds=4, scheme='2b')
+    legacy_hash = bcrypt.hashpw(b'secret', bcrypt.gensalt(5, prefix=b'2a')).decode()
+
+    cur = RecordingCursor()
+    assert service.rehash_if_needed(cur, 7, 'secret', legacy_hash)
+    new_hash, user_id, old_hash = cur.executed[0][1]
+    assert (user_id, old_hash) == (7, legacy_hash)
+    assert new_hash.startswith('$2b$04$') and bcrypt.checkpw(b'secret', new_hash.encode())
+
+    cur = RecordingCursor()
+    assert not service.rehash_if_needed(cur, 7, 'secret', new_hash)
+    assert cur.executed == []
+
+
+def test_saturated_pool_rejects_instead_of_piling_up():
+    service = PasswordService(pool_size=1, max_queue=0, queue_timeout=5, rounds=4)
+    started = threading.Event()
+
+    def slow():
+        started.set()
+        time.sleep(0.3)
+        return True
+
+    worker = threading.Thread(target=service._run, args=('verified', slow))
+    worker.start()
+    started.wait()
+
+    with pytest.raises(PasswordServiceBusy):
+        service.verify('secret', '$2b$04$' + 'a' * 53)
+    worker.join()
+    assert service.stats()['rejected_busy'] == 1
+
+
+def test_timed_out_running_task_keeps_its_slot():
+    service = PasswordService(pool_size=1, max_queue=0, queue_timeout=0.05, rounds=4)
+    finish = threading.Event()
+
+    with pytest.raises(PasswordServiceBusy):
+        service._run('verified', finish.wait, 5)
+    # Начатая задача не отменяется и держит слот, пока не закончится
+    assert not service._slots.acquire(blocking=False)
+
+    finish.set()
+    service._executor.submit(lambda: None).result()
+    assert service._slots.acquire(blocking=False)
+    service._slots.release()
+
+
+def test_verify_dummy_costs_a_real_check():
+    service = PasswordService(pool_size=1, rounds=4, scheme='2b')
+
+    assert service.verify_dummy('secret') is False
+    assert service.stats()['verified'] == 1
+    # Сам фиктивный хэш тоже посчитан в пуле
+    assert service.stats()['hashed'] == 1
@@ -0,0 +1,68 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from throttle import LoginThrottle, SlidingWindowCounter, client_ip
+
+
+def test_sliding_window_weights_previous_window():
+    counter = SlidingWindowCounter(window=100)
+    for _ in range(4):
+        counter.add('user:admin', now=1050)
+
+    assert counter.count('user:admin', now=1099) == 4
+    # Середина следующего окна: предыдущее учитывается наполовину
+    assert counter.count('user:admin', now=1150) == 2
+    # Через окно от старых попыток ничего не остаётся
+    assert counter.count('user:admin', now=1250) == 0
+
+
+def test_sliding_window_evicts_oldest_keys():
+    counter = SlidingWindowCounter(window=100, max_keys=2)
+    for key in ('a', 'b', 'c'):
+        counter.add(key, now=10)
+
+    assert counter.count('a', now=10) == 0
+    assert counter.count('c', now=10) == 1
+
+
+def test_login_throttle_per_user_and_ip():
+    throttle = LoginThrottle(window=300, max_user_failures=3, max_ip_failures=5, backend='memory')
+
+    for _ in range(3):
+        assert throttle.check_local('Admin', '10.0.0.1') is None
+        throttle.record_failure('Admin', '10.0.0.1')
+
+    scope, retry_after = throttle.check_local('admin', '10.0.0.1')
+    assert scope == 'user' and 1 <= retry_after <= 300
+    # Перебор с одного адреса не блокирует вход того же пользователя с другого
+    assert throttle.check_local('admin', '10.0.0.2') is None
+
+    # Успешный вход снимает счётчик пары пользователь-IP, но не IP
+    throttle.record_success('admin', '10.0.0.1')
+    assert throttle.check_local('admin', '10.0.0.1') is None
+    throttle.record_failure('other', '10.0.0.1')
+    throttle.record_failure('third', '10.0.0.1')
+    assert throttle.check_local('fourth', '10.0.0.1')[0] == 'ip'
+
+    stats = throttle.stats()
+    assert stats['throttled_user'] == 1 and stats['throttled_ip'] == 1
+    assert stats['failures'] == 5
+
+
+def test_client_ip_takes_address_added_by_trusted_proxy():
+    # Левое значение задаёт клиент: берётся адрес, дописанный доверенным прокси
+    assert client_ip({'X-Forwarded-For': '1.2.3.4, 10.0.0.1'}, trusted_hops=1) == '10.0.0.1'
+    assert client_ip({'X-Forwarded-For': '1.2.3.4, 10.0.0.1, 10.0.0.2'}, trusted_hops=2) == '10.0.0.1'
+    assert client_ip({'X-Forwarded-For': '10.0.0.1'}, trusted_hops=2) == '10.0.0.1'
+    assert client_ip({'X-Forwarded-For': '1.2.3.4', 'x-real-ip': '5.6.7.8'}, trusted_hops=0) == '5.6.7.8'
+    assert client_ip({'x-real-ip': '5.6.7.8'}) == '5.6.7.8'
+    assert client_ip({}) == '0.0.0.0'
+
+
+def test_throttle_keys_fit_key_column():
+    keys = LoginThrottle.keys('A' * 5000, '1.2.3.4, ' * 100)
+    assert all(len(key) <= 300 for key in keys.values())
+    assert keys == LoginThrottle.keys('a' * 5000, '1.2.3.4, ' * 100)
+    assert LoginThrottle.keys('Admin', '10.0.0.1') == {'user': 'user:admin@10.0.0.1', 'ip': 'ip:10.0.0.1'}
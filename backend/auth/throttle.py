@@ -0,0 +1,205 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+# Окно и пределы неудачных входов: по паре (пользователь, IP) и по IP клиента.
+# Счётчик только по имени позволял любому заблокировать вход, например, admin
+WINDOW_SECONDS = int(os.environ.get('AUTH_THROTTLE_WINDOW', '300'))
+MAX_USER_FAILURES = int(os.environ.get('AUTH_THROTTLE_MAX_USER_FAILURES', '5'))
+MAX_IP_FAILURES = int(os.environ.get('AUTH_THROTTLE_MAX_IP_FAILURES', '20'))
+# memory — только в процессе; postgres — дополнительно общий счётчик в auth_throttle
+BACKEND = os.environ.get('AUTH_THROTTLE_BACKEND', 'memory')
+MAX_TRACKED_KEYS = int(os.environ.get('AUTH_THROTTLE_MAX_KEYS', '100000'))
+# Сколько прокси перед функцией дописывают адрес в X-Forwarded-For. Левые значения
+# задаёт сам клиент, поэтому берётся адрес, добавленный доверенным прокси;
+# 0 — заголовок не учитывается, только x-real-ip
+TRUSTED_PROXY_HOPS = int(os.environ.get('AUTH_TRUSTED_PROXY_HOPS', '1'))
+
+# Старые окна из auth_throttle чистятся не чаще, чем раз в окно
+CLEANUP_INTERVAL_SECONDS = WINDOW_SECONDS
+# auth_throttle.key — VARCHAR(300): более длинные имена и адреса хранятся хэшем
+MAX_KEY_VALUE_LENGTH = 100
+
+
+def key_value(value: str) -> str:
+    if len(value) <= MAX_KEY_VALUE_LENGTH:
+        return value
+    return 'sha256:' + hashlib.sha256(value.encode('utf-8')).hexdigest()
+
+
+def client_ip(headers: Dict[str, Any], trusted_hops: int = TRUSTED_PROXY_HOPS) -> str:
+    headers = {str(name).lower(): value for name, value in (headers or {}).items()}
+    hops = [hop.strip() for hop in (headers.get('x-forwarded-for') or '').split(',') if hop.strip()]
+    if trusted_hops > 0 and hops:
+        # Цепочка короче ожидаемой — самый левый адрес и есть добавленный прокси
+        return hops[-min(trusted_hops, len(hops))]
+    return headers.get('x-real-ip') or '0.0.0.0'
+
+
+class SlidingWindowCounter:
+    '''
+    Счётчик скользящего окна по двум соседним фиксированным окнам: предыдущее
+    учитывается с весом оставшейся доли. O(1) памяти на ключ; самые давние
+    ключи вытесняются, чтобы перебор имён не раздувал память.
+    '''
+
+    def __init__(self, window: int, max_keys: int = MAX_TRACKED_KEYS):
+        self.window = window
+        self.max_keys = max_keys
+        self._counters: 'OrderedDict[str, List[int]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _roll(self, key: str, window_id: int) -> Optional[List[int]]:
+        entry = self._counters.get(key)
+        if entry is None:
+            return None
+        if entry[0] != window_id:
+            # [id окна, текущее, предыдущее]; пропущенное окно обнуляет предыдущее
+            entry[2] = entry[1] if entry[0] == window_id - 1 else 0
+            entry[1] = 0
+            entry[0] = window_id
+        return entry
+
+    def count(self, key: str, now: Optional[float] = None) -> float:
+        now = time.time() if now is None else now
+        window_id, offset = divmod(now, self.window)
+        with self._lock:
+            entry = self._roll(key, int(window_id))
+            if entry is None:
+                return 0.0
+            return entry[1] + entry[2] * (1 - offset / self.window)
+
+    def add(self, key: str, now: Optional[float] = None) -> None:
+        now = time.time() if now is None else now
+        window_id = int(now // self.window)
+        with self._lock:
+            entry = self._roll(key, window_id)
+            if entry is None:
+                entry = self._counters[key] = [window_id, 0, 0]
+            entry[1] += 1
+            self._counters.move_to_end(key)
+            while len(self._counters) > self.max_keys:
+                self._counters.popitem(last=False)
+
+    def reset(self, key: str) -> None:
+        with self._lock:
+            self._counters.pop(key, None)
+
+
+class LoginThrottle:
+    '''
+    Шлюз перед проверкой пароля: считает неудачные входы по паре (пользователь, IP)
+    и по IP и отказывает, пока счётчик выше предела. Чужие попытки с другого адреса
+    не блокируют вход пользователю. Проверка в памяти не трогает базу;
+    с бэкендом postgres счётчики суммируются по всем экземплярам.
+    '''
+
+    def __init__(self, window: int = WINDOW_SECONDS, max_user_failures: int = MAX_USER_FAILURES,
+                 max_ip_failures: int = MAX_IP_FAILURES, backend: str = BACKEND):
+        self.window = window
+        self.limits = {'user': max_user_failures, 'ip': max_ip_failures}
+        self.backend = backend
+        self.local = SlidingWindowCounter(window)
+        self._lock = threading.Lock()
+        self._last_cleanup = 0.0
+        self._stats = {'checks': 0, 'allowed': 0, 'throttled_user': 0, 'throttled_ip': 0, 'failures': 0}
+
+    @staticmethod
+    def keys(username: str, ip_address: str) -> Dict[str, str]:
+        ip_key = key_value(ip_address)
+        return {'user': f'user:{key_value(username.strip().lower())}@{ip_key}', 'ip': f'ip:{ip_key}'}
+
+    @property
+    def uses_database(self) -> bool:
+        return self.backend == 'postgres'
+
+    def _count(self, key: str, amount: int = 1) -> None:
+        with self._lock:
+            self._stats[key] += amount
+
+    def _retry_after(self, now: float) -> int:
+        # Вес предыдущего окна спадает до нуля к концу текущего окна
+        return max(1, int(self.window - now % self.window))
+
+    def _verdict(self, counts: Dict[str, float], now: float) -> Optional[Tuple[str, int]]:
+        for scope in ('user', 'ip'):
+            if counts.get(scope, 0) >= self.limits[scope]:
+                self._count(f'throttled_{scope}')
+                return scope, self._retry_after(now)
+        return None
+
+    def check_local(self, username: str, ip_address: str) -> Optional[Tuple[str, int]]:
+        '''(scope, retry_after), если вход нужно отклонить; None — можно продолжать'''
+        now = time.time()
+        self._count('checks')
+        keys = self.keys(username, ip_address)
+        verdict = self._verdict({scope: self.local.count(key, now) for scope, key in keys.items()}, now)
+        if verdict is None and not self.uses_database:
+            self._count('allowed')
+        return verdict
+
+    def check_shared(self, cur: Any, username: str, ip_address: str) -> Optional[Tuple[str, int]]:
+        '''Проверка по общим счётчикам auth_throttle (только для бэкенда postgres)'''
+        now = time.time()
+        window_id, offset = divmod(now, self.window)
+        keys = self.keys(username, ip_address)
+        cur.execute(
+            '''SELECT key,
+                      SUM(CASE WHEN window_id = %(current)s THEN failures ELSE failures * %(weight)s END)
+               FROM auth_throttle
+               WHERE key = ANY(%(keys)s) AND window_id IN (%(current)s, %(previous)s)
+               GROUP BY key''',
+            {
+                'keys': list(keys.values()), 'current': int(window_id), 'previous': int(window_id) - 1,
+                'weight': 1 - offset / self.window
+            }
+        )
+        totals = dict(cur.fetchall())
+        verdict = self._verdict({scope: float(totals.get(key) or 0) for scope, key in keys.items()}, now)
+        if verdict is None:
+            self._count('allowed')
+        return verdict
+
+    def record_failure(self, username: str, ip_address: str, cur: Any = None) -> None:
+        now = time.time()
+        keys = self.keys(username, ip_address)
+        for key in keys.values():
+            self.local.add(key, now)
+        self._count('failures')
+
+        if self.uses_database and cur is not None:
+            window_id = int(now // self.window)
+            cur.execute(
+                '''INSERT INTO auth_throttle (key, window_id, failures)
+                   VALUES (%s, %s, 1), (%s, %s, 1)
+                   ON CONFLICT (key, window_id) DO UPDATE SET failures = auth_throttle.failures + 1''',
+                (keys['user'], window_id, keys['ip'], window_id)
+            )
+            if now - self._last_cleanup > CLEANUP_INTERVAL_SECONDS:
+                self._last_cleanup = now
+                cur.execute('DELETE FROM auth_throttle WHERE window_id < %s', (window_id - 1,))
+
+    def record_success(self, username: str, ip_address: str, cur: Any = None) -> None:
+        '''Успешный вход снимает счётчик пары пользователь-IP (IP продолжает считаться)'''
+        key = self.keys(username, ip_address)['user']
+        self.local.reset(key)
+        if self.uses_database and cur is not None:
+            cur.execute('DELETE FROM auth_throttle WHERE key = %s', (key,))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+        stats.update({
+            'backend': self.backend,
+            'window_seconds': self.window,
+            'max_user_failures': self.limits['user'],
+            'max_ip_failures': self.limits['ip'],
+            'tracked_keys': len(self.local._counters)
+        })
+        return stats
+
+
+login_throttle = LoginThrottle()
@@ -0,0 +1,175 @@
+'''
+Генератор синтетических данных для бенчмарков: миллионы строк user_actions
+и десятки тысяч push_subscriptions. Работает на локальном Postgres с
+применёнными db_migrations.
+
+    python backend/benchmarks/generate_data.py --database-url postgresql://... \
+        --actions 2000000 --subscriptions 20000 --days 365
+'''
+import argparse
+import base64
+import os
+import sys
+import time
+
+BACKEND_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(BACKEND_ROOT, 'analytics'))
+
+import bcrypt
+import psycopg2
+
+from ua_parser import parse_user_agent
+
+BENCH_ADMIN_USERNAME = 'bench_admin'
+BENCH_ADMIN_PASSWORD = 'bench-password'
+
+SAMPLE_USER_AGENTS = [
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36 Edg/120.0.0.0',
+    'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.1 Safari/605.1.15',
+    'Mozilla/5.0 (iPhone; CPU iPhone OS 17_0 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.0 Mobile/15E148 Safari/604.1',
+    'Mozilla/5.0 (Linux; Android 13; SM-S901B) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/112.0.0.0 Mobile Safari/537.36',
+    'Mozilla/5.0 (X11; Linux x86_64; rv:121.0) Gecko/20100101 Firefox/121.0',
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/119.0.0.0 YaBrowser/24.1 Safari/537.36',
+    'Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)',
+]
+ACTION_TYPES = ['page_view', 'page_view', 'page_view', 'click', 'click', 'page_exit', 'scroll_checkpoint', 'form_start']
+PAGES = [f'https://example.com/{path}' for path in ('', 'catalog', 'catalog/brick', 'catalog/tile', 'contacts', 'about', 'delivery', 'prices', 'gallery', 'faq', 'admin')]
+
+ACTIONS_INSERT = '''
+    INSERT INTO user_actions
+        (session_id, user_agent, ip_address, action_type, action_details, page_url, referrer,
+         browser, browser_major, os, device_class, is_bot, timestamp)
+    SELECT
+        'bench_' || (g %% %(sessions)s),
+        (%(uas)s::text[])[1 + g %% %(ua_count)s],
+        ('10.' || (g %% %(visitors)s / 65536) || '.' || (g %% %(visitors)s / 256 %% 256) || '.' || (g %% 256))::inet,
+        (%(action_types)s::text[])[1 + (g * 7) %% %(action_count)s],
+        jsonb_build_object('bench', true, 'n', g),
+        (%(pages)s::text[])[1 + (g * 13) %% %(page_count)s],
+        '',
+        (%(browsers)s::text[])[1 + g %% %(ua_count)s],
+        (%(majors)s::smallint[])[1 + g %% %(ua_count)s],
+        (%(oses)s::text[])[1 + g %% %(ua_count)s],
+        (%(devices)s::text[])[1 + g %% %(ua_count)s],
+        (%(bots)s::boolean[])[1 + g %% %(ua_count)s],
+        NOW() - random() * make_interval(days => %(days)s)
+    FROM generate_series(%(start)s, %(stop)s) g
+'''
+
+SUBSCRIPTIONS_INSERT = '''
+    INSERT INTO push_subscriptions (endpoint, p256dh, auth, user_agent, ip_address)
+    SELECT
+        %(endpoint_base)s || g,
+        %(p256dh)s,
+        %(auth)s,
+        'bench',
+        '10.1.0.1'::inet
+    FROM generate_series(%(start)s, %(stop)s) g
+'''
+
+
+def _subscriber_keys():
+    '''Один настоящий P-256 ключ на всех подписчиков: шифрование в бенчмарке должно работать'''
+    try:
+        from cryptography.hazmat.primitives import serialization
+        from cryptography.hazmat.primitives.asymmetric import ec
+    except ImportError:
+        return base64.urlsafe_b64encode(os.urandom(65)).decode().rstrip('='), base64.urlsafe_b64encode(os.urandom(16)).decode().rstrip('=')
+
+    public_key = ec.generate_private_key(ec.SECP256R1()).public_key().public_bytes(
+        serialization.Encoding.X962, serialization.PublicFormat.UncompressedPoint
+    )
+    return (
+        base64.urlsafe_b64encode(public_key).decode().rstrip('='),
+        base64.urlsafe_b64encode(os.urandom(16)).decode().rstrip('=')
+    )
+
+
+def generate_actions(conn, total: int, days: int, sessions: int, visitors: int, chunk: int) -> None:
+    parsed = [parse_user_agent(ua) for ua in SAMPLE_USER_AGENTS]
+    params = {
+        'sessions': sessions,
+        'visitors': visitors,
+        'days': days,
+        'uas': SAMPLE_USER_AGENTS,
+        'ua_count': len(SAMPLE_USER_AGENTS),
+        'browsers': [p.browser for p in parsed],
+        'majors': [p.browser_major for p in parsed],
+        'oses': [p.os for p in parsed],
+        'devices': [p.device_class for p in parsed],
+        'bots': [p.is_bot for p in parsed],
+        'action_types': ACTION_TYPES,
+        'action_count': len(ACTION_TYPES),
+        'pages': PAGES,
+        'page_count': len(PAGES),
+    }
+    with conn.cursor() as cur:
+        cur.execute(
+            "SELECT user_actions_ensure_partitions((NOW() - make_interval(days => %s))::date, 3)",
+            (days,)
+        )
+    conn.commit()
+
+    started = time.perf_counter()
+    for start in range(1, total + 1, chunk):
+        stop = min(total, start + chunk - 1)
+        with conn.cursor() as cur:
+            cur.execute(ACTIONS_INSERT, {**params, 'start': start, 'stop': stop})
+        conn.commit()
+        print(f'user_actions: {stop}/{total} ({time.perf_counter() - started:.1f}s)')
+
+
+def generate_subscriptions(conn, total: int, endpoint_base: str, chunk: int) -> None:
+    p256dh, auth = _subscriber_keys()
+    for start in range(1, total + 1, chunk):
+        stop = min(total, start + chunk - 1)
+        with conn.cursor() as cur:
+            cur.execute(SUBSCRIPTIONS_INSERT, {
+                'endpoint_base': endpoint_base, 'p256dh': p256dh, 'auth': auth,
+                'start': start, 'stop': stop
+            })
+        conn.commit()
+        print(f'push_subscriptions: {stop}/{total}')
+
+
+def ensure_bench_admin(conn, rounds: int) -> None:
+    password_hash = bcrypt.hashpw(BENCH_ADMIN_PASSWORD.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8')
+    with conn.cursor() as cur:
+        cur.execute(
+            '''INSERT INTO admin_users (username, password_hash) VALUES (%s, %s)
+               ON CONFLICT (username) DO UPDATE SET password_hash = EXCLUDED.password_hash''',
+            (BENCH_ADMIN_USERNAME, password_hash)
+        )
+    conn.commit()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Fill a local database with synthetic benchmark data')
+    parser.add_argument('--database-url', default=os.environ.get('BENCH_DATABASE_URL') or os.environ.get('DATABASE_URL'))
+    parser.add_argument('--actions', type=int, default=1_000_000)
+    parser.add_argument('--subscriptions', type=int, default=20_000)
+    parser.add_argument('--days', type=int, default=365, help='spread user_actions timestamps over this many days')
+    parser.add_argument('--sessions', type=int, default=200_000)
+    parser.add_argument('--visitors', type=int, default=120_000)
+    parser.add_argument('--push-endpoint-base', default='http://127.0.0.1:8089/push/')
+    parser.add_argument('--bcrypt-rounds', type=int, default=12)
+    parser.add_argument('--chunk', type=int, default=200_000)
+    args = parser.parse_args()
+
+    if not args.database_url:
+        parser.error('--database-url or BENCH_DATABASE_URL is required')
+
+    conn = psycopg2.connect(args.database_url)
+    try:
+        ensure_bench_admin(conn, args.bcrypt_rounds)
+        if args.actions:
+            generate_actions(conn, args.actions, args.days, args.sessions, args.visitors, args.chunk)
+        if args.subscriptions:
+            generate_subscriptions(conn, args.subscriptions, args.push_endpoint_base, args.chunk)
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
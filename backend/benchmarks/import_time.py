@@ -0,0 +1,107 @@
+'''
+Замер холодного старта обработчиков: каждый прогон — новый процесс Python,
+в котором импортируется index.py функции и выполняются первые OPTIONS и GET
+(без токена, база не нужна). Показывает и какие тяжёлые зависимости
+оказались загружены к этому моменту.
+
+    python backend/benchmarks/import_time.py --runs 20 --output import_time.json \
+        --compare import_time_baseline.json
+'''
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_ROOT = os.path.dirname(BENCH_DIR)
+
+HEAVY_MODULES = ('psycopg2', 'requests', 'cryptography', 'bcrypt', 'jwt')
+
+# Выполняется в дочернем процессе: печатает JSON с длительностями фаз в секундах
+CHILD_SCRIPT = '''
+import json, sys, time
+started = time.perf_counter()
+sys.path.insert(0, {backend_root!r})
+from shared.loader import InvocationContext, load_function_module
+module = load_function_module({function_name!r})
+imported = time.perf_counter()
+context = InvocationContext({function_name!r})
+module.handler({{'httpMethod': 'OPTIONS'}}, context)
+options_done = time.perf_counter()
+module.handler({{'httpMethod': 'GET', 'headers': {{}}, 'queryStringParameters': {{}}}}, context)
+get_done = time.perf_counter()
+loaded = [name for name in {heavy!r}
+          if name in sys.modules and type(sys.modules[name]).__name__ != '_LazyModule']
+print(json.dumps({{
+    'import': imported - started,
+    'first_options': options_done - imported,
+    'first_get': get_done - options_done,
+    'loaded': loaded
+}}))
+'''
+
+
+def run_child(function_name: str) -> Dict[str, Any]:
+    script = CHILD_SCRIPT.format(backend_root=BACKEND_ROOT, function_name=function_name, heavy=HEAVY_MODULES)
+    env = {key: value for key, value in os.environ.items() if key != 'DATABASE_URL'}
+    started = time.perf_counter()
+    output = subprocess.check_output([sys.executable, '-c', script], env=env, cwd=BACKEND_ROOT)
+    result = json.loads(output.decode().strip().splitlines()[-1])
+    result['process'] = time.perf_counter() - started
+    return result
+
+
+def bench_function(function_name: str, runs: int) -> List[Dict[str, Any]]:
+    from run_benchmarks import summarize
+
+    samples = [run_child(function_name) for _ in range(runs)]
+    results = []
+    for phase in ('import', 'first_options', 'first_get', 'process'):
+        summary = summarize(f'cold_{function_name}_{phase}', [sample[phase] for sample in samples])
+        if phase == 'import':
+            summary['loaded_modules'] = samples[-1]['loaded']
+        results.append(summary)
+    print(f"{function_name}: import p50={results[0]['p50_ms']}ms, "
+          f"process p50={results[-1]['p50_ms']}ms, loaded={','.join(samples[-1]['loaded']) or '-'}")
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Measure cold-start import time of backend handlers')
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--only', default='auth,analytics,push-notifications', help='comma-separated functions')
+    parser.add_argument('--output', default='bench_results_import.json')
+    parser.add_argument('--compare', help='previous results file to check for regressions')
+    parser.add_argument('--threshold', type=float, default=1.2)
+    args = parser.parse_args()
+
+    sys.path.insert(0, BENCH_DIR)
+    from run_benchmarks import compare, git_revision
+
+    results: List[Dict[str, Any]] = []
+    for function_name in args.only.split(','):
+        results.extend(bench_function(function_name, args.runs))
+
+    report: Dict[str, Any] = {'revision': git_revision(), 'python': sys.version.split()[0],
+                              'runs': args.runs, 'results': results}
+
+    exit_code = 0
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as baseline_file:
+            regressions = compare(report, json.load(baseline_file), args.threshold)
+        report['regressions'] = regressions
+        for regression in regressions:
+            print(f"REGRESSION {regression['name']} {regression['metric']}: "
+                  f"{regression['baseline']}ms -> {regression['current']}ms (x{regression['ratio']})")
+        exit_code = 1 if regressions else 0
+
+    with open(args.output, 'w', encoding='utf-8') as output_file:
+        json.dump(report, output_file, ensure_ascii=False, indent=2)
+    sys.exit(exit_code)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+'''
+Локальная замена push-сервиса для бенчмарка рассылки. Принимает POST на
+любой путь и отвечает 201 с заданной задержкой; доля ответов 410 и 429
+настраивается, чтобы проверить деактивацию и повторы.
+
+    python backend/benchmarks/push_service_standin.py --port 8089 --latency-ms 40
+'''
+import argparse
+import random
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    latency = 0.0
+    gone_rate = 0.0
+    throttle_rate = 0.0
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        if self.latency:
+            time.sleep(self.latency)
+
+        roll = random.random()
+        if roll < self.gone_rate:
+            status = 410
+        elif roll < self.gone_rate + self.throttle_rate:
+            status = 429
+        else:
+            status = 201
+
+        self.send_response(status)
+        if status == 429:
+            self.send_header('Retry-After', '1')
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StandInServer(ThreadingHTTPServer):
+    # Рассылка открывает десятки соединений разом, очередь по умолчанию (5) мала
+    request_queue_size = 1024
+    daemon_threads = True
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Local stand-in for a Web Push service')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--latency-ms', type=float, default=40)
+    parser.add_argument('--gone-rate', type=float, default=0.0)
+    parser.add_argument('--throttle-rate', type=float, default=0.0)
+    args = parser.parse_args()
+
+    StandInHandler.latency = args.latency_ms / 1000
+    StandInHandler.gone_rate = args.gone_rate
+    StandInHandler.throttle_rate = args.throttle_rate
+
+    server = StandInServer((args.host, args.port), StandInHandler)
+    print(f'push stand-in listening on http://{args.host}:{args.port}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
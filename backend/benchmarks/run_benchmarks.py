@@ -0,0 +1,316 @@
+'''
+Бенчмарк обработчиков backend: функции handler вызываются напрямую
+синтетическими событиями на локальной базе (см. generate_data.py).
+Результат пишется в JSON, и при --compare сравнивается с прошлым прогоном.
+
+    python backend/benchmarks/run_benchmarks.py --database-url postgresql://... \
+        --output bench.json --compare baseline.json
+'''
+import argparse
+import json
+import math
+import os
+import platform
+import secrets
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+BACKEND_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_ROOT not in sys.path:
+    sys.path.insert(0, BACKEND_ROOT)
+
+from generate_data import BENCH_ADMIN_PASSWORD, BENCH_ADMIN_USERNAME, SAMPLE_USER_AGENTS, PAGES
+
+DEFAULT_DAYS = (1, 7, 30, 90, 365)
+# Во сколько раз метрика может ухудшиться, прежде чем считаться регрессией
+DEFAULT_REGRESSION_THRESHOLD = 1.2
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    rank = (len(sorted_values) - 1) * fraction
+    low, high = math.floor(rank), math.ceil(rank)
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (rank - low)
+
+
+def summarize(name: str, durations: List[float], items_per_call: int = 1, errors: int = 0) -> Dict[str, Any]:
+    ordered = sorted(durations)
+    total = sum(ordered)
+    return {
+        'name': name,
+        'iterations': len(ordered),
+        'errors': errors,
+        'mean_ms': round(total / len(ordered) * 1000, 3) if ordered else 0.0,
+        'p50_ms': round(percentile(ordered, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(ordered, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(ordered, 0.99) * 1000, 3),
+        'max_ms': round(ordered[-1] * 1000, 3) if ordered else 0.0,
+        'throughput_per_s': round(len(ordered) * items_per_call / total, 1) if total else 0.0,
+    }
+
+
+def measure(name: str, call: Callable[[], Dict[str, Any]], iterations: int, warmup: int = 2,
+            items_per_call: int = 1, before_each: Optional[Callable[[], None]] = None) -> Dict[str, Any]:
+    for _ in range(warmup):
+        if before_each:
+            before_each()
+        call()
+
+    durations: List[float] = []
+    errors = 0
+    for _ in range(iterations):
+        if before_each:
+            before_each()
+        started = time.perf_counter()
+        response = call()
+        durations.append(time.perf_counter() - started)
+        if response.get('statusCode', 500) >= 400:
+            errors += 1
+
+    result = summarize(name, durations, items_per_call, errors)
+    print(f"{name}: p50={result['p50_ms']}ms p95={result['p95_ms']}ms "
+          f"throughput={result['throughput_per_s']}/s errors={errors}")
+    return result
+
+
+def analytics_event(n: int) -> Dict[str, Any]:
+    return {
+        'session_id': f'bench_live_{n % 500}',
+        'action_type': 'page_view' if n % 3 else 'click',
+        'action_details': {'bench': True},
+        'page_url': PAGES[n % len(PAGES)],
+        'referrer': ''
+    }
+
+
+def request_headers(n: int, token: str = '') -> Dict[str, str]:
+    headers = {
+        'user-agent': SAMPLE_USER_AGENTS[n % len(SAMPLE_USER_AGENTS)],
+        'x-forwarded-for': f'10.9.{n // 256 % 256}.{n % 256}'
+    }
+    if token:
+        headers['authorization'] = f'Bearer {token}'
+    return headers
+
+
+def bench_auth(handler, context, iterations: int) -> List[Dict[str, Any]]:
+    def login(password: str) -> Callable[[], Dict[str, Any]]:
+        body = json.dumps({'username': BENCH_ADMIN_USERNAME, 'password': password})
+        return lambda: handler({'httpMethod': 'POST', 'headers': request_headers(0), 'body': body}, context)
+
+    return [
+        measure('auth_login', login(BENCH_ADMIN_PASSWORD), iterations),
+        measure('auth_login_invalid', login(BENCH_ADMIN_PASSWORD + '-wrong'), iterations),
+    ]
+
+
+def bench_ingest(handler, context, iterations: int, batch_size: int) -> List[Dict[str, Any]]:
+    counter = iter(range(10 ** 9))
+
+    def single() -> Dict[str, Any]:
+        n = next(counter)
+        return handler({
+            'httpMethod': 'POST', 'headers': request_headers(n),
+            'body': json.dumps(analytics_event(n))
+        }, context)
+
+    def batch() -> Dict[str, Any]:
+        n = next(counter)
+        events = [analytics_event(n * batch_size + i) for i in range(batch_size)]
+        return handler({
+            'httpMethod': 'POST', 'headers': request_headers(n),
+            'body': json.dumps({'events': events})
+        }, context)
+
+    return [
+        measure('ingest_single', single, iterations),
+        measure(f'ingest_batch_{batch_size}', batch, max(1, iterations // 10), items_per_call=batch_size),
+    ]
+
+
+def bench_dashboard(handler, context, module, iterations: int, days_values, token: str) -> List[Dict[str, Any]]:
+    results = []
+    cache = getattr(module, 'dashboard_cache', None)
+
+    def dashboard(params: Dict[str, str]) -> Callable[[], Dict[str, Any]]:
+        event = {'httpMethod': 'GET', 'headers': request_headers(0, token), 'queryStringParameters': params}
+        return lambda: handler(event, context)
+
+    # Агрегаты догоняются один раз, чтобы замер не включал разовую обработку хвоста
+    handler({'httpMethod': 'GET', 'headers': request_headers(0, token),
+             'queryStringParameters': {'action': 'refresh_rollups'}}, context)
+
+    for days in days_values:
+        for mode in ('exact', 'approx', 'sample'):
+            results.append(measure(
+                f'dashboard_{mode}_days_{days}',
+                dashboard({'days': str(days), 'unique': mode}),
+                iterations,
+                before_each=cache.clear if cache else None
+            ))
+
+    if cache:
+        results.append(measure('dashboard_cached_days_7', dashboard({'days': '7'}), iterations))
+    return results
+
+
+def bench_push(handler, context, iterations: int, token: str) -> List[Dict[str, Any]]:
+    body = json.dumps({'title': 'Бенчмарк', 'body': 'Проверка рассылки', 'tag': 'bench'})
+
+    def send() -> Dict[str, Any]:
+        return handler({
+            'httpMethod': 'POST', 'headers': request_headers(0, token),
+            'pathParameters': {'action': 'send'}, 'body': body
+        }, context)
+
+    def stats() -> Dict[str, Any]:
+        return handler({
+            'httpMethod': 'GET', 'headers': request_headers(0, token),
+            'queryStringParameters': {'days': '30'}
+        }, context)
+
+    def drain() -> Dict[str, Any]:
+        return handler({
+            'httpMethod': 'POST', 'headers': request_headers(0, token),
+            'pathParameters': {'action': 'process'}, 'body': '{}'
+        }, context)
+
+    results = [measure('push_send_enqueue', send, iterations, warmup=1)]
+
+    # Время разбора очереди от постановки до последнего ответа push-сервиса.
+    # Сначала очередь очищается от заданий, поставленных замером выше
+    while json.loads(drain()['body']).get('claimed'):
+        pass
+    durations = []
+    for _ in range(iterations):
+        send()
+        started = time.perf_counter()
+        while json.loads(drain()['body']).get('claimed'):
+            pass
+        durations.append(time.perf_counter() - started)
+    results.append(summarize('push_fanout_drain', durations))
+    print(f"push_fanout_drain: p50={results[-1]['p50_ms']}ms")
+
+    results.append(measure('push_stats', stats, iterations * 5))
+    return results
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_ROOT, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[Dict[str, Any]]:
+    '''Сравнивает p50/p95 с прошлым прогоном; возвращает бенчмарки, ставшие медленнее порога'''
+    previous = {result['name']: result for result in baseline.get('results', [])}
+    regressions = []
+    for result in current['results']:
+        before = previous.get(result['name'])
+        if not before:
+            continue
+        for metric in ('p50_ms', 'p95_ms'):
+            if before[metric] and result[metric] / before[metric] > threshold:
+                regressions.append({
+                    'name': result['name'], 'metric': metric,
+                    'baseline': before[metric], 'current': result[metric],
+                    'ratio': round(result[metric] / before[metric], 2)
+                })
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Benchmark backend handlers against a local database')
+    parser.add_argument('--database-url', default=os.environ.get('BENCH_DATABASE_URL') or os.environ.get('DATABASE_URL'))
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--push-iterations', type=int, default=5)
+    parser.add_argument('--batch-size', type=int, default=100)
+    parser.add_argument('--days', default=','.join(map(str, DEFAULT_DAYS)))
+    parser.add_argument('--only', default='auth,analytics,push', help='comma-separated subset of suites')
+    parser.add_argument('--output', default='bench_results.json')
+    parser.add_argument('--compare', help='previous results file to check for regressions')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_REGRESSION_THRESHOLD)
+    args = parser.parse_args()
+
+    if not args.database_url:
+        parser.error('--database-url or BENCH_DATABASE_URL is required')
+
+    # Обработчики читают DATABASE_URL из окружения при каждом вызове
+    os.environ['DATABASE_URL'] = args.database_url
+    # Синтетические события повторяются и часть из них от ботов: меряем запись, а не фильтр
+    os.environ.setdefault('ANALYTICS_FILTER_ENABLED', '0')
+    # auth_login_invalid меряет проверку пароля; с обычными пределами bench_admin
+    # блокировался бы после пятой попытки, а с общим бэкендом — и в следующем запуске
+    os.environ.setdefault('AUTH_THROTTLE_MAX_USER_FAILURES', '1000000')
+    os.environ.setdefault('AUTH_THROTTLE_MAX_IP_FAILURES', '1000000')
+    # Токены выпускаются и проверяются в этом же процессе: хватит случайного секрета на запуск
+    if not (os.environ.get('JWT_SECRETS') or os.environ.get('JWT_SECRET')):
+        os.environ['JWT_SECRET'] = secrets.token_hex(32)
+
+    from shared.loader import InvocationContext, load_function_module
+
+    suites = set(args.only.split(','))
+    days_values = [int(days) for days in args.days.split(',') if days]
+    results: List[Dict[str, Any]] = []
+
+    auth_module = load_function_module('auth')
+    response = auth_module.handler({
+        'httpMethod': 'POST', 'headers': request_headers(0),
+        'body': json.dumps({'username': BENCH_ADMIN_USERNAME, 'password': BENCH_ADMIN_PASSWORD})
+    }, InvocationContext('auth'))
+    token = json.loads(response['body']).get('token', '') if response['statusCode'] == 200 else ''
+    if not token:
+        print('warning: bench admin login failed, run generate_data.py first')
+
+    if 'auth' in suites:
+        results.extend(bench_auth(auth_module.handler, InvocationContext('auth'), args.iterations))
+
+    if 'analytics' in suites:
+        module = load_function_module('analytics')
+        context = InvocationContext('analytics')
+        results.extend(bench_ingest(module.handler, context, args.iterations, args.batch_size))
+        results.extend(bench_dashboard(module.handler, context, module, args.iterations, days_values, token))
+
+    if 'push' in suites:
+        module = load_function_module('push-notifications')
+        results.extend(bench_push(module.handler, InvocationContext('push-notifications'), args.push_iterations, token))
+
+    report: Dict[str, Any] = {
+        'started_at': datetime.now(timezone.utc).isoformat(),
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'parameters': {
+            'iterations': args.iterations,
+            'push_iterations': args.push_iterations,
+            'batch_size': args.batch_size,
+            'days': days_values
+        },
+        'results': results
+    }
+
+    exit_code = 0
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as baseline_file:
+            regressions = compare(report, json.load(baseline_file), args.threshold)
+        report['regressions'] = regressions
+        for regression in regressions:
+            print(f"REGRESSION {regression['name']} {regression['metric']}: "
+                  f"{regression['baseline']}ms -> {regression['current']}ms (x{regression['ratio']})")
+        exit_code = 1 if regressions else 0
+
+    with open(args.output, 'w', encoding='utf-8') as output_file:
+        json.dump(report, output_file, ensure_ascii=False, indent=2)
+    print(f'results written to {args.output}')
+    sys.exit(exit_code)
+
+
+if __name__ == '__main__':
+    main()
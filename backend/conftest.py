@@ -0,0 +1,41 @@
+import os
+import sys
+
+import pytest
+
+# В папках функций лежат копии shared (python -m shared.vendor); тесты, которые
+# добавляют в sys.path только папку своей функции, должны видеть оригинал
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+MIGRATIONS_DIR = os.path.join(os.path.dirname(BACKEND_DIR), 'db_migrations')
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+import shared  # noqa: E402,F401
+
+
+@pytest.fixture
+def scratch_conn():
+    '''Подключение к TEST_DATABASE_URL со своей схемой, в которой применены все миграции'''
+    database_url = os.environ.get('TEST_DATABASE_URL')
+    if not database_url:
+        pytest.skip('TEST_DATABASE_URL is not set')
+    psycopg2 = pytest.importorskip('psycopg2')
+
+    conn = psycopg2.connect(database_url)
+    schema = f'backend_test_{os.getpid()}'
+    with conn.cursor() as cur:
+        cur.execute(f'CREATE SCHEMA {schema}')
+        cur.execute(f'SET search_path TO {schema}, public')
+        for name in sorted(os.listdir(MIGRATIONS_DIR)):
+            if name.endswith('.sql'):
+                with open(os.path.join(MIGRATIONS_DIR, name), encoding='utf-8') as f:
+                    cur.execute(f.read())
+    conn.commit()
+    try:
+        yield conn
+    finally:
+        conn.rollback()
+        with conn.cursor() as cur:
+            cur.execute(f'DROP SCHEMA {schema} CASCADE')
+        conn.commit()
+        conn.close()
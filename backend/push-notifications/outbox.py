@@ -0,0 +1,223 @@
+import json
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+from psycopg2.extras import execute_values
+
+# Общие модули из backend/shared (при запуске воркера из командной строки)
+SHARED_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if SHARED_ROOT not in sys.path:
+    sys.path.insert(0, SHARED_ROOT)
+
+from shared import metrics
+from shared.db import get_connection, release_connection
+from subscriptions import deactivate_subscriptions, touch_subscriptions
+from webpush import DEFAULT_TTL, DeliveryResult, Subscription, deliver, encrypted_requests
+
+BATCH_SIZE = int(os.environ.get('PUSH_OUTBOX_BATCH_SIZE', '500'))
+MAX_ATTEMPTS = int(os.environ.get('PUSH_OUTBOX_MAX_ATTEMPTS', '8'))
+BACKOFF_BASE = float(os.environ.get('PUSH_OUTBOX_BACKOFF_BASE', '30'))
+BACKOFF_MAX = float(os.environ.get('PUSH_OUTBOX_BACKOFF_MAX', '3600'))
+# Сколько секунд воркер разбирает очередь за один вызов функции
+WORKER_TIME_BUDGET = float(os.environ.get('PUSH_OUTBOX_TIME_BUDGET', '20'))
+
+# Задания блокируются на время доставки; упавший воркер просто отпускает блокировку
+CLAIM_QUERY = '''/* push_outbox_claim */
+    SELECT o.id, o.notification_id, o.attempts, o.expires_at <= NOW(), s.is_active,
+           s.id, s.endpoint, s.p256dh, s.auth
+    FROM push_outbox o
+    JOIN push_subscriptions s ON s.id = o.subscription_id
+    WHERE o.status = 'pending' AND o.next_attempt_at <= NOW()
+    ORDER BY o.next_attempt_at
+    LIMIT %s
+    FOR UPDATE OF o SKIP LOCKED
+'''
+
+
+class OutboxJob:
+    __slots__ = ('id', 'notification_id', 'attempts', 'expired', 'active', 'subscription')
+
+    def __init__(self, row: Tuple):
+        self.id, self.notification_id, self.attempts, self.expired, self.active = row[:5]
+        self.subscription = Subscription(*row[5:])
+
+
+def enqueue_notification(cur: Any, notification_id: int, ttl: int = DEFAULT_TTL,
+                         topics: Optional[List[str]] = None) -> int:
+    '''
+    Business: Ставит уведомление в очередь подписчикам одним INSERT ... SELECT.
+              Подписчики выбираются на стороне базы, в память функции не попадает ни одна строка
+    Args: cur - курсор psycopg2
+          notification_id - id строки push_notifications
+          ttl - время жизни уведомления в секундах
+          topics - темы рассылки; пусто — всем активным подписчикам
+    Returns: число поставленных заданий
+    '''
+    if topics:
+        # Пересечение массивов обслуживает GIN-индекс по topics
+        cur.execute(
+            '''INSERT INTO push_outbox (notification_id, subscription_id, expires_at)
+               SELECT %s, id, NOW() + make_interval(secs => %s)
+               FROM push_subscriptions
+               WHERE is_active = true AND topics && %s::text[]''',
+            (notification_id, ttl, topics)
+        )
+    else:
+        cur.execute(
+            '''INSERT INTO push_outbox (notification_id, subscription_id, expires_at)
+               SELECT %s, id, NOW() + make_interval(secs => %s)
+               FROM push_subscriptions
+               WHERE is_active = true''',
+            (notification_id, ttl)
+        )
+    return cur.rowcount
+
+
+def backoff_delay(attempts: int, retry_after: Optional[str] = None) -> float:
+    '''Экспоненциальная задержка с разбросом; Retry-After от push-сервиса имеет приоритет'''
+    delay = min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempts)) * random.uniform(0.8, 1.2)
+    if retry_after and retry_after.strip().isdigit():
+        delay = max(delay, float(retry_after))
+    return delay
+
+
+def _notification_payloads(cur: Any, notification_ids: List[int]) -> Dict[int, Tuple[bytes, int]]:
+    cur.execute(
+        '''SELECT id, title, body, icon, badge, tag, data, ttl
+           FROM push_notifications WHERE id = ANY(%s)''',
+        (notification_ids,)
+    )
+    payloads = {}
+    for notification_id, title, body, icon, badge, tag, data, ttl in cur.fetchall():
+        payload = json.dumps({
+            'title': title, 'body': body, 'icon': icon,
+            'badge': badge, 'tag': tag, 'data': data or {}
+        }, ensure_ascii=False).encode('utf-8')
+        payloads[notification_id] = (payload, ttl)
+    return payloads
+
+
+def _job_outcome(job: OutboxJob, result: DeliveryResult) -> Tuple[str, float]:
+    if result.ok:
+        return 'sent', 0.0
+    if result.retryable and job.attempts + 1 < MAX_ATTEMPTS:
+        return 'pending', backoff_delay(job.attempts, result.retry_after)
+    return 'failed', 0.0
+
+
+def process_batch(conn: Any, batch_size: int = BATCH_SIZE) -> Dict[str, int]:
+    '''
+    Business: Забирает пачку заданий (FOR UPDATE SKIP LOCKED), доставляет и фиксирует итог
+    Args: conn - подключение psycopg2
+          batch_size - максимум заданий за пачку
+    Returns: dict со счётчиками claimed/sent/retry/failed/expired
+    '''
+    counts = {'claimed': 0, 'sent': 0, 'retry': 0, 'failed': 0, 'expired': 0, 'deactivated': 0}
+    with conn.cursor() as cur:
+        cur.execute(CLAIM_QUERY, (batch_size,))
+        jobs = [OutboxJob(row) for row in cur.fetchall()]
+        counts['claimed'] = len(jobs)
+        if not jobs:
+            conn.rollback()
+            return counts
+
+        updates: List[Tuple] = []
+        success_by_notification: Dict[int, int] = defaultdict(int)
+        by_notification: Dict[int, List[OutboxJob]] = defaultdict(list)
+        delivered_ids: List[int] = []
+        gone_ids: List[int] = []
+        for job in jobs:
+            if job.expired:
+                updates.append((job.id, 'expired', 0.0, None, 'ttl expired'))
+                counts['expired'] += 1
+            elif not job.active:
+                # Подписку отключили после постановки в очередь — отправлять некуда
+                updates.append((job.id, 'failed', 0.0, None, 'subscription inactive'))
+                counts['failed'] += 1
+            else:
+                by_notification[job.notification_id].append(job)
+
+        payloads = _notification_payloads(cur, list(by_notification)) if by_notification else {}
+        for notification_id, group in by_notification.items():
+            payload, ttl = payloads[notification_id]
+            subscriptions = [job.subscription for job in group]
+            jobs_by_subscription = {job.subscription.id: job for job in group}
+
+            report = deliver(subscriptions, encrypted_requests(payload, subscriptions, ttl))
+            for result in report.results:
+                job = jobs_by_subscription[result.subscription.id]
+                status, delay = _job_outcome(job, result)
+                updates.append((job.id, status, delay, result.status_code, result.error))
+                if result.gone:
+                    gone_ids.append(job.subscription.id)
+                if status == 'sent':
+                    success_by_notification[notification_id] += 1
+                    delivered_ids.append(job.subscription.id)
+                    counts['sent'] += 1
+                elif status == 'pending':
+                    counts['retry'] += 1
+                else:
+                    counts['failed'] += 1
+
+        execute_values(
+            cur,
+            '''UPDATE push_outbox o
+               SET status = v.status,
+                   attempts = o.attempts + 1,
+                   next_attempt_at = NOW() + make_interval(secs => v.delay),
+                   last_status = v.last_status,
+                   last_error = v.last_error,
+                   updated_at = CURRENT_TIMESTAMP
+               FROM (VALUES %s) AS v(id, status, delay, last_status, last_error)
+               WHERE o.id = v.id''',
+            updates,
+            template='(%s, %s, %s::float8, %s::smallint, %s)'
+        )
+        # Мёртвые endpoint'ы отключаются пачкой и не попадают в следующие рассылки
+        counts['deactivated'] = deactivate_subscriptions(cur, gone_ids)
+        touch_subscriptions(cur, delivered_ids)
+        # success_count растёт по мере доставки, а не после всей рассылки
+        for notification_id, delivered in success_by_notification.items():
+            cur.execute(
+                'UPDATE push_notifications SET success_count = success_count + %s WHERE id = %s',
+                (delivered, notification_id)
+            )
+    conn.commit()
+    return counts
+
+
+def run_worker(database_url: str, time_budget: float = WORKER_TIME_BUDGET,
+               batch_size: int = BATCH_SIZE) -> Dict[str, int]:
+    '''Разбирает очередь, пока есть готовые задания и не исчерпан бюджет времени'''
+    deadline = time.monotonic() + time_budget
+    totals = {'batches': 0, 'claimed': 0, 'sent': 0, 'retry': 0, 'failed': 0, 'expired': 0, 'deactivated': 0}
+    conn = get_connection(database_url)
+    try:
+        while time.monotonic() < deadline:
+            counts = process_batch(conn, batch_size)
+            if not counts['claimed']:
+                break
+            totals['batches'] += 1
+            for key, value in counts.items():
+                totals[key] += value
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        release_connection(conn, database_url)
+    return totals
+
+
+if __name__ == '__main__':
+    # Локальный запуск нескольких воркеров: python outbox.py [число_воркеров]
+    from concurrent.futures import ThreadPoolExecutor
+
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else 1
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(run_worker, os.environ['DATABASE_URL'], float('inf')) for _ in range(workers)]
+        for worker, future in enumerate(futures):
+            metrics.log_event('push_outbox_worker_done', worker=worker, **future.result())
@@ -0,0 +1,240 @@
+import base64
+import hashlib
+import hmac
+import json
+import multiprocessing
+import os
+import struct
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.hazmat.primitives.asymmetric.utils import decode_dss_signature
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+RECORD_SIZE = 4096
+# Ключи подписчиков повторяются от рассылки к рассылке, декодированная точка кривой кэшируется
+KEY_CACHE_SIZE = int(os.environ.get('PUSH_KEY_CACHE_SIZE', '65536'))
+# С какого числа подписчиков шифрование уходит в пул процессов. Очередь отдаёт
+# рассылку пачками по outbox.BATCH_SIZE (500), поэтому порог должен быть ниже
+PROCESS_POOL_THRESHOLD = int(os.environ.get('PUSH_CRYPTO_PROCESS_THRESHOLD', '200'))
+PROCESS_POOL_SIZE = int(os.environ.get('PUSH_CRYPTO_PROCESSES', '0')) or (os.cpu_count() or 1)
+
+VAPID_TOKEN_LIFETIME = int(os.environ.get('PUSH_VAPID_TOKEN_LIFETIME', '43200'))
+# Токен перевыпускается заранее, чтобы не отправить почти истёкший
+VAPID_RENEW_MARGIN = 600
+
+KEY_INFO_PREFIX = b'WebPush: info\x00'
+CEK_INFO = b'Content-Encoding: aes128gcm\x00\x01'
+NONCE_INFO = b'Content-Encoding: nonce\x00\x01'
+
+# (id подписки, p256dh, auth)
+SubscriberKeys = Tuple[int, str, str]
+
+
+def b64url_decode(value: str) -> bytes:
+    value = value.strip()
+    return base64.urlsafe_b64decode(value + '=' * (-len(value) % 4))
+
+
+def b64url_encode(value: bytes) -> str:
+    return base64.urlsafe_b64encode(value).decode('ascii').rstrip('=')
+
+
+def _hmac_sha256(key: bytes, data: bytes) -> bytes:
+    return hmac.new(key, data, hashlib.sha256).digest()
+
+
+@lru_cache(maxsize=KEY_CACHE_SIZE)
+def decode_subscriber_keys(p256dh: str, auth: str) -> Tuple[ec.EllipticCurvePublicKey, bytes, bytes]:
+    '''Публичный ключ подписчика (объект и 65 байт точки) и 16 байт auth-секрета'''
+    public_bytes = b64url_decode(p256dh)
+    public_key = ec.EllipticCurvePublicKey.from_encoded_point(ec.SECP256R1(), public_bytes)
+    auth_secret = b64url_decode(auth)
+    if len(auth_secret) != 16:
+        raise ValueError('auth secret must be 16 bytes')
+    return public_key, public_bytes, auth_secret
+
+
+class BroadcastKey:
+    '''
+    Эфемерная пара ECDH на одну рассылку. Для каждого получателя всё равно
+    получается свой ключ шифрования: общий секрет зависит от ключа подписчика,
+    а соль генерируется на каждое сообщение.
+    '''
+
+    def __init__(self, private_key: Optional[ec.EllipticCurvePrivateKey] = None):
+        self.private_key = private_key or ec.generate_private_key(ec.SECP256R1())
+        self.public_bytes = self.private_key.public_key().public_bytes(
+            serialization.Encoding.X962, serialization.PublicFormat.UncompressedPoint
+        )
+
+    def private_value(self) -> int:
+        return self.private_key.private_numbers().private_value
+
+    @classmethod
+    def from_private_value(cls, value: int) -> 'BroadcastKey':
+        return cls(ec.derive_private_key(value, ec.SECP256R1()))
+
+    def encrypt(self, payload: bytes, p256dh: str, auth: str, salt: Optional[bytes] = None) -> bytes:
+        '''Шифрует payload для одного подписчика по RFC 8291 (aes128gcm, одна запись)'''
+        ua_public_key, ua_public_bytes, auth_secret = decode_subscriber_keys(p256dh, auth)
+        if len(payload) + 1 + 16 > RECORD_SIZE - 86:
+            raise ValueError('payload too large for a single record')
+
+        salt = salt or os.urandom(16)
+        shared_secret = self.private_key.exchange(ec.ECDH(), ua_public_key)
+
+        # HKDF-SHA256: все выходы короче одного блока, поэтому Expand — один HMAC
+        prk_key = _hmac_sha256(auth_secret, shared_secret)
+        ikm = _hmac_sha256(prk_key, KEY_INFO_PREFIX + ua_public_bytes + self.public_bytes + b'\x01')
+        prk = _hmac_sha256(salt, ikm)
+        cek = _hmac_sha256(prk, CEK_INFO)[:16]
+        nonce = _hmac_sha256(prk, NONCE_INFO)[:12]
+
+        # 0x02 — разделитель последней записи
+        ciphertext = AESGCM(cek).encrypt(nonce, payload + b'\x02', None)
+        header = salt + struct.pack('!IB', RECORD_SIZE, len(self.public_bytes)) + self.public_bytes
+        return header + ciphertext
+
+
+def _encrypt_chunk(private_value: int, payload: bytes, chunk: Sequence[SubscriberKeys]) -> List[Tuple[int, Optional[bytes]]]:
+    broadcast_key = BroadcastKey.from_private_value(private_value)
+    return [(subscription_id, _encrypt_or_none(broadcast_key, payload, p256dh, auth))
+            for subscription_id, p256dh, auth in chunk]
+
+
+def _encrypt_or_none(broadcast_key: BroadcastKey, payload: bytes, p256dh: str, auth: str) -> Optional[bytes]:
+    try:
+        return broadcast_key.encrypt(payload, p256dh, auth)
+    except (ValueError, TypeError):
+        return None
+
+
+_process_pool: Optional[ProcessPoolExecutor] = None
+_process_pool_lock = threading.Lock()
+
+
+def _get_process_pool() -> Optional[ProcessPoolExecutor]:
+    global _process_pool
+    if _process_pool is None:
+        with _process_pool_lock:
+            if _process_pool is None:
+                # fork копировал бы в воркеры замки, захваченные потоками процесса
+                # (пул соединений, буферы, HTTP-сессии); forkserver и spawn стартуют чисто
+                methods = multiprocessing.get_all_start_methods()
+                context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+                try:
+                    _process_pool = ProcessPoolExecutor(max_workers=PROCESS_POOL_SIZE, mp_context=context)
+                except (OSError, NotImplementedError):
+                    # Без /dev/shm (часть serverless-сред) пул процессов недоступен
+                    return None
+    return _process_pool
+
+
+def encrypt_broadcast(payload: bytes, subscriptions: Sequence[SubscriberKeys],
+                      broadcast_key: Optional[BroadcastKey] = None) -> Dict[int, Optional[bytes]]:
+    '''
+    Business: Шифрует одно уведомление для всех подписчиков рассылки
+    Args: payload - тело уведомления
+          subscriptions - (id, p256dh, auth) подписчиков
+          broadcast_key - эфемерный ключ рассылки (по умолчанию новый)
+    Returns: dict id подписки -> зашифрованное тело или None при битых ключах
+    '''
+    broadcast_key = broadcast_key or BroadcastKey()
+    pool = _get_process_pool() if len(subscriptions) >= PROCESS_POOL_THRESHOLD and PROCESS_POOL_SIZE > 1 else None
+
+    if pool is None:
+        return {
+            subscription_id: _encrypt_or_none(broadcast_key, payload, p256dh, auth)
+            for subscription_id, p256dh, auth in subscriptions
+        }
+
+    chunk_size = max(1, -(-len(subscriptions) // (PROCESS_POOL_SIZE * 4)))
+    chunks = [subscriptions[i:i + chunk_size] for i in range(0, len(subscriptions), chunk_size)]
+    private_value = broadcast_key.private_value()
+    encrypted: Dict[int, Optional[bytes]] = {}
+    try:
+        for results in pool.map(_encrypt_chunk, [private_value] * len(chunks), [payload] * len(chunks), chunks):
+            encrypted.update(results)
+    except Exception:
+        # Пул мог сломаться (например, воркер убит по памяти) — досчитываем в текущем процессе
+        _reset_process_pool()
+        for subscription_id, p256dh, auth in subscriptions:
+            if subscription_id not in encrypted:
+                encrypted[subscription_id] = _encrypt_or_none(broadcast_key, payload, p256dh, auth)
+    return encrypted
+
+
+def _reset_process_pool() -> None:
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is not None:
+            _process_pool.shutdown(wait=False, cancel_futures=True)
+            _process_pool = None
+
+
+def load_vapid_key(value: str) -> ec.EllipticCurvePrivateKey:
+    '''VAPID-ключ из PEM или из 32 байт скаляра в base64url (формат web-push библиотек)'''
+    value = value.strip()
+    if value.startswith('-----BEGIN'):
+        return serialization.load_pem_private_key(value.encode('ascii'), password=None)
+    return ec.derive_private_key(int.from_bytes(b64url_decode(value), 'big'), ec.SECP256R1())
+
+
+class VapidSigner:
+    '''Подписывает VAPID JWT (ES256) и кэширует токен на каждый push-сервис до истечения'''
+
+    def __init__(self, private_key: ec.EllipticCurvePrivateKey, subject: str,
+                 lifetime: int = VAPID_TOKEN_LIFETIME, renew_margin: int = VAPID_RENEW_MARGIN):
+        self.private_key = private_key
+        self.subject = subject
+        self.lifetime = lifetime
+        self.renew_margin = renew_margin
+        self.public_key = b64url_encode(private_key.public_key().public_bytes(
+            serialization.Encoding.X962, serialization.PublicFormat.UncompressedPoint
+        ))
+        self._tokens: Dict[str, Tuple[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def _sign(self, audience: str, expires_at: int) -> str:
+        header = b64url_encode(json.dumps({'typ': 'JWT', 'alg': 'ES256'}, separators=(',', ':')).encode())
+        claims = b64url_encode(json.dumps(
+            {'aud': audience, 'exp': expires_at, 'sub': self.subject}, separators=(',', ':')
+        ).encode())
+        signing_input = f'{header}.{claims}'.encode('ascii')
+        r, s = decode_dss_signature(self.private_key.sign(signing_input, ec.ECDSA(hashes.SHA256())))
+        return f'{header}.{claims}.{b64url_encode(r.to_bytes(32, "big") + s.to_bytes(32, "big"))}'
+
+    def authorization(self, audience: str) -> str:
+        now = time.time()
+        cached = self._tokens.get(audience)
+        if cached is None or cached[1] - self.renew_margin <= now:
+            with self._lock:
+                cached = self._tokens.get(audience)
+                if cached is None or cached[1] - self.renew_margin <= now:
+                    expires_at = int(now) + self.lifetime
+                    cached = (self._sign(audience, expires_at), expires_at)
+                    self._tokens[audience] = cached
+        return f'vapid t={cached[0]}, k={self.public_key}'
+
+
+_vapid_signer: Optional[VapidSigner] = None
+
+
+def get_vapid_signer() -> Optional[VapidSigner]:
+    '''Подписчик VAPID из VAPID_PRIVATE_KEY / VAPID_SUBJECT; None, если ключ не задан'''
+    global _vapid_signer
+    private_key = os.environ.get('VAPID_PRIVATE_KEY')
+    if not private_key:
+        return None
+    if _vapid_signer is None:
+        _vapid_signer = VapidSigner(
+            load_vapid_key(private_key),
+            os.environ.get('VAPID_SUBJECT', 'mailto:admin@example.com')
+        )
+    return _vapid_signer
@@ -0,0 +1,99 @@
+from typing import Any, Dict, List, Optional
+
+HISTORY_DEFAULT_LIMIT = 10
+HISTORY_MAX_LIMIT = 100
+
+# Полные дни окна — из push_daily_stats, неполный первый день — из самих уведомлений
+WINDOW_STATS_QUERY = '''/* push_window_stats */
+    WITH bounds AS (
+        SELECT
+            NOW() - make_interval(days => %(days)s) AS window_start,
+            ((NOW() - make_interval(days => %(days)s)) AT TIME ZONE 'UTC')::date + 1 AS first_full_day
+    ),
+    parts AS (
+        SELECT d.notifications, d.sent, d.success, d.rate_sum, d.rate_count
+        FROM push_daily_stats d, bounds b
+        WHERE d.day >= b.first_full_day
+        UNION ALL
+        SELECT 1, n.sent_count, n.success_count,
+               n.success_count::float8 / NULLIF(n.sent_count, 0),
+               CASE WHEN n.sent_count > 0 THEN 1 ELSE 0 END
+        FROM push_notifications n, bounds b
+        WHERE n.created_at >= b.window_start
+          AND n.created_at < b.first_full_day::timestamp AT TIME ZONE 'UTC'
+    )
+    SELECT
+        COALESCE(SUM(notifications), 0),
+        COALESCE(SUM(sent), 0),
+        COALESCE(SUM(success), 0),
+        SUM(rate_sum) / NULLIF(SUM(rate_count), 0),
+        (SELECT value FROM push_counters WHERE name = 'active_subscriptions')
+    FROM parts
+'''
+
+HISTORY_COLUMNS = 'id, title, body, sent_count, success_count, created_at, topics'
+
+
+def window_stats(cur: Any, days: int) -> Dict[str, Any]:
+    '''
+    Business: Статистика рассылок за окно по счётчикам вместо SUM/AVG по всей таблице
+    Args: cur - курсор psycopg2
+          days - период в днях
+    Returns: dict с числом уведомлений, отправок, успешных доставок, средней долей успеха и активными подписками
+    '''
+    cur.execute(WINDOW_STATS_QUERY, {'days': days})
+    notifications, sent, success, success_rate, active_subscriptions = cur.fetchone()
+    return {
+        'active_subscriptions': active_subscriptions or 0,
+        'total_notifications': notifications,
+        'total_sent': sent,
+        'total_success': success,
+        'success_rate': round((success_rate or 0) * 100, 1)
+    }
+
+
+def notification_history(cur: Any, before_id: Optional[int] = None,
+                         limit: int = HISTORY_DEFAULT_LIMIT) -> Dict[str, Any]:
+    '''
+    Business: Страница истории уведомлений от новых к старым, keyset по (created_at, id)
+    Args: cur - курсор psycopg2
+          before_id - id последнего уведомления предыдущей страницы
+          limit - размер страницы
+    Returns: dict со списком уведомлений и next_before_id для следующей страницы
+    '''
+    limit = max(1, min(limit, HISTORY_MAX_LIMIT))
+    if before_id is None:
+        cur.execute(
+            f'''SELECT {HISTORY_COLUMNS}
+                FROM push_notifications
+                ORDER BY created_at DESC, id DESC
+                LIMIT %s''',
+            (limit,)
+        )
+    else:
+        cur.execute(
+            f'''SELECT {HISTORY_COLUMNS}
+                FROM push_notifications
+                WHERE (created_at, id) < (SELECT created_at, id FROM push_notifications WHERE id = %s)
+                ORDER BY created_at DESC, id DESC
+                LIMIT %s''',
+            (before_id, limit)
+        )
+    rows = cur.fetchall()
+
+    notifications: List[Dict[str, Any]] = [
+        {
+            'id': row[0],
+            'title': row[1],
+            'body': row[2],
+            'sent_count': row[3],
+            'success_count': row[4],
+            'created_at': row[5].isoformat() if row[5] else None,
+            'topics': row[6]
+        }
+        for row in rows
+    ]
+    return {
+        'notifications': notifications,
+        'next_before_id': notifications[-1]['id'] if len(notifications) == limit else None
+    }
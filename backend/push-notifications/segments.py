@@ -0,0 +1,32 @@
+import re
+from typing import Any, List, Optional
+
+MAX_TOPICS = 32
+TOPIC_PATTERN = re.compile(r'^[a-z0-9][a-z0-9_.:-]{0,63}$')
+
+
+def normalize_topics(value: Any) -> Optional[List[str]]:
+    '''
+    Приводит список тем из запроса к виду для хранения: нижний регистр, без повторов, по порядку.
+    None — темы не переданы; ValueError — некорректный список.
+    '''
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = [value]
+    if not isinstance(value, list):
+        raise ValueError('topics must be a list of strings')
+
+    topics: List[str] = []
+    for item in value:
+        if not isinstance(item, str):
+            raise ValueError('topics must be a list of strings')
+        topic = item.strip().lower()
+        if not TOPIC_PATTERN.match(topic):
+            raise ValueError(f'Invalid topic: {item!r}')
+        if topic not in topics:
+            topics.append(topic)
+
+    if len(topics) > MAX_TOPICS:
+        raise ValueError(f'At most {MAX_TOPICS} topics allowed')
+    return topics
@@ -0,0 +1,264 @@
+# Копия backend/shared/db.py, не править: python -m shared.vendor
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+
+import psycopg2
+import psycopg2.extensions
+
+from shared import metrics
+
+# Настройки пула через переменные окружения
+POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', '5'))
+POOL_IDLE_TIMEOUT = float(os.environ.get('DB_POOL_IDLE_TIMEOUT', '300'))
+POOL_HEALTH_CHECK_INTERVAL = float(os.environ.get('DB_POOL_HEALTH_CHECK_INTERVAL', '30'))
+POOL_ACQUIRE_TIMEOUT = float(os.environ.get('DB_POOL_ACQUIRE_TIMEOUT', '10'))
+POOL_CONNECT_RETRIES = int(os.environ.get('DB_POOL_CONNECT_RETRIES', '2'))
+
+
+class PoolTimeout(Exception):
+    '''Не удалось получить соединение из пула за отведённое время'''
+
+
+class TimedCursor(psycopg2.extensions.cursor):
+    '''Курсор, замеряющий каждый запрос, если текущий запрос попал в выборку метрик'''
+
+    def execute(self, query: Any, vars: Any = None) -> Any:
+        if not metrics.sql_sampled():
+            return super().execute(query, vars)
+        started = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            metrics.observe_sql(query if isinstance(query, (str, bytes)) else query.as_string(self),
+                                time.perf_counter() - started)
+
+    def executemany(self, query: Any, vars_list: Any) -> Any:
+        if not metrics.sql_sampled():
+            return super().executemany(query, vars_list)
+        started = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            metrics.observe_sql(query if isinstance(query, (str, bytes)) else query.as_string(self),
+                                time.perf_counter() - started)
+
+
+class ConnectionPool:
+    '''
+    Пул соединений psycopg2, живущий между тёплыми вызовами функции.
+    Свободные соединения выдаются LIFO, давно простаивающие закрываются,
+    перед выдачей соединение проверяется SELECT 1, упавшие пересоздаются.
+    '''
+
+    def __init__(self, dsn: str, max_size: int = POOL_MAX_SIZE,
+                 idle_timeout: float = POOL_IDLE_TIMEOUT,
+                 health_check_interval: float = POOL_HEALTH_CHECK_INTERVAL,
+                 acquire_timeout: float = POOL_ACQUIRE_TIMEOUT,
+                 connect_retries: int = POOL_CONNECT_RETRIES):
+        self.dsn = dsn
+        self.max_size = max(1, max_size)
+        self.idle_timeout = idle_timeout
+        self.health_check_interval = health_check_interval
+        self.acquire_timeout = acquire_timeout
+        self.connect_retries = max(0, connect_retries)
+
+        self._lock = threading.Condition()
+        # Свободные соединения: (conn, время возврата в пул)
+        self._idle: List[Tuple[Any, float]] = []
+        self._in_use = 0
+        self._stats = {'created': 0, 'reused': 0, 'evicted': 0, 'broken': 0, 'timeouts': 0}
+
+    def _count(self, key: str, amount: int = 1) -> None:
+        with self._lock:
+            self._stats[key] += amount
+
+    def _connect(self) -> Any:
+        for attempt in range(self.connect_retries + 1):
+            try:
+                conn = psycopg2.connect(self.dsn, cursor_factory=TimedCursor)
+                self._count('created')
+                return conn
+            except psycopg2.OperationalError:
+                # После последней попытки ждать уже нечего
+                if attempt == self.connect_retries:
+                    raise
+                time.sleep(min(0.05 * (2 ** attempt), 1.0))
+
+    @staticmethod
+    def _close_quietly(conn: Any) -> None:
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _is_healthy(self, conn: Any, idle_since: float) -> bool:
+        if conn.closed:
+            return False
+        if time.monotonic() - idle_since < self.health_check_interval:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute('SELECT 1')
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def _evict_idle(self) -> List[Any]:
+        '''Убирает из пула соединения, простоявшие дольше idle_timeout (под локом)'''
+        now = time.monotonic()
+        expired = [conn for conn, since in self._idle if now - since > self.idle_timeout]
+        if expired:
+            self._idle = [(conn, since) for conn, since in self._idle if now - since <= self.idle_timeout]
+            self._stats['evicted'] += len(expired)
+        return expired
+
+    def getconn(self) -> Any:
+        '''Выдаёт рабочее соединение, при необходимости создавая новое'''
+        with metrics.timed('db_connection_acquire_seconds', 'Time to get a pooled connection'):
+            return self._acquire()
+
+    def _acquire(self) -> Any:
+        deadline = time.monotonic() + self.acquire_timeout
+        while True:
+            candidate = None
+            with self._lock:
+                expired = self._evict_idle()
+                while not self._idle and self._in_use >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats['timeouts'] += 1
+                        raise PoolTimeout(f'No free database connection after {self.acquire_timeout}s')
+                    self._lock.wait(remaining)
+                    expired += self._evict_idle()
+                if self._idle:
+                    candidate = self._idle.pop()
+                self._in_use += 1
+
+            for conn in expired:
+                self._close_quietly(conn)
+
+            if candidate is None:
+                try:
+                    return self._connect()
+                except Exception:
+                    self._release_slot()
+                    raise
+
+            conn, idle_since = candidate
+            if self._is_healthy(conn, idle_since):
+                self._count('reused')
+                return conn
+
+            # Соединение умерло, пока лежало в пуле: закрываем и пробуем снова
+            self._count('broken')
+            self._close_quietly(conn)
+            self._release_slot()
+
+    def _release_slot(self) -> None:
+        with self._lock:
+            self._in_use -= 1
+            self._lock.notify()
+
+    def putconn(self, conn: Any, discard: bool = False) -> None:
+        '''Возвращает соединение в пул, откатывая незавершённую транзакцию'''
+        if not discard and not conn.closed:
+            try:
+                status = conn.info.transaction_status
+                if status == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+                    discard = True
+                elif status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except Exception:
+                discard = True
+
+        if discard or conn.closed:
+            self._count('broken')
+            self._close_quietly(conn)
+            self._release_slot()
+            return
+
+        with self._lock:
+            self._idle.append((conn, time.monotonic()))
+            self._in_use -= 1
+            self._lock.notify()
+
+    @contextmanager
+    def connection(self) -> Iterator[Any]:
+        '''Контекстный менеджер: соединение возвращается в пул при выходе'''
+        conn = self.getconn()
+        try:
+            yield conn
+        except psycopg2.OperationalError:
+            self.putconn(conn, discard=True)
+            raise
+        except Exception:
+            self.putconn(conn)
+            raise
+        else:
+            self.putconn(conn)
+
+    def closeall(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            self._close_quietly(conn)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'max_size': self.max_size,
+                'idle': len(self._idle),
+                'in_use': self._in_use,
+                **self._stats
+            }
+
+
+# Пулы на уровне модуля переживают тёплые вызовы функции
+_pools: Dict[str, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(dsn: Optional[str] = None) -> ConnectionPool:
+    '''Возвращает общий пул для DSN (по умолчанию DATABASE_URL)'''
+    dsn = dsn or os.environ.get('DATABASE_URL', '')
+    pool = _pools.get(dsn)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(dsn)
+            if pool is None:
+                pool = ConnectionPool(dsn)
+                _pools[dsn] = pool
+    return pool
+
+
+def get_connection(dsn: Optional[str] = None) -> Any:
+    return get_pool(dsn).getconn()
+
+
+def release_connection(conn: Any, dsn: Optional[str] = None) -> None:
+    get_pool(dsn).putconn(conn)
+
+
+def pools_stats() -> Dict[str, Any]:
+    '''Сумма счётчиков всех пулов экземпляра'''
+    with _pools_lock:
+        pools = list(_pools.values())
+    totals: Dict[str, Any] = {}
+    for pool in pools:
+        for key, value in pool.stats().items():
+            totals[key] = totals.get(key, 0) + value
+    return totals
+
+
+metrics.register_collector('db_pool', pools_stats)
+
+
+def close_all_pools() -> None:
+    with _pools_lock:
+        pools = list(_pools.values())
+    for pool in pools:
+        pool.closeall()
@@ -0,0 +1,77 @@
+import os
+from typing import Any, Dict, List, Optional
+
+# Подписка без успешной доставки и без повторной подписки дольше этого срока считается мёртвой
+STALE_AFTER_DAYS = int(os.environ.get('PUSH_SUBSCRIPTION_STALE_DAYS', '90'))
+
+SWEEP_LOCK_KEY = 'push_subscriptions_sweep'
+
+
+def upsert_subscription(cur: Any, endpoint: str, p256dh: str, auth: str,
+                        user_agent: str, ip_address: str, topics: Optional[List[str]] = None) -> int:
+    '''
+    Новая подписка или обновление ключей и last_used существующей — одним запросом.
+    Темы заменяются, только если переданы (topics не None).
+    '''
+    cur.execute(
+        '''INSERT INTO push_subscriptions (endpoint, p256dh, auth, user_agent, ip_address, topics)
+           VALUES (%(endpoint)s, %(p256dh)s, %(auth)s, %(user_agent)s, %(ip_address)s,
+                   COALESCE(%(topics)s::text[], '{}'))
+           ON CONFLICT (endpoint) DO UPDATE
+           SET p256dh = EXCLUDED.p256dh,
+               auth = EXCLUDED.auth,
+               user_agent = EXCLUDED.user_agent,
+               ip_address = EXCLUDED.ip_address,
+               topics = COALESCE(%(topics)s::text[], push_subscriptions.topics),
+               last_used = CURRENT_TIMESTAMP,
+               is_active = true
+           RETURNING id''',
+        {
+            'endpoint': endpoint, 'p256dh': p256dh, 'auth': auth, 'user_agent': user_agent,
+            'ip_address': ip_address or None, 'topics': topics
+        }
+    )
+    return cur.fetchone()[0]
+
+
+def deactivate_subscriptions(cur: Any, subscription_ids: List[int]) -> int:
+    '''Отключает подписки, на которые push-сервис ответил 404/410, одним UPDATE'''
+    if not subscription_ids:
+        return 0
+    cur.execute(
+        'UPDATE push_subscriptions SET is_active = false WHERE id = ANY(%s) AND is_active = true',
+        (sorted(subscription_ids),)
+    )
+    return cur.rowcount
+
+
+def touch_subscriptions(cur: Any, subscription_ids: List[int]) -> None:
+    '''Успешная доставка подтверждает, что подписка жива'''
+    if subscription_ids:
+        cur.execute(
+            'UPDATE push_subscriptions SET last_used = CURRENT_TIMESTAMP WHERE id = ANY(%s)',
+            (sorted(subscription_ids),)
+        )
+
+
+def sweep_stale_subscriptions(conn: Any, stale_after_days: int = STALE_AFTER_DAYS) -> Dict[str, Any]:
+    '''
+    Business: Отключает подписки, которые не обновлялись и не получали уведомлений дольше срока
+    Args: conn - открытое подключение psycopg2
+          stale_after_days - срок в днях
+    Returns: dict с числом отключённых подписок
+    '''
+    with conn.cursor() as cur:
+        cur.execute('SELECT pg_try_advisory_xact_lock(hashtext(%s))', (SWEEP_LOCK_KEY,))
+        if not cur.fetchone()[0]:
+            conn.rollback()
+            return {'swept': False, 'reason': 'locked'}
+
+        cur.execute(
+            '''UPDATE push_subscriptions SET is_active = false
+               WHERE is_active = true AND last_used < NOW() - make_interval(days => %s)''',
+            (stale_after_days,)
+        )
+        deactivated = cur.rowcount
+    conn.commit()
+    return {'swept': True, 'deactivated': deactivated}
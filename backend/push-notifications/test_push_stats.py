@@ -0,0 +1,95 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import push_stats
+
+# Суточные суммы, посчитанные заново по самим уведомлениям
+DAILY_FROM_SOURCE = '''
+    SELECT (created_at AT TIME ZONE 'UTC')::date, COUNT(*),
+           SUM(COALESCE(sent_count, 0)), SUM(COALESCE(success_count, 0)),
+           ROUND(COALESCE(SUM(success_count::float8 / NULLIF(sent_count, 0)), 0)::numeric, 9),
+           COUNT(*) FILTER (WHERE sent_count > 0)
+    FROM push_notifications
+    GROUP BY 1
+    ORDER BY 1
+'''
+DAILY_FROM_TRIGGERS = '''
+    SELECT day, notifications, sent, success, ROUND(rate_sum::numeric, 9), rate_count
+    FROM push_daily_stats
+    WHERE notifications <> 0
+    ORDER BY day
+'''
+
+
+def assert_counters_match(cur):
+    cur.execute('SELECT COUNT(*) FROM push_subscriptions WHERE is_active = true')
+    active = cur.fetchone()[0]
+    cur.execute("SELECT value FROM push_counters WHERE name = 'active_subscriptions'")
+    assert cur.fetchone()[0] == active
+
+    cur.execute(DAILY_FROM_SOURCE)
+    expected = cur.fetchall()
+    cur.execute(DAILY_FROM_TRIGGERS)
+    assert cur.fetchall() == expected
+
+
+def test_trigger_counters_follow_inserts_updates_and_deletes(scratch_conn):
+    with scratch_conn.cursor() as cur:
+        cur.execute(
+            '''INSERT INTO push_subscriptions (endpoint, p256dh, auth, is_active)
+               SELECT 'https://push.example/' || n, 'key', 'auth', n % 3 <> 0
+               FROM generate_series(1, 12) n'''
+        )
+        assert_counters_match(cur)
+        cur.execute("UPDATE push_subscriptions SET is_active = NOT is_active WHERE id % 2 = 0")
+        assert_counters_match(cur)
+        cur.execute('DELETE FROM push_subscriptions WHERE id IN (1, 2, 3)')
+        assert_counters_match(cur)
+
+        cur.execute(
+            '''INSERT INTO push_notifications (title, sent_count, success_count, created_at)
+               SELECT 'n' || n, n % 4, n % 3, NOW() - make_interval(hours => n * 7)
+               FROM generate_series(1, 40) n'''
+        )
+        assert_counters_match(cur)
+        # Доставка дописывает успехи, перенос created_at меняет день
+        cur.execute('UPDATE push_notifications SET success_count = sent_count WHERE id % 5 = 0')
+        cur.execute("UPDATE push_notifications SET created_at = created_at - INTERVAL '3 days' WHERE id % 7 = 0")
+        assert_counters_match(cur)
+        cur.execute('DELETE FROM push_notifications WHERE id % 6 = 0')
+        assert_counters_match(cur)
+
+        cur.execute(
+            '''SELECT COUNT(*), COALESCE(SUM(sent_count), 0), COALESCE(SUM(success_count), 0)
+               FROM push_notifications WHERE created_at >= NOW() - INTERVAL '7 days' '''
+        )
+        notifications, sent, success = cur.fetchone()
+        stats = push_stats.window_stats(cur, 7)
+        assert (stats['total_notifications'], stats['total_sent'], stats['total_success']) == (
+            notifications, sent, success
+        )
+    scratch_conn.rollback()
+
+
+def test_history_keyset_pages_have_no_duplicates_or_gaps(scratch_conn):
+    with scratch_conn.cursor() as cur:
+        # По пять уведомлений на одно время: порядок внутри решает id
+        cur.execute(
+            '''INSERT INTO push_notifications (title, created_at)
+               SELECT 'n' || n, date_trunc('hour', NOW()) - make_interval(hours => n / 5)
+               FROM generate_series(0, 23) n'''
+        )
+        cur.execute('SELECT id FROM push_notifications ORDER BY created_at DESC, id DESC')
+        expected = [row[0] for row in cur.fetchall()]
+
+        seen, before_id = [], None
+        while True:
+            page = push_stats.notification_history(cur, before_id, limit=4)
+            seen.extend(item['id'] for item in page['notifications'])
+            before_id = page['next_before_id']
+            if before_id is None:
+                break
+        assert seen == expected
+    scratch_conn.rollback()
@@ -0,0 +1,235 @@
+import hashlib
+import hmac
+import os
+import struct
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip('requests')
+pytest.importorskip('cryptography')
+pytest.importorskip('psycopg2')
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+from outbox import OutboxJob, _job_outcome, backoff_delay
+from segments import normalize_topics
+from push_crypto import BroadcastKey, VapidSigner, b64url_decode, b64url_encode, encrypt_broadcast
+from webpush import DeliveryResult, Subscription, close_sessions, deliver, encrypted_requests
+
+
+class StandInPushService(BaseHTTPRequestHandler):
+    '''Отвечает 201, а на /gone/* — 410, как push-сервис на удалённую подписку'''
+
+    protocol_version = 'HTTP/1.1'
+    delay = 0.05
+    received = []
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        self.received.append((self.path, dict(self.headers), body))
+        time.sleep(self.delay)
+        status = 410 if self.path.startswith('/gone/') else 201
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StandInServer(ThreadingHTTPServer):
+    # Очередь по умолчанию (5) переполняется при одновременном подключении воркеров
+    request_queue_size = 128
+    daemon_threads = True
+
+
+@pytest.fixture
+def push_service():
+    server = StandInServer(('127.0.0.1', 0), StandInPushService)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_address[1]}'
+    server.shutdown()
+    server.server_close()
+    close_sessions()
+
+
+def make_subscriptions(base_url, count, prefix='push'):
+    return [Subscription(i, f'{base_url}/{prefix}/{i}', 'p256dh', 'auth') for i in range(count)]
+
+
+def test_deliver_counts_real_results(push_service):
+    subscriptions = make_subscriptions(push_service, 40) + make_subscriptions(push_service, 5, 'gone')
+
+    report = deliver(subscriptions)
+
+    assert len(report.results) == 45
+    assert report.success_count == 40
+    assert sorted(subscription.endpoint for subscription in report.gone) == sorted(
+        subscription.endpoint for subscription in subscriptions[40:]
+    )
+
+
+def test_deliver_runs_concurrently(push_service):
+    subscriptions = make_subscriptions(push_service, 64)
+
+    report = deliver(subscriptions, max_workers=32, max_per_origin=32)
+
+    # Последовательно это 64 * 50 мс = 3.2 с
+    assert report.success_count == 64
+    assert report.elapsed < 1.5
+
+
+def test_unreachable_endpoint_is_an_error_not_an_exception():
+    report = deliver([Subscription(1, 'http://127.0.0.1:9/push/1', 'p256dh', 'auth')])
+
+    assert report.success_count == 0
+    assert report.results[0].status_code is None
+    assert report.results[0].error
+
+
+def make_user_agent_keys():
+    private_key = ec.generate_private_key(ec.SECP256R1())
+    public_bytes = private_key.public_key().public_bytes(
+        serialization.Encoding.X962, serialization.PublicFormat.UncompressedPoint
+    )
+    auth_secret = os.urandom(16)
+    return private_key, b64url_encode(public_bytes), b64url_encode(auth_secret)
+
+
+def decrypt_as_user_agent(body, private_key, p256dh, auth):
+    '''Расшифровка на стороне браузера по RFC 8291 — независимая от push_crypto проверка'''
+    salt, record_size, key_length = body[:16], *struct.unpack('!IB', body[16:21])
+    sender_public = body[21:21 + key_length]
+    ciphertext = body[21 + key_length:]
+    assert record_size == 4096
+
+    shared = private_key.exchange(ec.ECDH(), ec.EllipticCurvePublicKey.from_encoded_point(ec.SECP256R1(), sender_public))
+    hkdf = lambda key, data: hmac.new(key, data, hashlib.sha256).digest()
+    prk_key = hkdf(b64url_decode(auth), shared)
+    ikm = hkdf(prk_key, b'WebPush: info\x00' + b64url_decode(p256dh) + sender_public + b'\x01')
+    prk = hkdf(salt, ikm)
+    cek = hkdf(prk, b'Content-Encoding: aes128gcm\x00\x01')[:16]
+    nonce = hkdf(prk, b'Content-Encoding: nonce\x00\x01')[:12]
+    plaintext = AESGCM(cek).decrypt(nonce, ciphertext, None)
+    assert plaintext.endswith(b'\x02')
+    return plaintext[:-1], sender_public
+
+
+def assert_broadcast_round_trip():
+    broadcast_key = BroadcastKey()
+    recipients = [make_user_agent_keys() for _ in range(3)]
+
+    bodies = encrypt_broadcast(
+        b'{"title": "hello"}',
+        [(i, p256dh, auth) for i, (_, p256dh, auth) in enumerate(recipients)] + [(99, 'broken', 'key')],
+        broadcast_key
+    )
+
+    assert bodies[99] is None
+    for i, (private_key, p256dh, auth) in enumerate(recipients):
+        plaintext, sender_public = decrypt_as_user_agent(bodies[i], private_key, p256dh, auth)
+        assert plaintext == b'{"title": "hello"}'
+        # Одна эфемерная пара на всю рассылку
+        assert sender_public == broadcast_key.public_bytes
+
+
+def test_broadcast_encryption_round_trip():
+    assert_broadcast_round_trip()
+
+
+def test_broadcast_encryption_uses_process_pool_for_outbox_batches(monkeypatch):
+    import outbox
+    import push_crypto
+
+    # Пачка очереди должна доходить до пула процессов
+    assert push_crypto.PROCESS_POOL_THRESHOLD < outbox.BATCH_SIZE
+
+    monkeypatch.setattr(push_crypto, 'PROCESS_POOL_THRESHOLD', 2)
+    monkeypatch.setattr(push_crypto, 'PROCESS_POOL_SIZE', 2)
+    pools = []
+    get_pool = push_crypto._get_process_pool
+    monkeypatch.setattr(push_crypto, '_get_process_pool', lambda: pools.append(get_pool()) or pools[-1])
+    # Сброс пула значил бы, что шифрование досчитано в текущем процессе
+    resets = []
+    reset_pool = push_crypto._reset_process_pool
+    monkeypatch.setattr(push_crypto, '_reset_process_pool', lambda: resets.append(1))
+    try:
+        assert_broadcast_round_trip()
+    finally:
+        reset_pool()
+    if pools[0] is None:
+        pytest.skip('process pool is not available here')
+    assert len(pools) == 1 and not resets
+    assert pools[0]._mp_context.get_start_method() != 'fork'
+
+
+def test_vapid_token_is_cached_per_audience():
+    signer = VapidSigner(ec.generate_private_key(ec.SECP256R1()), 'mailto:test@example.com', lifetime=3600)
+
+    first = signer.authorization('https://fcm.googleapis.com')
+    assert signer.authorization('https://fcm.googleapis.com') == first
+    assert signer.authorization('https://updates.push.services.mozilla.com') != first
+    assert first.startswith('vapid t=') and first.endswith(f', k={signer.public_key}')
+
+    # Токен, до истечения которого меньше запаса, перевыпускается
+    signer.renew_margin = 3600
+    assert signer.authorization('https://fcm.googleapis.com') != first
+
+
+def test_encrypted_delivery(push_service):
+    private_key, p256dh, auth = make_user_agent_keys()
+    subscriptions = [Subscription(1, f'{push_service}/push/1', p256dh, auth)]
+    StandInPushService.received.clear()
+
+    report = deliver(subscriptions, encrypted_requests(b'payload', subscriptions))
+
+    assert report.success_count == 1
+    _, headers, body = StandInPushService.received[0]
+    assert headers['Content-Encoding'] == 'aes128gcm'
+    assert decrypt_as_user_agent(body, private_key, p256dh, auth)[0] == b'payload'
+
+
+def test_outbox_retries_throttled_and_server_errors_with_backoff():
+    job = OutboxJob((1, 10, 0, False, True, 5, 'https://push.example/5', 'p256dh', 'auth'))
+
+    def result(status, retryable, retry_after=None):
+        return DeliveryResult(job.subscription, status, None, retry_after, retryable)
+
+    assert _job_outcome(job, result(201, False)) == ('sent', 0.0)
+    assert _job_outcome(job, result(410, False)) == ('failed', 0.0)
+    assert _job_outcome(job, result(400, False)) == ('failed', 0.0)
+
+    status, delay = _job_outcome(job, result(429, True, '120'))
+    assert status == 'pending' and delay >= 120
+    status, delay = _job_outcome(job, result(503, True))
+    assert status == 'pending' and delay > 0
+
+    # Последняя попытка не откладывается, а завершается ошибкой
+    job.attempts = 100
+    assert _job_outcome(job, result(503, True)) == ('failed', 0.0)
+
+
+def test_backoff_grows_exponentially_up_to_cap():
+    delays = [backoff_delay(attempt) for attempt in range(20)]
+    assert delays[1] > delays[0] * 1.3
+    assert max(delays) <= 3600 * 1.2
+
+
+def test_normalize_topics():
+    assert normalize_topics(None) is None
+    assert normalize_topics([]) == []
+    assert normalize_topics(' News ') == ['news']
+    assert normalize_topics(['promo', 'News', 'promo', 'city:simferopol']) == ['promo', 'news', 'city:simferopol']
+
+    for invalid in ({'a': 1}, [1], ['has space'], [''], ['x' * 65], [f't{i}' for i in range(33)]):
+        with pytest.raises(ValueError):
+            normalize_topics(invalid)
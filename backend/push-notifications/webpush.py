@@ -0,0 +1,210 @@
+import os
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, List, NamedTuple, Optional, Tuple
+from urllib.parse import urlsplit
+
+from shared import metrics
+from shared.runtime import lazy_import
+
+# HTTP-клиент и шифрование грузятся при первой доставке, а не при импорте обработчика
+requests = lazy_import('requests')
+push_crypto = lazy_import('push_crypto')
+
+# Общий предел одновременных запросов и предел на один push-сервис (FCM, Mozilla, Apple)
+MAX_WORKERS = int(os.environ.get('PUSH_MAX_WORKERS', '64'))
+MAX_PER_ORIGIN = int(os.environ.get('PUSH_MAX_PER_ORIGIN', '32'))
+CONNECT_TIMEOUT = float(os.environ.get('PUSH_CONNECT_TIMEOUT', '3'))
+READ_TIMEOUT = float(os.environ.get('PUSH_READ_TIMEOUT', '10'))
+DEFAULT_TTL = int(os.environ.get('PUSH_TTL', '86400'))
+
+# Подписка больше не существует — её нужно деактивировать
+GONE_STATUSES = (404, 410)
+
+
+class Subscription(NamedTuple):
+    id: int
+    endpoint: str
+    p256dh: str
+    auth: str
+
+
+class DeliveryResult(NamedTuple):
+    subscription: Subscription
+    status_code: Optional[int]
+    error: Optional[str]
+    retry_after: Optional[str]
+    # Временный сбой (429, 5xx, сеть) — запрос имеет смысл повторить позже
+    retryable: bool = False
+
+    @property
+    def ok(self) -> bool:
+        return self.status_code is not None and 200 <= self.status_code < 300
+
+    @property
+    def gone(self) -> bool:
+        return self.status_code in GONE_STATUSES
+
+
+class DeliveryReport:
+    def __init__(self, results: List[DeliveryResult], elapsed: float):
+        self.results = results
+        self.elapsed = elapsed
+
+    @property
+    def success_count(self) -> int:
+        return sum(1 for result in self.results if result.ok)
+
+    @property
+    def gone(self) -> List[Subscription]:
+        return [result.subscription for result in self.results if result.gone]
+
+    def summary(self) -> Dict[str, Any]:
+        statuses = Counter(
+            str(result.status_code) if result.status_code is not None else 'error'
+            for result in self.results
+        )
+        return {
+            'sent': len(self.results),
+            'success': self.success_count,
+            'gone': len(self.gone),
+            'statuses': dict(statuses),
+            'elapsed_ms': round(self.elapsed * 1000, 1)
+        }
+
+
+# Готовит заголовки и тело запроса для конкретной подписки
+RequestBuilder = Callable[[Subscription], Tuple[Dict[str, str], bytes]]
+
+
+def origin_of(endpoint: str) -> str:
+    parts = urlsplit(endpoint)
+    return f'{parts.scheme}://{parts.netloc}'
+
+
+_sessions: Dict[str, 'requests.Session'] = {}
+_sessions_lock = threading.Lock()
+
+
+def get_session(origin: str) -> 'requests.Session':
+    '''
+    Сессия с keep-alive пулом на каждый push-сервис. Живёт между вызовами
+    тёплого экземпляра функции, поэтому TLS-рукопожатие не повторяется.
+    '''
+    session = _sessions.get(origin)
+    if session is None:
+        with _sessions_lock:
+            session = _sessions.get(origin)
+            if session is None:
+                session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=MAX_PER_ORIGIN, max_retries=0)
+                session.mount(origin, adapter)
+                _sessions[origin] = session
+    return session
+
+
+def close_sessions() -> None:
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+
+
+def payloadless_request(subscription: Subscription) -> Tuple[Dict[str, str], bytes]:
+    '''Push без тела: сервис будит service worker, который сам забирает уведомление'''
+    return {'TTL': str(DEFAULT_TTL), 'Content-Length': '0'}, b''
+
+
+def encrypted_requests(payload: bytes, subscriptions: List[Subscription], ttl: int = DEFAULT_TTL) -> RequestBuilder:
+    '''
+    Шифрует payload для всех подписчиков заранее (при большой рассылке — в пуле процессов)
+    и возвращает RequestBuilder, который только подставляет готовое тело и VAPID-токен
+    '''
+    bodies = push_crypto.encrypt_broadcast(payload, [(s.id, s.p256dh, s.auth) for s in subscriptions])
+    signer = push_crypto.get_vapid_signer()
+
+    def build(subscription: Subscription) -> Tuple[Dict[str, str], bytes]:
+        body = bodies.get(subscription.id)
+        if body is None:
+            raise ValueError('invalid subscription keys')
+        headers = {
+            'TTL': str(ttl),
+            'Content-Encoding': 'aes128gcm',
+            'Content-Type': 'application/octet-stream'
+        }
+        if signer is not None:
+            headers['Authorization'] = signer.authorization(origin_of(subscription.endpoint))
+        return headers, body
+
+    return build
+
+
+def send_one(session: 'requests.Session', subscription: Subscription, build_request: RequestBuilder) -> DeliveryResult:
+    try:
+        headers, body = build_request(subscription)
+        response = session.post(
+            subscription.endpoint,
+            data=body,
+            headers=headers,
+            timeout=(CONNECT_TIMEOUT, READ_TIMEOUT)
+        )
+        # Тело ответа не нужно, но его надо дочитать, чтобы соединение вернулось в пул
+        response.content
+        status = response.status_code
+        return DeliveryResult(
+            subscription, status, None, response.headers.get('Retry-After'),
+            status == 429 or status >= 500
+        )
+    except requests.RequestException as e:
+        return DeliveryResult(subscription, None, type(e).__name__, None, True)
+    except Exception as e:
+        return DeliveryResult(subscription, None, str(e), None)
+
+
+def deliver(subscriptions: List[Subscription], build_request: RequestBuilder = payloadless_request,
+            max_workers: int = MAX_WORKERS, max_per_origin: int = MAX_PER_ORIGIN) -> DeliveryReport:
+    '''
+    Business: Параллельная рассылка push-запросов по подпискам
+    Args: subscriptions - список подписок
+          build_request - функция, готовящая заголовки и тело для подписки
+          max_workers - общий предел одновременных запросов
+          max_per_origin - предел одновременных запросов к одному push-сервису
+    Returns: DeliveryReport с результатом по каждой подписке
+    '''
+    started = time.perf_counter()
+    if not subscriptions:
+        return DeliveryReport([], 0.0)
+
+    queues: Dict[str, Deque[Subscription]] = defaultdict(deque)
+    for subscription in subscriptions:
+        queues[origin_of(subscription.endpoint)].append(subscription)
+
+    results: List[DeliveryResult] = []
+
+    def drain(origin: str, queue: Deque[Subscription]) -> None:
+        session = get_session(origin)
+        while True:
+            try:
+                subscription = queue.popleft()
+            except IndexError:
+                return
+            results.append(send_one(session, subscription, build_request))
+
+    # Каждый push-сервис получает не больше max_per_origin воркеров, общий пул ограничен max_workers.
+    # Задачи чередуются по сервисам, чтобы один большой сервис не занял весь пул первым
+    tasks = [
+        (origin, queue)
+        for slot in range(max_per_origin)
+        for origin, queue in queues.items()
+        if slot < len(queue)
+    ]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(tasks))) as executor:
+        for future in [executor.submit(drain, origin, queue) for origin, queue in tasks]:
+            future.result()
+
+    report = DeliveryReport(results, time.perf_counter() - started)
+    metrics.observe('push_fanout_seconds', 'Time to deliver one batch to all push services', report.elapsed)
+    metrics.log_event('push_fanout', **report.summary())
+    return report
@@ -0,0 +1,275 @@
+'''
+Собственный долгоживущий хост для всех функций backend: один процесс, общие
+пулы соединений и кэши, обработчики handler(event, context) без изменений.
+
+    cd backend && python -m shared.host --port 8000 --workers 32
+
+Функция доступна по /<имя>/... (/analytics/?days=7, /push-notifications/send)
+и по идентификатору из func2url.json, так что во фронтенде достаточно сменить
+домен. ASGI-приложение запускается через uvicorn, если он установлен, иначе
+используется WSGI-сервер из стандартной библиотеки (create_wsgi_app подходит
+и для gunicorn). С --schedule хост сам выполняет служебные действия из
+shared.schedule вместо внешнего cron.
+'''
+import argparse
+import asyncio
+import base64
+import json
+import os
+import sys
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlsplit
+
+BACKEND_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_ROOT not in sys.path:
+    sys.path.insert(0, BACKEND_ROOT)
+
+from shared.loader import InvocationContext, list_functions, load_handler
+
+HOST_WORKERS = int(os.environ.get('HOST_WORKERS', '32'))
+# Сверх этого числа одновременных запросов новые сразу получают 503
+HOST_MAX_PENDING = int(os.environ.get('HOST_MAX_PENDING', '256'))
+HOST_SCHEDULE = os.environ.get('HOST_SCHEDULE', '0') == '1'
+
+Handler = Callable[[Dict[str, Any], Any], Dict[str, Any]]
+
+HEALTH_PATH = '/healthz'
+
+
+def function_aliases(backend_root: str = BACKEND_ROOT) -> Dict[str, str]:
+    '''Идентификатор из func2url.json -> имя функции'''
+    path = os.path.join(backend_root, 'func2url.json')
+    if not os.path.isfile(path):
+        return {}
+    with open(path, encoding='utf-8') as func2url_file:
+        urls = json.load(func2url_file)
+    return {urlsplit(url).path.strip('/'): name for name, url in urls.items()}
+
+
+def build_event(method: str, action: str, query_string: str, headers: Dict[str, str],
+                body: bytes, client_ip: str = '', request_id: str = '') -> Dict[str, Any]:
+    '''Событие в том же виде, в каком его передаёт облачная платформа'''
+    headers = {name.lower(): value for name, value in headers.items()}
+    if client_ip and 'x-forwarded-for' in headers:
+        # Как прокси платформы: адрес соединения дописывается справа, и клиент его не подделает
+        headers['x-forwarded-for'] = f"{headers['x-forwarded-for']}, {client_ip}"
+    elif client_ip and 'x-real-ip' not in headers:
+        headers['x-real-ip'] = client_ip
+
+    try:
+        body_text, is_base64 = body.decode('utf-8'), False
+    except UnicodeDecodeError:
+        body_text, is_base64 = base64.b64encode(body).decode('ascii'), True
+
+    return {
+        'httpMethod': method.upper(),
+        'headers': headers,
+        'queryStringParameters': dict(parse_qsl(query_string, keep_blank_values=True)),
+        'pathParameters': {'action': action} if action else {},
+        'body': body_text,
+        'isBase64Encoded': is_base64,
+        'requestContext': {'requestId': request_id, 'identity': {'sourceIp': client_ip}}
+    }
+
+
+def response_body(response: Dict[str, Any]) -> bytes:
+    body = response.get('body') or ''
+    if response.get('isBase64Encoded'):
+        return base64.b64decode(body)
+    return body if isinstance(body, bytes) else str(body).encode('utf-8')
+
+
+class FunctionHost:
+    '''
+    Маршрутизация /<функция>/<действие> на загруженные обработчики. Обработчики
+    блокирующие, поэтому выполняются в общем пуле потоков размером workers.
+    '''
+
+    def __init__(self, handlers: Optional[Dict[str, Handler]] = None, workers: int = HOST_WORKERS,
+                 max_pending: int = HOST_MAX_PENDING, aliases: Optional[Dict[str, str]] = None):
+        if handlers is None:
+            handlers = {name: load_handler(name) for name in list_functions()}
+        self.handlers = handlers
+        self.aliases = function_aliases() if aliases is None else aliases
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='host')
+        self._pending = threading.BoundedSemaphore(max_pending)
+
+    def resolve(self, path: str) -> Tuple[Optional[str], str]:
+        name, _, rest = path.strip('/').partition('/')
+        name = self.aliases.get(name, name)
+        if name not in self.handlers:
+            return None, ''
+        return name, rest.strip('/')
+
+    def invoke(self, path: str, method: str, query_string: str, headers: Dict[str, str],
+               body: bytes, client_ip: str = '') -> Dict[str, Any]:
+        '''Вызов обработчика в текущем потоке; ответ — dict в формате облачной функции'''
+        if path == HEALTH_PATH:
+            return {'statusCode': 200, 'headers': {'Content-Type': 'application/json'},
+                    'body': json.dumps({'status': 'ok', 'functions': sorted(self.handlers)})}
+
+        name, action = self.resolve(path)
+        if name is None:
+            return {'statusCode': 404, 'headers': {'Content-Type': 'application/json'},
+                    'body': json.dumps({'error': 'Unknown function'})}
+
+        request_id = uuid.uuid4().hex
+        event = build_event(method, action, query_string, headers, body, client_ip, request_id)
+        try:
+            return self.handlers[name](event, InvocationContext(name, request_id))
+        except Exception as e:
+            return {'statusCode': 500, 'headers': {'Content-Type': 'application/json'},
+                    'body': json.dumps({'error': str(e)})}
+
+    def try_acquire(self) -> bool:
+        return self._pending.acquire(blocking=False)
+
+    def release(self) -> None:
+        self._pending.release()
+
+
+BUSY_RESPONSE = {'statusCode': 503, 'headers': {'Content-Type': 'application/json', 'Retry-After': '1'},
+                 'body': json.dumps({'error': 'Server busy'})}
+
+
+def response_headers(response: Dict[str, Any]) -> List[Tuple[str, str]]:
+    return [(str(name), str(value)) for name, value in (response.get('headers') or {}).items()]
+
+
+def create_asgi_app(host: Optional[FunctionHost] = None) -> Callable[..., Awaitable[None]]:
+    '''ASGI-приложение: тело читается в event loop, обработчик выполняется в пуле потоков хоста'''
+    host = host or FunctionHost()
+
+    async def app(scope: Dict[str, Any], receive: Callable, send: Callable) -> None:
+        if scope['type'] == 'lifespan':
+            while True:
+                message = await receive()
+                if message['type'] == 'lifespan.startup':
+                    await send({'type': 'lifespan.startup.complete'})
+                elif message['type'] == 'lifespan.shutdown':
+                    host.executor.shutdown(wait=False)
+                    await send({'type': 'lifespan.shutdown.complete'})
+                    return
+        if scope['type'] != 'http':
+            return
+
+        chunks = []
+        while True:
+            message = await receive()
+            chunks.append(message.get('body', b''))
+            if not message.get('more_body'):
+                break
+
+        headers = {name.decode('latin-1'): value.decode('latin-1') for name, value in scope.get('headers', [])}
+        client_ip = (scope.get('client') or ('', 0))[0]
+
+        if host.try_acquire():
+            try:
+                response = await asyncio.get_running_loop().run_in_executor(
+                    host.executor, host.invoke, scope['path'], scope['method'],
+                    scope.get('query_string', b'').decode('latin-1'), headers, b''.join(chunks), client_ip
+                )
+            finally:
+                host.release()
+        else:
+            response = BUSY_RESPONSE
+
+        await send({
+            'type': 'http.response.start',
+            'status': int(response.get('statusCode', 200)),
+            'headers': [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                        for name, value in response_headers(response)]
+        })
+        await send({'type': 'http.response.body', 'body': response_body(response)})
+
+    return app
+
+
+def create_wsgi_app(host: Optional[FunctionHost] = None) -> Callable[..., Iterable[bytes]]:
+    '''WSGI-приложение: поток сервера только ждёт, обработчик выполняется в пуле хоста'''
+    host = host or FunctionHost()
+
+    def app(environ: Dict[str, Any], start_response: Callable) -> Iterable[bytes]:
+        headers = {
+            key[5:].replace('_', '-').lower(): value
+            for key, value in environ.items() if key.startswith('HTTP_')
+        }
+        if environ.get('CONTENT_TYPE'):
+            headers['content-type'] = environ['CONTENT_TYPE']
+        length = int(environ.get('CONTENT_LENGTH') or 0)
+        body = environ['wsgi.input'].read(length) if length else b''
+
+        if host.try_acquire():
+            try:
+                response = host.executor.submit(
+                    host.invoke, environ.get('PATH_INFO', '/'), environ['REQUEST_METHOD'],
+                    environ.get('QUERY_STRING', ''), headers, body, environ.get('REMOTE_ADDR', '')
+                ).result()
+            finally:
+                host.release()
+        else:
+            response = BUSY_RESPONSE
+
+        status = int(response.get('statusCode', 200))
+        try:
+            reason = HTTPStatus(status).phrase
+        except ValueError:
+            reason = ''
+        start_response(f'{status} {reason}'.strip(), response_headers(response))
+        return [response_body(response)]
+
+    return app
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Serve all backend functions from one long-lived process')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--workers', type=int, default=HOST_WORKERS, help='handler thread pool size')
+    parser.add_argument('--max-pending', type=int, default=HOST_MAX_PENDING)
+    parser.add_argument('--wsgi', action='store_true', help='use the standard library WSGI server')
+    parser.add_argument('--schedule', action='store_true', default=HOST_SCHEDULE,
+                        help='run scheduled maintenance actions in this process')
+    args = parser.parse_args()
+
+    # Без секрета JWT хост не стартует, а не падает на первом входе
+    from shared.tokens import get_token_verifier
+    get_token_verifier()
+
+    host = FunctionHost(workers=args.workers, max_pending=args.max_pending)
+    print(f'serving {", ".join(sorted(host.handlers))} on http://{args.host}:{args.port}')
+    if args.schedule:
+        from shared.schedule import Scheduler
+        Scheduler(host.invoke).start()
+
+    if not args.wsgi:
+        try:
+            import uvicorn
+        except ImportError:
+            uvicorn = None
+        if uvicorn is not None:
+            uvicorn.run(create_asgi_app(host), host=args.host, port=args.port, log_level='warning')
+            return
+
+    from socketserver import ThreadingMixIn
+    from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+    class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+        daemon_threads = True
+        request_queue_size = 1024
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_message(self, format: str, *args: Any) -> None:
+            pass
+
+    server = make_server(args.host, args.port, create_wsgi_app(host),
+                         server_class=ThreadingWSGIServer, handler_class=QuietHandler)
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+import importlib.util
+import os
+import sys
+import uuid
+from types import ModuleType
+from typing import Any, Callable, Dict
+
+BACKEND_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+Handler = Callable[[Dict[str, Any], Any], Dict[str, Any]]
+
+
+class InvocationContext:
+    '''Минимальный аналог context облачной функции: request_id и function_name'''
+
+    def __init__(self, function_name: str, request_id: str = ''):
+        self.function_name = function_name
+        self.request_id = request_id or uuid.uuid4().hex
+
+
+def list_functions() -> Dict[str, str]:
+    '''Папки backend с index.py: имя функции -> путь к index.py'''
+    functions = {}
+    for name in sorted(os.listdir(BACKEND_ROOT)):
+        index_path = os.path.join(BACKEND_ROOT, name, 'index.py')
+        if os.path.isfile(index_path):
+            functions[name] = index_path
+    return functions
+
+
+def load_function_module(function_name: str) -> ModuleType:
+    '''Импортирует index.py функции под уникальным именем модуля, чтобы функции не конфликтовали'''
+    module_name = f'{function_name.replace("-", "_")}_index'
+    if module_name in sys.modules:
+        return sys.modules[module_name]
+
+    function_dir = os.path.join(BACKEND_ROOT, function_name)
+    index_path = os.path.join(function_dir, 'index.py')
+    if not os.path.isfile(index_path):
+        raise ValueError(f'Unknown function: {function_name}')
+
+    # Соседние модули функции (ingest.py, webpush.py и т.п.) импортируются по короткому имени
+    if function_dir not in sys.path:
+        sys.path.insert(0, function_dir)
+
+    spec = importlib.util.spec_from_file_location(module_name, index_path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def load_handler(function_name: str) -> Handler:
+    return load_function_module(function_name).handler
@@ -0,0 +1,105 @@
+'''
+Служебные действия функций, которые выполняются только по расписанию, а не
+внутри чужих запросов. На облачной платформе их вызывает внешний cron
+с админским токеном (Authorization: Bearer ...):
+
+    GET  /analytics/?action=refresh_rollups        каждую минуту
+    GET  /analytics/?action=maintain_partitions    раз в 6 часов
+    POST /push-notifications/sweep                 раз в 6 часов
+    POST /push-notifications/process               каждые 30 секунд
+
+Долгоживущий хост запускает их сам: python -m shared.host --schedule.
+'''
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from shared import metrics
+
+# После неудачного запуска действие повторяется не раньше чем через столько секунд
+RETRY_AFTER_FAILURE_SECONDS = 60.0
+
+
+class ScheduledAction(NamedTuple):
+    function: str
+    method: str
+    action: str
+    interval: float
+
+
+SCHEDULED_ACTIONS: Tuple[ScheduledAction, ...] = (
+    # Сведение новых событий в агрегаты, скетчи и выборку: дашборд их только читает
+    ScheduledAction('analytics', 'GET', 'refresh_rollups',
+                    float(os.environ.get('ANALYTICS_ROLLUP_REFRESH_INTERVAL', '60'))),
+    # Секции user_actions наперёд и срок хранения сырых событий
+    ScheduledAction('analytics', 'GET', 'maintain_partitions',
+                    float(os.environ.get('ANALYTICS_PARTITION_CHECK_INTERVAL', '21600'))),
+    # Отключение подписок без доставок дольше PUSH_SUBSCRIPTION_STALE_DAYS
+    ScheduledAction('push-notifications', 'POST', 'sweep',
+                    float(os.environ.get('PUSH_SUBSCRIPTION_SWEEP_INTERVAL', '21600'))),
+    # Доставка заданий, поставленных send, и повторы после ошибок
+    ScheduledAction('push-notifications', 'POST', 'process',
+                    float(os.environ.get('PUSH_OUTBOX_PROCESS_INTERVAL', '30'))),
+)
+
+Invoke = Callable[[str, str, str, Dict[str, str], bytes], Dict[str, Any]]
+
+
+def admin_token() -> str:
+    from shared.tokens import get_token_verifier
+    return get_token_verifier().issue(0, 'scheduler')
+
+
+class Scheduler:
+    '''
+    Фоновый поток, который по очереди вызывает просроченные действия через
+    invoke(path, method, query_string, headers, body) — тот же путь, что у HTTP.
+    '''
+
+    def __init__(self, invoke: Invoke, actions: Tuple[ScheduledAction, ...] = SCHEDULED_ACTIONS,
+                 token: Callable[[], str] = admin_token, clock: Callable[[], float] = time.monotonic):
+        self.invoke = invoke
+        self.actions = actions
+        self.token = token
+        self.clock = clock
+        self._next_run: Dict[ScheduledAction, float] = {action: 0.0 for action in actions}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def run_due(self) -> List[Tuple[ScheduledAction, int]]:
+        '''Запускает все действия, чей срок подошёл. Returns: [(действие, HTTP-статус)]'''
+        ran = []
+        for action in self.actions:
+            now = self.clock()
+            if now < self._next_run[action]:
+                continue
+            try:
+                response = self.invoke(f'/{action.function}/{action.action}', action.method, '',
+                                       {'authorization': f'Bearer {self.token()}'}, b'{}')
+                status = int(response.get('statusCode', 500))
+            except Exception as e:
+                response, status = {'body': str(e)}, 500
+            if status >= 400:
+                metrics.log_event('scheduled_action_failed', function=action.function, action=action.action,
+                                  status=status, body=str(response.get('body', ''))[:500])
+                self._next_run[action] = now + min(action.interval, RETRY_AFTER_FAILURE_SECONDS)
+            else:
+                self._next_run[action] = now + action.interval
+            ran.append((action, status))
+        return ran
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self.run_due()
+            self._stop.wait(1.0)
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='scheduler', daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
@@ -0,0 +1,125 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import psycopg2
+import psycopg2.extensions
+import pytest
+
+from shared import db
+
+
+class FakeConnection:
+    '''Соединение без базы: SELECT 1 падает, если dead'''
+
+    class Info:
+        transaction_status = psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+    def __init__(self):
+        self.closed = 0
+        self.dead = False
+        self.rollbacks = 0
+        self.info = self.Info()
+
+    def cursor(self):
+        connection = self
+
+        class Cursor:
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc):
+                return False
+
+            def execute(self, query):
+                if connection.dead:
+                    raise psycopg2.OperationalError('server closed the connection unexpectedly')
+
+        return Cursor()
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def close(self):
+        self.closed = 1
+
+
+@pytest.fixture
+def connections(monkeypatch):
+    created, failures, sleeps = [], [0], []
+
+    def connect(dsn, cursor_factory=None):
+        if failures[0]:
+            failures[0] -= 1
+            raise psycopg2.OperationalError('could not connect to server')
+        created.append(FakeConnection())
+        return created[-1]
+
+    monkeypatch.setattr(db.psycopg2, 'connect', connect)
+    monkeypatch.setattr(db.time, 'sleep', sleeps.append)
+    return created, failures, sleeps
+
+
+def test_pool_reuses_released_connections_and_times_out_when_full(connections):
+    created, _, _ = connections
+    pool = db.ConnectionPool('postgresql://test', max_size=2, acquire_timeout=0.01)
+
+    first, second = pool.getconn(), pool.getconn()
+    with pytest.raises(db.PoolTimeout):
+        pool.getconn()
+
+    pool.putconn(first)
+    assert pool.getconn() is first
+    first.info.transaction_status = psycopg2.extensions.TRANSACTION_STATUS_INTRANS
+    pool.putconn(first)
+    # Незавершённая транзакция откатывается при возврате в пул
+    assert first.rollbacks == 1
+
+    second.info.transaction_status = psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN
+    pool.putconn(second)
+    assert second.closed
+    stats = pool.stats()
+    assert (stats['created'], stats['reused'], stats['broken'], stats['timeouts']) == (2, 1, 1, 1)
+    assert (stats['idle'], stats['in_use']) == (1, 0) and len(created) == 2
+
+
+def test_pool_evicts_idle_connections(connections):
+    pool = db.ConnectionPool('postgresql://test', idle_timeout=60)
+    conn = pool.getconn()
+    pool.putconn(conn)
+    pool._idle = [(conn, since - 61) for conn, since in pool._idle]
+
+    fresh = pool.getconn()
+    assert fresh is not conn and conn.closed
+    assert pool.stats()['evicted'] == 1
+
+
+def test_pool_replaces_connection_that_fails_health_check(connections):
+    created, _, _ = connections
+    pool = db.ConnectionPool('postgresql://test', health_check_interval=0)
+    conn = pool.getconn()
+    pool.putconn(conn)
+    conn.dead = True
+
+    fresh = pool.getconn()
+    assert fresh is created[1] and conn.closed
+    stats = pool.stats()
+    assert (stats['created'], stats['broken'], stats['in_use']) == (2, 1, 1)
+
+
+def test_pool_retries_connect_without_sleeping_after_last_attempt(connections):
+    created, failures, sleeps = connections
+    pool = db.ConnectionPool('postgresql://test', connect_retries=2)
+
+    failures[0] = 2
+    assert pool.getconn() is created[0]
+    assert sleeps == [0.05, 0.1]
+
+    sleeps.clear()
+    failures[0] = 3
+    with pytest.raises(psycopg2.OperationalError):
+        pool.getconn()
+    # Три попытки — две паузы между ними; слот пула освобождается
+    assert sleeps == [0.05, 0.1]
+    assert pool.stats()['in_use'] == 1
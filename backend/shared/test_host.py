@@ -0,0 +1,87 @@
+import asyncio
+import io
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shared.host import FunctionHost, build_event, create_asgi_app, create_wsgi_app
+
+
+def echo_handler(event, context):
+    return {
+        'statusCode': 200,
+        'headers': {'Content-Type': 'application/json', 'X-Function': context.function_name},
+        'body': json.dumps({
+            'method': event['httpMethod'],
+            'action': event['pathParameters'].get('action'),
+            'query': event['queryStringParameters'],
+            'body': event['body'],
+            'ip': event['headers'].get('x-real-ip')
+        })
+    }
+
+
+def make_host():
+    return FunctionHost({'push-notifications': echo_handler}, workers=2,
+                        aliases={'6adb334a': 'push-notifications'})
+
+
+def test_build_event_matches_platform_shape():
+    event = build_event('post', 'send', 'days=7&limit=5', {'User-Agent': 'x'}, b'{"a": 1}', '10.0.0.1')
+    assert event['httpMethod'] == 'POST'
+    assert event['pathParameters'] == {'action': 'send'}
+    assert event['queryStringParameters'] == {'days': '7', 'limit': '5'}
+    assert event['headers'] == {'user-agent': 'x', 'x-real-ip': '10.0.0.1'}
+    assert event['body'] == '{"a": 1}' and not event['isBase64Encoded']
+    # Адрес соединения дописывается справа, как это делает прокси платформы
+    forwarded = build_event('get', '', '', {'X-Forwarded-For': '1.2.3.4'}, b'', '10.0.0.1')
+    assert forwarded['headers']['x-forwarded-for'] == '1.2.3.4, 10.0.0.1'
+
+
+def test_asgi_app_routes_by_name_and_alias():
+    app = create_asgi_app(make_host())
+
+    async def call(path, query=b''):
+        sent = []
+        messages = [{'type': 'http.request', 'body': b'{}', 'more_body': False}]
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message)
+
+        await app({'type': 'http', 'method': 'POST', 'path': path, 'query_string': query,
+                   'headers': [(b'content-type', b'application/json')], 'client': ('10.0.0.2', 5000)},
+                  receive, send)
+        return sent[0]['status'], json.loads(sent[1]['body'])
+
+    status, body = asyncio.run(call('/push-notifications/send', b'x=1'))
+    assert status == 200 and body['action'] == 'send' and body['query'] == {'x': '1'}
+    assert body['ip'] == '10.0.0.2'
+
+    status, body = asyncio.run(call('/6adb334a/subscribe'))
+    assert status == 200 and body['action'] == 'subscribe'
+
+    status, _ = asyncio.run(call('/missing/'))
+    assert status == 404
+
+
+def test_wsgi_app():
+    app = create_wsgi_app(make_host())
+    started = {}
+
+    def start_response(status, headers):
+        started['status'] = status
+        started['headers'] = dict(headers)
+
+    environ = {
+        'REQUEST_METHOD': 'GET', 'PATH_INFO': '/push-notifications/', 'QUERY_STRING': 'days=30',
+        'REMOTE_ADDR': '10.0.0.3', 'wsgi.input': io.BytesIO(b''), 'HTTP_AUTHORIZATION': 'Bearer t'
+    }
+    body = json.loads(b''.join(app(environ, start_response)))
+    assert started['status'] == '200 OK'
+    assert started['headers']['X-Function'] == 'push-notifications'
+    assert body['method'] == 'GET' and body['action'] is None and body['query'] == {'days': '30'}
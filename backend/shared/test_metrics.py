@@ -0,0 +1,47 @@
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shared import metrics
+
+
+def test_histogram_renders_cumulative_buckets():
+    hist = metrics.Histogram('test_seconds', 'Test latency', buckets=(0.1, 1.0))
+    hist.observe(0.05, (('route', 'a'),))
+    hist.observe(0.5, (('route', 'a'),))
+    hist.observe(5.0, (('route', 'a'),))
+
+    lines = hist.render()
+    assert 'test_seconds_bucket{route="a",le="0.1"} 1' in lines
+    assert 'test_seconds_bucket{route="a",le="1.0"} 2' in lines
+    assert 'test_seconds_bucket{route="a",le="+Inf"} 3' in lines
+    assert 'test_seconds_count{route="a"} 3' in lines
+
+
+def test_statement_label_prefers_comment_name():
+    assert metrics.statement_label('/* dashboard_exact */ WITH x AS (SELECT 1) SELECT * FROM x') == 'dashboard_exact'
+    assert metrics.statement_label('SELECT id FROM admin_users WHERE id = 1') == 'select:admin_users'
+    assert metrics.statement_label('INSERT INTO user_actions (id) VALUES (1)') == 'insert:user_actions'
+
+
+def test_sampled_request_logs_sql_and_exports_metrics(monkeypatch, capsys):
+    monkeypatch.setattr(metrics, 'SAMPLE_RATE', 1.0)
+    metrics.register_collector('test_component', lambda: {'hits': 3, 'mode': 'lru'})
+
+    with metrics.request_scope('analytics', 'GET', '', 'req-1') as outcome:
+        assert metrics.sql_sampled()
+        metrics.observe_sql('SELECT 1 FROM user_actions', 0.002)
+        outcome['status'] = 200
+    assert not metrics.sql_sampled()
+
+    line = json.loads(capsys.readouterr().out.strip().splitlines()[-1])
+    assert line['event'] == 'request' and line['status'] == 200
+    assert line['sql_count'] == 1 and line['request_id'] == 'req-1'
+
+    exported = metrics.render_prometheus()
+    assert 'http_request_seconds_count{action="-",function="analytics",method="GET",status="200"}' in exported
+    assert 'db_statement_seconds_count{statement="select:user_actions"}' in exported
+    assert 'test_component_hits 3' in exported
+    assert 'test_component_mode' not in exported
@@ -0,0 +1,78 @@
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shared.runtime import HttpError, Router, dumps, int_param, json_response, lazy_import
+
+
+def test_router_dispatches_by_method_and_action():
+    router = Router('GET, POST, OPTIONS')
+
+    @router.route('GET')
+    def default(event, context):
+        return json_response(200, {'route': 'default'})
+
+    @router.route('GET', 'stats')
+    def stats(event, context):
+        return json_response(200, {'route': 'stats'})
+
+    @router.route('POST', 'fail')
+    def fail(event, context):
+        raise HttpError(429, 'Slow down', {'Retry-After': '5'})
+
+    options = router.dispatch({'httpMethod': 'OPTIONS'}, None)
+    assert options['statusCode'] == 200
+    assert options['headers']['Access-Control-Allow-Methods'] == 'GET, POST, OPTIONS'
+
+    route = lambda event: json.loads(router.dispatch(event, None)['body'])['route']
+    assert route({'httpMethod': 'GET'}) == 'default'
+    assert route({'httpMethod': 'GET', 'queryStringParameters': {'action': 'stats'}}) == 'stats'
+    assert route({'httpMethod': 'GET', 'queryStringParameters': {'action': 'unknown'}}) == 'default'
+
+    failed = router.dispatch({'httpMethod': 'POST', 'pathParameters': {'action': 'fail'}}, None)
+    assert failed['statusCode'] == 429 and failed['headers']['Retry-After'] == '5'
+    assert router.dispatch({'httpMethod': 'DELETE'}, None)['statusCode'] == 405
+
+
+def test_dumps_falls_back_for_unknown_types():
+    assert json.loads(dumps({'a': [1, 2]})) == {'a': [1, 2]}
+    assert json.loads(dumps({1: 'int key'})) == {'1': 'int key'}
+
+
+def test_lazy_import_defers_loading():
+    sys.modules.pop('colorsys', None)
+    module = lazy_import('colorsys')
+    assert type(module).__name__ == '_LazyModule'
+    assert module.rgb_to_hsv(0, 0, 0) == (0, 0, 0)
+    assert lazy_import('colorsys') is sys.modules['colorsys']
+
+
+def test_lazy_import_loads_once_across_threads(tmp_path, monkeypatch):
+    # Модуль засыпает посередине: второй поток не должен увидеть его недоисполненным
+    (tmp_path / 'slow_lazy_module.py').write_text(
+        'import time\nLOADS = []\nLOADS.append(1)\ntime.sleep(0.2)\nREADY = True\n'
+    )
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.delitem(sys.modules, 'slow_lazy_module', raising=False)
+    module = lazy_import('slow_lazy_module')
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        seen = list(executor.map(lambda _: getattr(module, 'READY', False), range(4)))
+    assert seen == [True] * 4
+    assert module.LOADS == [1]
+
+
+def test_int_param_rejects_invalid_values_with_400():
+    assert int_param({'limit': '5'}, 'limit', 10) == 5
+    assert int_param({}, 'limit', 10) == 10
+    assert int_param({'before_id': ''}, 'before_id') is None
+    for params in ({'limit': 'abc'}, {'limit': '0'}, {'limit': [1]}):
+        try:
+            int_param(params, 'limit', 10, minimum=1)
+        except HttpError as e:
+            assert e.status_code == 400
+        else:
+            raise AssertionError(params)
@@ -0,0 +1,30 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shared.schedule import RETRY_AFTER_FAILURE_SECONDS, ScheduledAction, Scheduler
+
+
+def test_scheduler_runs_due_actions_with_admin_token():
+    calls = []
+    statuses = {'/analytics/maintain_partitions': 200, '/push-notifications/sweep': 500}
+
+    def invoke(path, method, query_string, headers, body):
+        calls.append((path, method, headers['authorization']))
+        return {'statusCode': statuses[path], 'body': ''}
+
+    now = [1000.0]
+    scheduler = Scheduler(invoke, (
+        ScheduledAction('analytics', 'GET', 'maintain_partitions', 3600),
+        ScheduledAction('push-notifications', 'POST', 'sweep', 3600),
+    ), token=lambda: 'token', clock=lambda: now[0])
+
+    assert [status for _, status in scheduler.run_due()] == [200, 500]
+    assert calls[0] == ('/analytics/maintain_partitions', 'GET', 'Bearer token')
+
+    # Неудачное действие повторяется раньше интервала, удачное ждёт полный интервал
+    now[0] += RETRY_AFTER_FAILURE_SECONDS
+    assert [action.action for action, _ in scheduler.run_due()] == ['sweep']
+    now[0] += 3600
+    assert len(scheduler.run_due()) == 2
@@ -0,0 +1,64 @@
+import os
+import sys
+import time
+
+import pytest
+
+jwt = pytest.importorskip('jwt')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shared.tokens import TokenConfigError, TokenError, TokenVerifier, bearer_token, load_secrets, require_admin
+
+OLD_SECRET = 'old-secret-0123456789abcdef0123456789'
+NEW_SECRET = 'new-secret-0123456789abcdef0123456789'
+
+
+def test_verify_caches_until_exp_and_accepts_rotated_secrets():
+    old = TokenVerifier([OLD_SECRET])
+    verifier = TokenVerifier([NEW_SECRET, OLD_SECRET])
+
+    token = old.issue(1, 'admin')
+    assert verifier.verify(token)['username'] == 'admin'
+    assert verifier.verify(token)['user_id'] == 1
+    assert verifier.stats()['hits'] == 1 and verifier.stats()['misses'] == 1
+
+    with pytest.raises(TokenError):
+        TokenVerifier(['other-'+NEW_SECRET]).verify(token)
+
+
+def test_expired_and_revoked_tokens_are_rejected():
+    verifier = TokenVerifier([NEW_SECRET])
+
+    expired = jwt.encode({'user_id': 1, 'exp': int(time.time()) - 10}, NEW_SECRET, algorithm='HS256')
+    with pytest.raises(TokenError, match='expired'):
+        verifier.verify(expired)
+
+    token = verifier.issue(1, 'admin')
+    claims = verifier.verify(token)
+    verifier.revoke(claims['jti'])
+    # Отзыв действует и на уже закэшированный токен
+    with pytest.raises(TokenError, match='revoked'):
+        verifier.verify(token)
+
+    no_exp = jwt.encode({'user_id': 1}, NEW_SECRET, algorithm='HS256')
+    with pytest.raises(TokenError):
+        verifier.verify(no_exp)
+
+
+def test_require_admin_response():
+    assert bearer_token({'Authorization': 'Bearer abc'}) == 'abc'
+    assert bearer_token({'authorization': 'Basic abc'}) is None
+
+    response = require_admin({'headers': {}})
+    assert response['statusCode'] == 401
+
+
+def test_missing_secret_fails_closed(monkeypatch):
+    monkeypatch.delenv('JWT_SECRETS', raising=False)
+    monkeypatch.setenv('JWT_SECRET', ' ')
+    with pytest.raises(TokenConfigError):
+        load_secrets()
+
+    monkeypatch.setenv('JWT_SECRETS', f'{NEW_SECRET}, {OLD_SECRET}')
+    assert load_secrets() == [NEW_SECRET, OLD_SECRET]
@@ -0,0 +1,11 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shared import vendor
+
+
+def test_function_folders_carry_current_copy_of_shared():
+    # Иначе развёрнутая функция работала бы со старой версией общих модулей
+    assert vendor.outdated() == [], 'run: python -m shared.vendor'
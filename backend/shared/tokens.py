@@ -0,0 +1,180 @@
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from shared import metrics
+from shared.runtime import error_response, lazy_import
+
+# PyJWT тянет cryptography; грузится только при первой проверке или выпуске токена
+jwt = lazy_import('jwt')
+
+ALGORITHM = 'HS256'
+TOKEN_LIFETIME = timedelta(hours=24)
+CACHE_MAX_ENTRIES = int(os.environ.get('JWT_CACHE_MAX_ENTRIES', '1024'))
+
+
+class TokenError(Exception):
+    '''Токен отсутствует, подделан, просрочен или отозван'''
+
+
+class TokenConfigError(RuntimeError):
+    '''Не задан секрет подписи: без него токены не выпускаются и не принимаются'''
+
+
+def load_secrets() -> List[str]:
+    '''
+    Секреты через запятую (JWT_SECRETS): первым подписываются новые токены,
+    остальные принимаются до конца ротации. Без секрета — ошибка, а не общеизвестный
+    секрет по умолчанию, которым кто угодно подписал бы себе админский токен
+    '''
+    secrets = [s.strip() for s in os.environ.get('JWT_SECRETS', '').split(',') if s.strip()]
+    if not secrets and os.environ.get('JWT_SECRET', '').strip():
+        secrets = [os.environ['JWT_SECRET'].strip()]
+    if not secrets:
+        raise TokenConfigError('JWT_SECRETS or JWT_SECRET must be set')
+    return secrets
+
+
+def load_revoked_ids() -> List[str]:
+    return [s.strip() for s in os.environ.get('JWT_REVOKED_IDS', '').split(',') if s.strip()]
+
+
+class TokenVerifier:
+    '''
+    Проверка админских JWT без базы. Проверенный токен держится в LRU до своего exp,
+    так что повторные запросы дашборда не платят за декодирование и HMAC.
+    Отзыв — по jti (JWT_REVOKED_IDS, revoke) или всех выданных раньше момента
+    (JWT_REVOKED_BEFORE); отозванное проверяется и для закэшированных токенов.
+    '''
+
+    def __init__(self, secrets: Iterable[str], revoked_ids: Iterable[str] = (),
+                 revoked_before: float = 0, max_entries: int = CACHE_MAX_ENTRIES):
+        self.secrets = list(secrets)
+        self.revoked_ids = set(revoked_ids)
+        self.revoked_before = revoked_before
+        self.max_entries = max_entries
+        self._cache: 'OrderedDict[str, Tuple[float, Dict[str, Any]]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'rejected': 0}
+
+    def _count(self, key: str) -> None:
+        with self._lock:
+            self._stats[key] += 1
+
+    def _decode(self, token: str) -> Dict[str, Any]:
+        for secret in self.secrets:
+            try:
+                return jwt.decode(token, secret, algorithms=[ALGORITHM], options={'require': ['exp']})
+            except jwt.InvalidSignatureError:
+                # Подписан другим секретом из ротации — пробуем следующий
+                continue
+            except jwt.ExpiredSignatureError:
+                raise TokenError('Token expired')
+            except jwt.InvalidTokenError:
+                raise TokenError('Invalid token')
+        raise TokenError('Invalid token')
+
+    def _check_revoked(self, claims: Dict[str, Any]) -> None:
+        if claims.get('jti') in self.revoked_ids:
+            raise TokenError('Token revoked')
+        if self.revoked_before and claims.get('iat', 0) < self.revoked_before:
+            raise TokenError('Token revoked')
+
+    def verify(self, token: str) -> Dict[str, Any]:
+        now = time.time()
+        with self._lock:
+            cached = self._cache.get(token)
+            if cached is not None:
+                if cached[0] > now:
+                    self._cache.move_to_end(token)
+                else:
+                    del self._cache[token]
+                    cached = None
+
+        try:
+            if cached is not None:
+                claims = cached[1]
+                self._check_revoked(claims)
+                self._count('hits')
+                return claims
+
+            self._count('misses')
+            claims = self._decode(token)
+            self._check_revoked(claims)
+        except TokenError:
+            self._count('rejected')
+            raise
+
+        with self._lock:
+            self._cache[token] = (float(claims['exp']), claims)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return claims
+
+    def revoke(self, jti: str) -> None:
+        self.revoked_ids.add(jti)
+
+    def issue(self, user_id: int, username: str) -> str:
+        now = datetime.utcnow()
+        payload = {
+            'user_id': user_id,
+            'username': username,
+            'jti': uuid.uuid4().hex,
+            'exp': now + TOKEN_LIFETIME,
+            'iat': now
+        }
+        return jwt.encode(payload, self.secrets[0], algorithm=ALGORITHM)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['cached'] = len(self._cache)
+        stats.update({'secrets': len(self.secrets), 'revoked_ids': len(self.revoked_ids)})
+        return stats
+
+
+_verifier: Optional[TokenVerifier] = None
+_verifier_lock = threading.Lock()
+
+
+def get_token_verifier() -> TokenVerifier:
+    global _verifier
+    if _verifier is None:
+        with _verifier_lock:
+            if _verifier is None:
+                _verifier = TokenVerifier(
+                    load_secrets(),
+                    load_revoked_ids(),
+                    float(os.environ.get('JWT_REVOKED_BEFORE', '0'))
+                )
+                metrics.register_collector('jwt', _verifier.stats)
+    return _verifier
+
+
+def bearer_token(headers: Dict[str, Any]) -> Optional[str]:
+    headers = {str(name).lower(): value for name, value in (headers or {}).items()}
+    value = headers.get('authorization') or headers.get('x-authorization') or ''
+    scheme, _, token = value.partition(' ')
+    if scheme.lower() != 'bearer' or not token.strip():
+        return None
+    return token.strip()
+
+
+def require_admin(event: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    '''
+    Business: Проверка Bearer-токена админа для защищённых маршрутов
+    Args: event - dict с headers
+    Returns: None, если токен действителен, иначе готовый HTTP response 401
+    '''
+    token = bearer_token(event.get('headers') or {})
+    try:
+        if token is None:
+            raise TokenError('Authorization required')
+        get_token_verifier().verify(token)
+    except TokenError as e:
+        return error_response(401, str(e), {'WWW-Authenticate': 'Bearer'})
+    return None
@@ -0,0 +1,78 @@
+'''
+Облачная платформа разворачивает каждую папку из func2url.json отдельно, и
+backend/shared рядом с развёрнутой функцией не оказывается. Поэтому общие
+модули, нужные обработчикам, лежат копией в <функция>/shared:
+
+    python -m shared.vendor          # обновить копии после правки backend/shared
+    python -m shared.vendor --check  # код 1, если копии устарели
+
+Править нужно оригиналы в backend/shared; test_vendor не даёт копиям разойтись.
+'''
+import argparse
+import os
+import sys
+from typing import Dict, List
+
+from shared.loader import BACKEND_ROOT, list_functions
+
+SHARED_DIR = os.path.join(BACKEND_ROOT, 'shared')
+
+# Только то, что импортируют обработчики; хост, планировщик и загрузчик в функции не нужны
+RUNTIME_MODULES = ('__init__.py', 'db.py', 'metrics.py', 'runtime.py', 'tokens.py')
+
+HEADER = '# Копия backend/shared/{name}, не править: python -m shared.vendor\n'
+
+
+def expected_files() -> Dict[str, str]:
+    '''Путь копии -> ожидаемое содержимое для всех функций'''
+    sources = {}
+    for name in RUNTIME_MODULES:
+        with open(os.path.join(SHARED_DIR, name), encoding='utf-8') as source:
+            sources[name] = HEADER.format(name=name) + source.read()
+
+    files = {}
+    for function_name, index_path in list_functions().items():
+        target_dir = os.path.join(os.path.dirname(index_path), 'shared')
+        for name, content in sources.items():
+            files[os.path.join(target_dir, name)] = content
+    return files
+
+
+def outdated() -> List[str]:
+    '''Копии, которых нет или которые отличаются от оригинала'''
+    stale = []
+    for path, content in expected_files().items():
+        try:
+            with open(path, encoding='utf-8') as current:
+                if current.read() == content:
+                    continue
+        except FileNotFoundError:
+            pass
+        stale.append(path)
+    return stale
+
+
+def sync() -> List[str]:
+    '''Перезаписывает устаревшие копии, возвращает их пути'''
+    files = expected_files()
+    stale = outdated()
+    for path in stale:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as target:
+            target.write(files[path])
+    return stale
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description='Copy backend/shared into every function folder')
+    parser.add_argument('--check', action='store_true', help='only report outdated copies')
+    args = parser.parse_args(argv)
+
+    stale = outdated() if args.check else sync()
+    for path in stale:
+        print(os.path.relpath(path, BACKEND_ROOT))
+    return 1 if args.check and stale else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,41 @@
+-- Почасовые агрегаты для дашборда аналитики, пополняются инкрементально по id
+CREATE TABLE IF NOT EXISTS analytics_hourly_rollup (
+    bucket_start TIMESTAMP WITH TIME ZONE NOT NULL,
+    action_type VARCHAR(100) NOT NULL,
+    page_url TEXT NOT NULL DEFAULT '',
+    browser VARCHAR(20) NOT NULL DEFAULT '',
+    actions BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (bucket_start, action_type, page_url, browser)
+);
+
+-- Уникальные пары сессия/IP по страницам за час: из них считаются точные DISTINCT
+CREATE TABLE IF NOT EXISTS analytics_hourly_visits (
+    bucket_start TIMESTAMP WITH TIME ZONE NOT NULL,
+    session_id VARCHAR(255) NOT NULL,
+    ip_address INET NOT NULL,
+    page_url TEXT NOT NULL DEFAULT '',
+    PRIMARY KEY (bucket_start, session_id, ip_address, page_url)
+);
+
+-- Водяной знак: до какого user_actions.id данные уже сведены в агрегаты
+CREATE TABLE IF NOT EXISTS analytics_rollup_state (
+    name VARCHAR(50) PRIMARY KEY,
+    last_action_id BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT INTO analytics_rollup_state (name, last_action_id)
+VALUES ('hourly', 0)
+ON CONFLICT (name) DO NOTHING;
+
+-- Классификация браузера, та же что в запросе дашборда
+CREATE OR REPLACE FUNCTION analytics_browser(ua TEXT) RETURNS TEXT AS $$
+    SELECT CASE
+        WHEN ua IS NULL THEN ''
+        WHEN ua LIKE '%Chrome%' THEN 'Chrome'
+        WHEN ua LIKE '%Firefox%' THEN 'Firefox'
+        WHEN ua LIKE '%Safari%' AND ua NOT LIKE '%Chrome%' THEN 'Safari'
+        WHEN ua LIKE '%Edge%' THEN 'Edge'
+        ELSE 'Other'
+    END
+$$ LANGUAGE SQL IMMUTABLE;
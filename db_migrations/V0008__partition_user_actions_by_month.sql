@@ -0,0 +1,108 @@
+-- Переводим user_actions на помесячное секционирование по timestamp
+ALTER TABLE user_actions RENAME TO user_actions_unpartitioned;
+
+DROP INDEX IF EXISTS idx_user_actions_timestamp;
+DROP INDEX IF EXISTS idx_user_actions_action_type;
+DROP INDEX IF EXISTS idx_user_actions_session_id;
+DROP INDEX IF EXISTS idx_user_actions_created_at;
+
+UPDATE user_actions_unpartitioned
+SET timestamp = COALESCE(created_at, CURRENT_TIMESTAMP)
+WHERE timestamp IS NULL;
+
+-- Ключ секционирования обязан входить в первичный ключ
+CREATE TABLE user_actions (
+    id INTEGER NOT NULL DEFAULT nextval('user_actions_id_seq'),
+    session_id VARCHAR(255) NOT NULL,
+    user_agent TEXT,
+    ip_address INET,
+    action_type VARCHAR(100) NOT NULL,
+    action_details JSONB,
+    page_url TEXT,
+    referrer TEXT,
+    timestamp TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, timestamp)
+) PARTITION BY RANGE (timestamp);
+
+ALTER SEQUENCE user_actions_id_seq OWNED BY user_actions.id;
+
+-- Оставляем только индекс по времени: по нему работают дашборд и агрегаты,
+-- выборки по id идут через первичный ключ
+CREATE INDEX IF NOT EXISTS idx_user_actions_timestamp ON user_actions(timestamp);
+
+-- Секция за один месяц: user_actions_YYYY_MM
+CREATE OR REPLACE FUNCTION user_actions_create_partition(month_start DATE) RETURNS TEXT AS $$
+DECLARE
+    partition_name TEXT := 'user_actions_' || to_char(month_start, 'YYYY_MM');
+BEGIN
+    EXECUTE format(
+        'CREATE TABLE IF NOT EXISTS %I PARTITION OF user_actions FOR VALUES FROM (%L) TO (%L)',
+        partition_name,
+        date_trunc('month', month_start)::date,
+        (date_trunc('month', month_start) + INTERVAL '1 month')::date
+    );
+    RETURN partition_name;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Создаёт недостающие секции от from_month до текущего месяца + months_ahead
+CREATE OR REPLACE FUNCTION user_actions_ensure_partitions(from_month DATE, months_ahead INTEGER) RETURNS INTEGER AS $$
+DECLARE
+    month_start DATE := date_trunc('month', from_month)::date;
+    last_month DATE := (date_trunc('month', CURRENT_DATE) + make_interval(months => months_ahead))::date;
+    created INTEGER := 0;
+BEGIN
+    WHILE month_start <= last_month LOOP
+        IF to_regclass('user_actions_' || to_char(month_start, 'YYYY_MM')) IS NULL THEN
+            PERFORM user_actions_create_partition(month_start);
+            created := created + 1;
+        END IF;
+        month_start := (month_start + INTERVAL '1 month')::date;
+    END LOOP;
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE SCHEMA IF NOT EXISTS user_actions_archive;
+
+-- Отцепляет секции старше retention_months: удаляет их или переносит в схему архива
+CREATE OR REPLACE FUNCTION user_actions_expire_partitions(retention_months INTEGER, archive BOOLEAN DEFAULT false)
+RETURNS SETOF TEXT AS $$
+DECLARE
+    part RECORD;
+    cutoff DATE := (date_trunc('month', CURRENT_DATE) - make_interval(months => retention_months))::date;
+BEGIN
+    FOR part IN
+        SELECT n.nspname AS schema_name, c.relname AS partition_name
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE i.inhparent = 'user_actions'::regclass
+          AND c.relname ~ '^user_actions_[0-9]{4}_[0-9]{2}$'
+          AND to_date(right(c.relname, 7), 'YYYY_MM') < cutoff
+        ORDER BY c.relname
+    LOOP
+        EXECUTE format('ALTER TABLE user_actions DETACH PARTITION %I.%I', part.schema_name, part.partition_name);
+        IF archive THEN
+            EXECUTE format('ALTER TABLE %I.%I SET SCHEMA user_actions_archive', part.schema_name, part.partition_name);
+        ELSE
+            EXECUTE format('DROP TABLE %I.%I', part.schema_name, part.partition_name);
+        END IF;
+        RETURN NEXT part.partition_name;
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Секции под существующие данные и на три месяца вперёд
+SELECT user_actions_ensure_partitions(
+    COALESCE((SELECT MIN(timestamp) FROM user_actions_unpartitioned)::date, CURRENT_DATE),
+    3
+);
+
+INSERT INTO user_actions
+    (id, session_id, user_agent, ip_address, action_type, action_details, page_url, referrer, timestamp, created_at)
+SELECT id, session_id, user_agent, ip_address, action_type, action_details, page_url, referrer, timestamp, created_at
+FROM user_actions_unpartitioned;
+
+DROP TABLE user_actions_unpartitioned;
@@ -0,0 +1,15 @@
+-- HyperLogLog-скетчи уникальных сессий и посетителей по часам и по дням
+CREATE TABLE IF NOT EXISTS analytics_unique_sketches (
+    granularity VARCHAR(4) NOT NULL,
+    bucket_start TIMESTAMP WITH TIME ZONE NOT NULL,
+    sessions_hll BYTEA NOT NULL,
+    visitors_hll BYTEA NOT NULL,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (granularity, bucket_start),
+    CHECK (granularity IN ('hour', 'day'))
+);
+
+-- Отдельный водяной знак: скетчи догоняют уже сведённые данные постепенно
+INSERT INTO analytics_rollup_state (name, last_action_id)
+VALUES ('sketches', 0)
+ON CONFLICT (name) DO NOTHING;
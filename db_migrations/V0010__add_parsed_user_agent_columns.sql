@@ -0,0 +1,16 @@
+-- Результат разбора user-agent при записи события
+ALTER TABLE user_actions
+    ADD COLUMN IF NOT EXISTS browser VARCHAR(20),
+    ADD COLUMN IF NOT EXISTS browser_major SMALLINT,
+    ADD COLUMN IF NOT EXISTS os VARCHAR(20),
+    ADD COLUMN IF NOT EXISTS device_class VARCHAR(10),
+    ADD COLUMN IF NOT EXISTS is_bot BOOLEAN;
+
+-- Разрезы по ОС и типу устройства в почасовых агрегатах
+ALTER TABLE analytics_hourly_rollup
+    ADD COLUMN IF NOT EXISTS os VARCHAR(20) NOT NULL DEFAULT '',
+    ADD COLUMN IF NOT EXISTS device_class VARCHAR(10) NOT NULL DEFAULT '';
+
+ALTER TABLE analytics_hourly_rollup DROP CONSTRAINT IF EXISTS analytics_hourly_rollup_pkey;
+ALTER TABLE analytics_hourly_rollup
+    ADD PRIMARY KEY (bucket_start, action_type, page_url, browser, os, device_class);
@@ -0,0 +1,23 @@
+-- Очередь доставки push-уведомлений: одна строка на пару уведомление/подписчик
+CREATE TABLE IF NOT EXISTS push_outbox (
+    id BIGSERIAL PRIMARY KEY,
+    notification_id INTEGER NOT NULL REFERENCES push_notifications(id) ON DELETE CASCADE,
+    subscription_id INTEGER NOT NULL REFERENCES push_subscriptions(id) ON DELETE CASCADE,
+    status VARCHAR(16) NOT NULL DEFAULT 'pending',
+    attempts SMALLINT NOT NULL DEFAULT 0,
+    next_attempt_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    expires_at TIMESTAMP WITH TIME ZONE NOT NULL,
+    last_status SMALLINT,
+    last_error TEXT,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE (notification_id, subscription_id),
+    CHECK (status IN ('pending', 'sent', 'failed', 'expired'))
+);
+
+-- Воркеры выбирают только ожидающие задания, готовые к отправке
+CREATE INDEX IF NOT EXISTS idx_push_outbox_pending
+    ON push_outbox (next_attempt_at) WHERE status = 'pending';
+
+-- Время жизни уведомления: после него недоставленные задания истекают
+ALTER TABLE push_notifications ADD COLUMN IF NOT EXISTS ttl INTEGER NOT NULL DEFAULT 86400;
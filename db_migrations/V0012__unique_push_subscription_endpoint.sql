@@ -0,0 +1,13 @@
+-- Повторные подписки с одного endpoint копились дублями: оставляем самую свежую строку
+DELETE FROM push_subscriptions s
+USING push_subscriptions newer
+WHERE s.endpoint = newer.endpoint
+  AND (COALESCE(s.last_used, '-infinity'), s.id) < (COALESCE(newer.last_used, '-infinity'), newer.id);
+
+-- Уникальный endpoint для INSERT ... ON CONFLICT при подписке; прежний обычный индекс не нужен
+CREATE UNIQUE INDEX IF NOT EXISTS idx_push_subscriptions_endpoint_unique ON push_subscriptions (endpoint);
+DROP INDEX IF EXISTS idx_push_subscriptions_endpoint;
+
+-- Очистка устаревших подписок по last_used
+CREATE INDEX IF NOT EXISTS idx_push_subscriptions_last_used
+    ON push_subscriptions (last_used) WHERE is_active = true;
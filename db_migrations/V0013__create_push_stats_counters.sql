@@ -0,0 +1,157 @@
+-- Счётчики push-уведомлений, которые обновляются в той же транзакции, что и данные,
+-- чтобы статистика читалась без COUNT/SUM по таблицам
+CREATE TABLE IF NOT EXISTS push_counters (
+    name VARCHAR(50) PRIMARY KEY,
+    value BIGINT NOT NULL DEFAULT 0
+);
+
+-- Суточные суммы по push_notifications (день по UTC от created_at)
+CREATE TABLE IF NOT EXISTS push_daily_stats (
+    day DATE PRIMARY KEY,
+    notifications INTEGER NOT NULL DEFAULT 0,
+    sent BIGINT NOT NULL DEFAULT 0,
+    success BIGINT NOT NULL DEFAULT 0,
+    -- Сумма и число долей success/sent для прежнего AVG по уведомлениям
+    rate_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+    rate_count INTEGER NOT NULL DEFAULT 0
+);
+
+INSERT INTO push_counters (name, value)
+SELECT 'active_subscriptions', COUNT(*) FROM push_subscriptions WHERE is_active = true
+ON CONFLICT (name) DO UPDATE SET value = EXCLUDED.value;
+
+INSERT INTO push_daily_stats (day, notifications, sent, success, rate_sum, rate_count)
+SELECT
+    (created_at AT TIME ZONE 'UTC')::date,
+    COUNT(*),
+    COALESCE(SUM(sent_count), 0),
+    COALESCE(SUM(success_count), 0),
+    COALESCE(SUM(success_count::float8 / NULLIF(sent_count, 0)), 0),
+    COUNT(*) FILTER (WHERE sent_count > 0)
+FROM push_notifications
+GROUP BY 1
+ON CONFLICT (day) DO NOTHING;
+
+-- Число активных подписок: триггеры уровня оператора, одна правка счётчика на UPDATE пачки
+CREATE OR REPLACE FUNCTION push_subscriptions_count_active() RETURNS trigger AS $$
+DECLARE
+    delta BIGINT := 0;
+BEGIN
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        SELECT delta + COUNT(*) INTO delta FROM new_rows WHERE is_active IS TRUE;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        SELECT delta - COUNT(*) INTO delta FROM old_rows WHERE is_active IS TRUE;
+    END IF;
+    IF delta <> 0 THEN
+        UPDATE push_counters SET value = value + delta WHERE name = 'active_subscriptions';
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS push_subscriptions_count_insert ON push_subscriptions;
+CREATE TRIGGER push_subscriptions_count_insert
+    AFTER INSERT ON push_subscriptions
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION push_subscriptions_count_active();
+
+DROP TRIGGER IF EXISTS push_subscriptions_count_update ON push_subscriptions;
+CREATE TRIGGER push_subscriptions_count_update
+    AFTER UPDATE ON push_subscriptions
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION push_subscriptions_count_active();
+
+DROP TRIGGER IF EXISTS push_subscriptions_count_delete ON push_subscriptions;
+CREATE TRIGGER push_subscriptions_count_delete
+    AFTER DELETE ON push_subscriptions
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION push_subscriptions_count_active();
+
+-- Суточные суммы: вклад новых версий строк минус вклад старых
+CREATE OR REPLACE FUNCTION push_notifications_apply_stats() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO push_daily_stats AS s (day, notifications, sent, success, rate_sum, rate_count)
+        SELECT (created_at AT TIME ZONE 'UTC')::date, COUNT(*),
+               SUM(COALESCE(sent_count, 0)), SUM(COALESCE(success_count, 0)),
+               COALESCE(SUM(success_count::float8 / NULLIF(sent_count, 0)), 0),
+               COUNT(*) FILTER (WHERE sent_count > 0)
+        FROM new_rows
+        GROUP BY 1
+        ORDER BY 1
+        ON CONFLICT (day) DO UPDATE
+        SET notifications = s.notifications + EXCLUDED.notifications,
+            sent = s.sent + EXCLUDED.sent,
+            success = s.success + EXCLUDED.success,
+            rate_sum = s.rate_sum + EXCLUDED.rate_sum,
+            rate_count = s.rate_count + EXCLUDED.rate_count;
+    ELSIF TG_OP = 'UPDATE' THEN
+        -- Старые версии строк вычитаются, новые добавляются
+        INSERT INTO push_daily_stats AS s (day, notifications, sent, success, rate_sum, rate_count)
+        SELECT day, SUM(notifications), SUM(sent), SUM(success), SUM(rate_sum), SUM(rate_count)
+        FROM (
+            SELECT (created_at AT TIME ZONE 'UTC')::date AS day, -1 AS notifications,
+                   -COALESCE(sent_count, 0) AS sent, -COALESCE(success_count, 0) AS success,
+                   -COALESCE(success_count::float8 / NULLIF(sent_count, 0), 0) AS rate_sum,
+                   CASE WHEN sent_count > 0 THEN -1 ELSE 0 END AS rate_count
+            FROM old_rows
+            UNION ALL
+            SELECT (created_at AT TIME ZONE 'UTC')::date, 1,
+                   COALESCE(sent_count, 0), COALESCE(success_count, 0),
+                   COALESCE(success_count::float8 / NULLIF(sent_count, 0), 0),
+                   CASE WHEN sent_count > 0 THEN 1 ELSE 0 END
+            FROM new_rows
+        ) delta
+        GROUP BY day
+        ORDER BY day
+        ON CONFLICT (day) DO UPDATE
+        SET notifications = s.notifications + EXCLUDED.notifications,
+            sent = s.sent + EXCLUDED.sent,
+            success = s.success + EXCLUDED.success,
+            rate_sum = s.rate_sum + EXCLUDED.rate_sum,
+            rate_count = s.rate_count + EXCLUDED.rate_count;
+    ELSE
+        INSERT INTO push_daily_stats AS s (day, notifications, sent, success, rate_sum, rate_count)
+        SELECT day, SUM(notifications), SUM(sent), SUM(success), SUM(rate_sum), SUM(rate_count)
+        FROM (
+            SELECT (created_at AT TIME ZONE 'UTC')::date AS day, -1 AS notifications,
+                   -COALESCE(sent_count, 0) AS sent, -COALESCE(success_count, 0) AS success,
+                   -COALESCE(success_count::float8 / NULLIF(sent_count, 0), 0) AS rate_sum,
+                   CASE WHEN sent_count > 0 THEN -1 ELSE 0 END AS rate_count
+            FROM old_rows
+        ) delta
+        GROUP BY day
+        ORDER BY day
+        ON CONFLICT (day) DO UPDATE
+        SET notifications = s.notifications + EXCLUDED.notifications,
+            sent = s.sent + EXCLUDED.sent,
+            success = s.success + EXCLUDED.success,
+            rate_sum = s.rate_sum + EXCLUDED.rate_sum,
+            rate_count = s.rate_count + EXCLUDED.rate_count;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS push_notifications_stats_insert ON push_notifications;
+CREATE TRIGGER push_notifications_stats_insert
+    AFTER INSERT ON push_notifications
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION push_notifications_apply_stats();
+
+DROP TRIGGER IF EXISTS push_notifications_stats_update ON push_notifications;
+CREATE TRIGGER push_notifications_stats_update
+    AFTER UPDATE ON push_notifications
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION push_notifications_apply_stats();
+
+DROP TRIGGER IF EXISTS push_notifications_stats_delete ON push_notifications;
+CREATE TRIGGER push_notifications_stats_delete
+    AFTER DELETE ON push_notifications
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION push_notifications_apply_stats();
+
+-- Keyset-пагинация истории по (created_at, id)
+CREATE INDEX IF NOT EXISTS idx_push_notifications_created_id ON push_notifications (created_at, id);
+DROP INDEX IF EXISTS idx_push_notifications_created_at;
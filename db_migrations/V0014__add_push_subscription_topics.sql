@@ -0,0 +1,9 @@
+-- Темы (сегменты) подписчика: рассылка может адресоваться только подписанным на тему
+ALTER TABLE push_subscriptions ADD COLUMN IF NOT EXISTS topics TEXT[] NOT NULL DEFAULT '{}';
+
+-- Поиск подписчиков по пересечению тем (topics && ARRAY[...]) среди активных
+CREATE INDEX IF NOT EXISTS idx_push_subscriptions_topics
+    ON push_subscriptions USING GIN (topics) WHERE is_active = true;
+
+-- Темы, на которые была адресована рассылка; пустой массив — всем подписчикам
+ALTER TABLE push_notifications ADD COLUMN IF NOT EXISTS topics TEXT[] NOT NULL DEFAULT '{}';
@@ -0,0 +1,10 @@
+-- Счётчики неудачных входов по окнам для троттлинга между экземплярами функции auth.
+-- UNLOGGED: данные краткоживущие, потеря при сбое базы допустима, а запись дешевле
+CREATE UNLOGGED TABLE IF NOT EXISTS auth_throttle (
+    key VARCHAR(300) NOT NULL,
+    window_id BIGINT NOT NULL,
+    failures INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (key, window_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_auth_throttle_window ON auth_throttle (window_id);
@@ -0,0 +1,22 @@
+-- Постоянная равномерная выборка посещений для дашборда за длинные периоды:
+-- каждый 20-й посетитель (по хэшу IP) со всеми своими сессиями.
+-- Делитель совпадает с sampling.SAMPLE_MODULUS
+CREATE TABLE IF NOT EXISTS analytics_visit_sample (
+    bucket_start TIMESTAMP WITH TIME ZONE NOT NULL,
+    session_id VARCHAR(255) NOT NULL,
+    ip_address INET NOT NULL,
+    page_url TEXT NOT NULL DEFAULT '',
+    PRIMARY KEY (bucket_start, session_id, ip_address, page_url)
+);
+
+-- Начальное заполнение из уже сведённых почасовых посещений
+INSERT INTO analytics_visit_sample (bucket_start, session_id, ip_address, page_url)
+SELECT bucket_start, session_id, ip_address, page_url
+FROM analytics_hourly_visits
+WHERE abs(hashtext(host(ip_address))::bigint) % 20 = 0
+ON CONFLICT DO NOTHING;
+
+-- Дальше выборка пополняется с того же водяного знака, что и агрегаты
+INSERT INTO analytics_rollup_state (name, last_action_id)
+SELECT 'visit_sample', last_action_id FROM analytics_rollup_state WHERE name = 'hourly'
+ON CONFLICT (name) DO NOTHING;
@@ -0,0 +1,52 @@
+-- Скетчи начинались с водяного знака 0 и догоняли историю порциями, а всё
+-- несведённое дашборд дочитывал из сырых строк. Здесь они собираются сразу
+-- из почасовых посещений, одним set-based запросом, как выборка в V0016.
+-- Формат 2 (hll.FORMAT_VERSION): хэш — первые 64 бита md5, точность 12,
+-- регистры без сжатия. Скетчи формата 1 несовместимы и пересобираются заново
+TRUNCATE analytics_unique_sketches;
+
+WITH visits AS (
+    SELECT DISTINCT bucket_start, session_id, host(ip_address) AS ip_address
+    FROM analytics_hourly_visits
+),
+hashed AS (
+    SELECT g.granularity,
+           CASE g.granularity WHEN 'hour' THEN v.bucket_start ELSE date_trunc('day', v.bucket_start) END AS bucket_start,
+           k.kind,
+           ('x' || substr(md5(CASE k.kind WHEN 'sessions' THEN v.session_id ELSE v.ip_address END), 1, 16))::bit(64) AS hash
+    FROM visits v
+    CROSS JOIN (VALUES ('hour'), ('day')) AS g(granularity)
+    CROSS JOIN (VALUES ('sessions'), ('visitors')) AS k(kind)
+),
+registers AS (
+    -- Регистр — старшие 12 бит хэша, ранг — позиция первой единицы в остальных 52
+    SELECT granularity, bucket_start, kind,
+           substring(hash FROM 1 FOR 12)::bit(12)::int AS register,
+           MAX(COALESCE(NULLIF(position(B'1' IN substring(hash FROM 13)), 0), 53)) AS rank
+    FROM hashed
+    GROUP BY 1, 2, 3, 4
+),
+sketches AS (
+    SELECT s.granularity, s.bucket_start, s.kind,
+           decode('020c', 'hex') || decode(
+               string_agg(lpad(to_hex(COALESCE(r.rank, 0)), 2, '0'), '' ORDER BY n.register), 'hex'
+           ) AS hll
+    FROM (SELECT DISTINCT granularity, bucket_start, kind FROM registers) s
+    CROSS JOIN generate_series(0, 4095) AS n(register)
+    LEFT JOIN registers r
+        ON r.granularity = s.granularity AND r.bucket_start = s.bucket_start
+       AND r.kind = s.kind AND r.register = n.register
+    GROUP BY 1, 2, 3
+)
+INSERT INTO analytics_unique_sketches (granularity, bucket_start, sessions_hll, visitors_hll)
+SELECT granularity, bucket_start,
+       (array_agg(hll) FILTER (WHERE kind = 'sessions'))[1],
+       (array_agg(hll) FILTER (WHERE kind = 'visitors'))[1]
+FROM sketches
+GROUP BY granularity, bucket_start;
+
+-- Дальше скетчи пополняются с того же водяного знака, что и агрегаты
+UPDATE analytics_rollup_state s
+SET last_action_id = h.last_action_id, updated_at = CURRENT_TIMESTAMP
+FROM analytics_rollup_state h
+WHERE s.name = 'sketches' AND h.name = 'hourly';
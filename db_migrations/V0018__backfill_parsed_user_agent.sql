@@ -0,0 +1,82 @@
+-- Разбор user-agent для строк, записанных до V0010: без него старые часы дашборда
+-- показывали браузеры по LIKE-классификации analytics_browser, а новые — по
+-- ua_parser, и таксономии смешивались. Функции повторяют ua_parser.py
+-- (порядок шаблонов, обрезка до 512 символов); менять только вместе с ним.
+-- В регулярных выражениях PostgreSQL граница слова — \y, а не \b
+CREATE OR REPLACE FUNCTION analytics_ua_is_bot(ua TEXT) RETURNS BOOLEAN AS $$
+    SELECT left(COALESCE(ua, ''), 512) ~* (
+        'bot\y|bot/|crawl|spider|slurp|bingpreview|mediapartners|facebookexternalhit|'
+        'headless|lighthouse|pingdom|uptime|curl/|wget/|python-requests|python-urllib|'
+        'httpclient|okhttp|java/|go-http-client|scrapy|phantomjs|yandex(?:bot|images|metrika)'
+    )
+$$ LANGUAGE SQL IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION analytics_ua_browser(ua TEXT, OUT browser TEXT, OUT browser_major SMALLINT) AS $$
+    SELECT COALESCE(m.name, 'Other'),
+           CASE WHEN length(m.major) BETWEEN 1 AND 5 AND m.major::int <= 32767 THEN m.major::smallint END
+    FROM (SELECT 1) one
+    LEFT JOIN LATERAL (
+        SELECT p.name, (regexp_match(left(COALESCE(ua, ''), 512), p.pattern))[1] AS major
+        FROM (VALUES
+            (1, 'Edge', '(?:Edg|Edge|EdgA|EdgiOS)/(\d+)'),
+            (2, 'Opera', '(?:OPR|Opera)/(\d+)'),
+            (3, 'Yandex', 'YaBrowser/(\d+)'),
+            (4, 'Samsung', 'SamsungBrowser/(\d+)'),
+            (5, 'Firefox', '(?:Firefox|FxiOS)/(\d+)'),
+            (6, 'Chrome', '(?:Chrome|CriOS)/(\d+)'),
+            (7, 'Safari', 'Version/(\d+).*Safari/'),
+            (8, 'Safari', 'Safari/()')
+        ) AS p(priority, name, pattern)
+        WHERE left(COALESCE(ua, ''), 512) ~ p.pattern
+        ORDER BY p.priority
+        LIMIT 1
+    ) m ON TRUE
+$$ LANGUAGE SQL IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION analytics_ua_os(ua TEXT) RETURNS TEXT AS $$
+    SELECT CASE
+        WHEN v ~ 'Windows' THEN 'Windows'
+        WHEN v ~ 'Android' THEN 'Android'
+        WHEN v ~ 'iPhone|iPad|iPod' THEN 'iOS'
+        WHEN v ~ 'CrOS' THEN 'ChromeOS'
+        WHEN v ~ 'Macintosh|Mac OS X' THEN 'macOS'
+        WHEN v ~ 'Linux' THEN 'Linux'
+        ELSE 'Other'
+    END
+    FROM (SELECT left(COALESCE(ua, ''), 512) AS v) s
+$$ LANGUAGE SQL IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION analytics_ua_device_class(ua TEXT) RETURNS TEXT AS $$
+    SELECT CASE
+        WHEN analytics_ua_is_bot(v) THEN 'bot'
+        WHEN v ~ 'iPad|Tablet|Android(?!.*Mobile)' THEN 'tablet'
+        WHEN v ~ 'Mobi|iPhone|iPod|Android.*Mobile|Windows Phone' THEN 'mobile'
+        WHEN v <> '' THEN 'desktop'
+        ELSE 'other'
+    END
+    FROM (SELECT left(COALESCE(ua, ''), 512) AS v) s
+$$ LANGUAGE SQL IMMUTABLE;
+
+-- Агрегаты не пересобираются параллельно с refresh_rollups
+SELECT pg_advisory_xact_lock(hashtext('analytics_hourly_rollup'));
+
+UPDATE user_actions
+SET (browser, browser_major) = (SELECT b.browser, b.browser_major FROM analytics_ua_browser(user_agent) b),
+    os = analytics_ua_os(user_agent),
+    device_class = analytics_ua_device_class(user_agent),
+    is_bot = analytics_ua_is_bot(user_agent)
+WHERE browser IS NULL;
+
+-- Часы, сырые события которых ещё хранятся, пересобираются уже по разобранным полям.
+-- Более старые агрегаты (после удаления секций по сроку хранения) остаются как были
+DELETE FROM analytics_hourly_rollup
+WHERE bucket_start >= (SELECT date_trunc('hour', MIN(timestamp)) FROM user_actions);
+
+INSERT INTO analytics_hourly_rollup (bucket_start, action_type, page_url, browser, os, device_class, actions)
+SELECT date_trunc('hour', timestamp), action_type, COALESCE(page_url, ''),
+       COALESCE(browser, analytics_browser(user_agent)),
+       COALESCE(os, ''), COALESCE(device_class, ''), COUNT(*)
+FROM user_actions
+WHERE id <= (SELECT last_action_id FROM analytics_rollup_state WHERE name = 'hourly')
+  AND timestamp IS NOT NULL
+GROUP BY 1, 2, 3, 4, 5, 6;
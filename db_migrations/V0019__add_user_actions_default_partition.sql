@@ -0,0 +1,31 @@
+-- Секция по умолчанию: если обслуживание секций не запускалось дольше горизонта
+-- PARTITION_MONTHS_AHEAD, события пишутся сюда, а не падают с ошибкой
+CREATE TABLE IF NOT EXISTS user_actions_default PARTITION OF user_actions DEFAULT;
+
+-- Месячная секция теперь создаётся отдельно и подключается ATTACH: строки её
+-- месяца, успевшие попасть в секцию по умолчанию, сначала переносятся в неё
+CREATE OR REPLACE FUNCTION user_actions_create_partition(month_start DATE) RETURNS TEXT AS $$
+DECLARE
+    partition_name TEXT := 'user_actions_' || to_char(month_start, 'YYYY_MM');
+    range_start DATE := date_trunc('month', month_start)::date;
+    range_end DATE := (date_trunc('month', month_start) + INTERVAL '1 month')::date;
+BEGIN
+    IF to_regclass(partition_name) IS NOT NULL THEN
+        RETURN partition_name;
+    END IF;
+
+    EXECUTE format('CREATE TABLE %I (LIKE user_actions INCLUDING DEFAULTS INCLUDING CONSTRAINTS)', partition_name);
+    EXECUTE format(
+        'WITH moved AS (
+             DELETE FROM user_actions_default WHERE timestamp >= %L AND timestamp < %L RETURNING *
+         )
+         INSERT INTO %I SELECT * FROM moved',
+        range_start, range_end, partition_name
+    );
+    EXECUTE format(
+        'ALTER TABLE user_actions ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+        partition_name, range_start, range_end
+    );
+    RETURN partition_name;
+END;
+$$ LANGUAGE plpgsql;
@@ -2,6 +2,8 @@ import { useEffect } from 'react';
 
 interface AnalyticsEvent {
   session_id: string;
+  // Уникален для каждого события: по нему сервер отличает повторную отправку от нового события
+  event_id: string;
   action_type: string;
   action_details?: Record<string, any>;
   page_url?: string;
@@ -20,23 +22,69 @@ const getSessionId = (): string => {
   return sessionId;
 };
 
+const generateEventId = (): string => `${Date.now()}_${Math.random().toString(36).substr(2, 9)}`;
+
+// Параметры пакетной отправки: копим события и отправляем одним запросом
+const BATCH_MAX_EVENTS = 20;
+const BATCH_FLUSH_DELAY_MS = 2000;
+
+let eventQueue: AnalyticsEvent[] = [];
+let flushTimer: ReturnType<typeof setTimeout> | null = null;
+
+// Отправка накопленных событий одним запросом
+const flushEvents = async (keepalive = false) => {
+  if (flushTimer) {
+    clearTimeout(flushTimer);
+    flushTimer = null;
+  }
+  if (eventQueue.length === 0) {
+    return;
+  }
+
+  const events = eventQueue;
+  eventQueue = [];
+
+  try {
+    await fetch(ANALYTICS_ENDPOINT, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+      },
+      body: JSON.stringify({ events }),
+      keepalive,
+    });
+  } catch (error) {
+    console.error('Analytics tracking failed:', error);
+  }
+};
+
+// При уходе со страницы отправляем остаток очереди
+if (typeof window !== 'undefined') {
+  window.addEventListener('pagehide', () => {
+    flushEvents(true);
+  });
+}
+
 // Функция для отправки события
-const trackEvent = async (event: Omit<AnalyticsEvent, 'session_id'>) => {
+const trackEvent = async (event: Omit<AnalyticsEvent, 'session_id' | 'event_id'>) => {
   try {
     const analyticsEvent: AnalyticsEvent = {
       session_id: getSessionId(),
+      event_id: generateEventId(),
       page_url: window.location.href,
       referrer: document.referrer,
       ...event,
     };
 
-    await fetch(ANALYTICS_ENDPOINT, {
-      method: 'POST',
-      headers: {
-        'Content-Type': 'application/json',
-      },
-      body: JSON.stringify(analyticsEvent),
-    });
+    eventQueue.push(analyticsEvent);
+
+    if (eventQueue.length >= BATCH_MAX_EVENTS) {
+      await flushEvents();
+    } else if (!flushTimer) {
+      flushTimer = setTimeout(() => {
+        flushEvents();
+      }, BATCH_FLUSH_DELAY_MS);
+    }
   } catch (error) {
     console.error('Analytics tracking failed:', error);
   }
@@ -68,6 +116,7 @@ export const usePageTracking = () => {
           path: window.location.pathname,
         },
       });
+      flushEvents(true);
     };
 
     window.addEventListener('beforeunload', handleBeforeUnload);
@@ -134,6 +183,7 @@ export const useScrollTracking = () => {
             path: window.location.pathname,
           },
         });
+        flushEvents(true);
       }
     };
 
@@ -190,4 +240,5 @@ export default {
   useScrollTracking,
   useFormTracking,
   trackEvent,
+  flushEvents,
 };
\ No newline at end of file
@@ -46,9 +46,16 @@ export default function AdminDashboard() {
     setIsLoading(true);
     try {
       const response = await fetch(
-        `https://functions.poehali.dev/90baacc3-9672-4e72-8453-a68fc83256e2?days=${period}`
+        `https://functions.poehali.dev/90baacc3-9672-4e72-8453-a68fc83256e2?days=${period}`,
+        { headers: { 'Authorization': `Bearer ${localStorage.getItem('admin_token')}` } }
       );
 
+      if (response.status === 401) {
+        localStorage.removeItem('admin_token');
+        navigate('/admin/login');
+        return;
+      }
+
       if (response.ok) {
         const data = await response.json();
         console.log('Analytics data loaded:', data);